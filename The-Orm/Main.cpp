@@ -72,7 +72,18 @@ public:
     //==============================================================================
     void initialise (const String& commandLine) override
     {
-		ignoreUnused(commandLine);
+		if (commandLine.contains("--run-tests")) {
+			// Only run the unit tests that need neither settings nor a synth, e.g. for continuous integration
+			UnitTestRunner runner;
+			runner.runTestsInCategory("KnobKraft");
+			int failures = 0;
+			for (int i = 0; i < runner.getNumResults(); i++) {
+				failures += runner.getResult(i)->failures;
+			}
+			setApplicationReturnValue(failures > 0 ? 1 : 0);
+			quit();
+			return;
+		}
 
 		// This method is where you should put your application's initialization code...
 		auto applicationDataDirName = "KnobKraftOrm";
@@ -168,6 +179,11 @@ public:
 
     void shutdown() override
     {
+		if (!mainWindow) {
+			// Started with --run-tests, nothing was initialized
+			return;
+		}
+
 		// Unregister
 		UIModel::instance()->windowTitle_.removeChangeListener(this);
 
@@ -13,6 +13,7 @@
 
 #include <pybind11/embed.h>
 #include <boost/format.hpp>
+#include <set>
 
 namespace py = pybind11;
 using namespace pybind11::literals;
@@ -23,40 +24,67 @@ std::vector<midikraft::PatchHolder> ScriptedQuery::filterByPredicate(std::string
 		return input;
 	}
 
+	std::vector<bool> matches;
+	if (!evaluatePredicate(pythonPredicate, input, matches)) {
+		return input;
+	}
+
 	std::vector<midikraft::PatchHolder> result;
+	for (size_t i = 0; i < input.size(); i++) {
+		if (matches[i]) {
+			result.push_back(input[i]);
+		}
+	}
+	return result;
+}
 
-	for (const auto& patch : input) {
-		// Make sure that we have a PyTschirp object with the name of the synth
-		std::string pythonClassName = findPyTschirpModuleForSynth(patch.synth()->getName());
+bool ScriptedQuery::evaluatePredicate(std::string const &pythonPredicate, std::vector<midikraft::PatchHolder> const &input, std::vector<bool> &outMatches) const
+{
+	outMatches.clear();
+	outMatches.reserve(input.size());
 
-		// Run some python code!
+	py::gil_scoped_acquire acquire;
+	try {
+		// Compile the expression only once, and evaluate it in a single namespace where only the patch p changes
 		auto pytschirpee = py::module::import("pytschirpee");
+		auto builtins = py::module::import("builtins");
+		auto code = builtins.attr("compile")(pythonPredicate, "<scripted query>", "eval");
 
-		// Create the patch in question using the PyTschirpPatch class
-		PyTschirp pythonPatch(patch.patch(), patch.smartSynth());
+		// Make sure that we have a PyTschirp object with the name of each synth, before taking the snapshot of the namespace
+		std::set<std::string> synthsSeen;
+		for (const auto& patch : input) {
+			auto synthName = patch.synth()->getName();
+			if (synthsSeen.insert(synthName).second) {
+				findPyTschirpModuleForSynth(synthName);
+			}
+		}
+		py::dict ns = pytschirpee.attr("__dict__").attr("copy")();
+		// Python 3.8 does not add the builtins to a globals dict passed to PyEval_EvalCode, so len() or any() would fail
+		ns["__builtins__"] = builtins;
 
-		// Define the object to operate on
-		py::object obj = py::cast(pythonPatch);
-		auto locals = py::dict("p"_a = obj, **pytschirpee.attr("__dict__"));
+		for (const auto& patch : input) {
+			// Create the patch in question using the PyTschirpPatch class
+			PyTschirp pythonPatch(patch.patch(), patch.smartSynth());
+			ns["p"] = py::cast(pythonPatch);
 
-		// Run the query
-		try {
-			auto queryResult = py::eval(pythonPredicate, py::globals(), locals);
+			// Run the query
+			auto queryResult = py::reinterpret_steal<py::object>(PyEval_EvalCode(code.ptr(), ns.ptr(), ns.ptr()));
+			if (!queryResult) {
+				throw py::error_already_set();
+			}
 			if (py::isinstance<py::bool_>(queryResult)) {
-				if (py::bool_(queryResult)) {
-					result.push_back(patch);
-				}
+				outMatches.push_back(queryResult.cast<bool>());
 			}
 			else {
 				// Abort with an error message
-				SimpleLogger::instance()->postMessage("Error with scripted query - expression did not return True or False but " + py::str(queryResult));
-				return input;
+				SimpleLogger::instance()->postMessage("Error with scripted query - expression did not return True or False but " + py::str(queryResult).cast<std::string>());
+				return false;
 			}
 		}
-		catch (py::error_already_set &e) {
-			SimpleLogger::instance()->postMessage((boost::format("Error with scripted query: %s") % e.what()).str());
-			return input;
-		}
+		return true;
+	}
+	catch (py::error_already_set &e) {
+		SimpleLogger::instance()->postMessage((boost::format("Error with scripted query: %s") % e.what()).str());
+		return false;
 	}
-	return result;
 }
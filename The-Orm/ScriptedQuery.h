@@ -11,5 +11,9 @@
 class ScriptedQuery {
 public:
 	std::vector<midikraft::PatchHolder> filterByPredicate(std::string const &pythonPredicate, std::vector<midikraft::PatchHolder> const &input) const;
+
+	// Batched evaluation - the predicate is compiled once, and the whole list is evaluated with a single acquisition of the GIL.
+	// Returns false if the predicate could not be evaluated for all patches, in that case the error has been logged
+	bool evaluatePredicate(std::string const &pythonPredicate, std::vector<midikraft::PatchHolder> const &input, std::vector<bool> &outMatches) const;
 };
 
@@ -31,6 +31,10 @@ def channelIfValidDeviceResponse(message):
     return -1
 
 
+def identityReplySignature():
+    return [[0x00, 0x00, 0x0e, 0x1d, 0x00, 0x00, 0x00]]
+
+
 def numberOfBanks():
     return 16
 
@@ -141,6 +145,12 @@ def isBankDumpFinished(messages):
     return count == numberOfPatchesPerBank()
 
 
+def bankDumpProgress(state, message):
+    # Same as isBankDumpFinished, but called once for each message received, with the count carried along as state
+    count = (state or 0) + (1 if isPartOfBankDump(message) else 0)
+    return count, count == numberOfPatchesPerBank()
+
+
 def extractPatchesFromBank(message):
     if isSingleProgramDump(message):
         return message
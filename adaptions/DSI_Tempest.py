@@ -58,6 +58,10 @@ def channelIfValidDeviceResponse(message):
     return -1
 
 
+def identityReplySignature():
+    return [[0x01, tempest["device_id"]]]
+
+
 def createEditBufferRequest(channel):
     # Modern style
     return [0xf0, 0x01, tempest["device_id"], 0b00000110, 0xf7]
@@ -6,6 +6,14 @@
 
 import hashlib
 
+_program_size = 204
+_low_nibble_table = bytes(x & 0x0f for x in range(256))
+_high_nibble_table = bytes((x & 0x0f) << 4 for x in range(256))
+_shift_down_table = bytes(x >> 4 for x in range(256))
+_odd_characters = {  # The ESQ-1 has some peculiar non-ASCII characters, safely approximated thus:
+    95: "v", 33: "0.", 35: "1.", 37: "2.", 40: "3.", 41: "4.", 58: "5.", 59: "6.", 91: "7.", 92: "8.", 93: "9."
+}
+
 
 def name():
     return "Ensoniq ESQ-1"
@@ -66,6 +74,11 @@ def channelIfValidDeviceResponse(message):
     return -1
 
 
+def identityReplySignature():
+    # ENSONIQ, ESQ Product Family. The family members ESQ-1, ESQ-M and SQ-80 all share this adaptation
+    return [[0x0f, 0x02, 0x00]]
+
+
 def createEditBufferRequest(channel):
     # See ESQ-1 Musician's Manual appendix p A-9 for Current Program Dump Request.
     return [0xf0, 0x0f, 0x02, channel, 0x09, 0xf7]
@@ -117,25 +130,43 @@ def isBankDumpFinished(messages):
     return False
 
 
+def bankDumpProgress(state, message):
+    finished = bool(state) or isPartOfBankDump(message)
+    return finished, finished
+
+
 def extractPatchesFromBank(message):
     # A bank dump consists of 8166 bytes: 5 in the header, 8160 (in 40 programs of 204), 1 in the footer.
     # Why is 'patch' mixed up with 'program' here?
     if isPartOfBankDump(message):
         channel = message[2]
-        data = message[5:-1]
-        # After removing the sysex header and footer we are left with 40 programs of 204 bytes each
-        data_pointer = 0
         result = []
-        while data_pointer + 203 < len(data):
-            # Read one more patch
-            next_patch = data[data_pointer:data_pointer + 204]
-            next_program_dump = [0xf0, 0x0f, 0x02, channel, 0x01] + next_patch + [0xf7]
+        for program in programRecords(message):
+            next_program_dump = [0xf0, 0x0f, 0x02, channel, 0x01]
+            next_program_dump.extend(program)
+            next_program_dump.append(0xf7)
             print("Found patch " + nameFromDump(next_program_dump))
-            result += next_program_dump
-            data_pointer += 204
+            result.extend(next_program_dump)
         return result
 
 
+def programRecords(message):
+    # After removing the sysex header and footer we are left with 40 programs of 204 bytes each. The records
+    # returned are views into the message, so nothing is copied until the caller needs it
+    data = memoryview(bytes(message))[5:-1]
+    for data_pointer in range(0, len(data) - _program_size + 1, _program_size):
+        yield data[data_pointer:data_pointer + _program_size]
+
+
+def programRecordsInFile(messages):
+    # Archives like Radzic-ESQ1.syx can contain any number of single and all-program dumps concatenated
+    for message in messages:
+        if isPartOfBankDump(message):
+            yield from programRecords(message)
+        elif isEditBufferDump(message):
+            yield memoryview(bytes(message))[5:-1]
+
+
 def numberOfBanks():
     # The ESQ-1 may be fitted with a program cartridge adding 2 more banks of 40. Assume it is not fitted.
     # In any case, only the Internal bank of 40 is available via sysex.
@@ -150,17 +181,11 @@ def nameFromDump(message):
     # The 6 characters of the name are encoded immediately after the header, in 2 bytes per character.
     name = ''
     if len(message) > 17:  # 5 bytes of sysex header plus 12 bytes for name
-        oddchrs = {  # The ESQ-1 has some peculiar non-ASCII characters, safely approximated thus:
-            95: "v", 33: "0.", 35: "1.", 37: "2.", 40: "3.", 41: "4.", 58: "5.", 59: "6.", 91: "7.", 92: "8.", 93: "9."
-        }
-        i = 0
-        while i < 12:
-            code = message[i + 5] + message[i + 6] * 16  # decode little endian hex
-            if code in oddchrs:
-                name += oddchrs[code]  # lookup peculiar character(s), otherwise...
+        for code in denibble(message[5:17]):
+            if code in _odd_characters:
+                name += _odd_characters[code]  # lookup peculiar character(s), otherwise...
             else:
                 name += chr(code)  # ...use ordinary ASCII
-            i += 2
     return name
 
 
@@ -172,8 +197,35 @@ def convertToEditBuffer(channel, message):
 
 def calculateFingerprint(message):
     # ignore 5 bytes of sysex header, 12 bytes of name, and last byte (sysex footer)
-    data = message[17:-1]
-    return hashlib.md5(bytearray(data)).hexdigest()  # Calculate the fingerprint from sound values
+    md5 = hashlib.md5()
+    md5.update(memoryview(bytes(message))[17:-1])
+    return md5.hexdigest()  # Calculate the fingerprint from sound values
+
+
+def soundDataFingerprint(messages):
+    # Feed the denibbled sound data of all programs found into one hash, e.g. to compare whole archives
+    md5 = hashlib.md5()
+    for program in programRecordsInFile(messages):
+        md5.update(denibble(program[12:]))
+    return md5.hexdigest()
+
+
+def denibble(data):
+    # All ESQ-1 data is transmitted as nibbles, low nibble first. Decode all of them at once using big integer arithmetic
+    # instead of a Python loop per byte
+    data = bytes(data)
+    low_nibbles = data[0::2].translate(_low_nibble_table)
+    high_nibbles = data[1::2].translate(_high_nibble_table)
+    length = len(high_nibbles)
+    return (int.from_bytes(low_nibbles[:length], "big") | int.from_bytes(high_nibbles, "big")).to_bytes(length, "big")
+
+
+def nibble(data):
+    data = bytes(data)
+    result = bytearray(2 * len(data))
+    result[0::2] = data.translate(_low_nibble_table)
+    result[1::2] = data.translate(_shift_down_table)
+    return result
 
 
 def friendlyBankName(bank_number):
@@ -185,4 +237,5 @@ def test_data():
     def programs(messages):
         yield {"message": messages[0], "name": "RADZIC"}
 
-    return {"sysex": "testData/Radzic-ESQ1.syx", "program_generator": programs}
+    # The Radzic program followed by two all-program dumps
+    return {"sysex": "testData/ESQ1-archive.syx", "program_generator": programs}
@@ -19,6 +19,7 @@
 #include "GenericBankDumpCapability.h"
 #include "GenericHasBanksCapability.h"
 #include "GenericHasBankDescriptorsCapability.h"
+#include "MidiSendScheduler.h"
 
 #include <pybind11/stl.h>
 #include <memory>
@@ -54,6 +55,7 @@ namespace knobkraft {
 		*kCreateBankDumpRequest = "createBankDumpRequest",
 		*kIsPartOfBankDump = "isPartOfBankDump",
 		*kIsBankDumpFinished = "isBankDumpFinished",
+		*kBankDumpProgress = "bankDumpProgress",
 		*kExtractPatchesFromBank = "extractPatchesFromBank",
 		*kNumberOfLayers = "numberOfLayers",
 		*kLayerName = "layerName",
@@ -63,7 +65,9 @@ namespace knobkraft {
 		*kFriendlyBankName = "friendlyBankName",
 		*kFriendlyProgramName = "friendlyProgramName",
 		*kSetupHelp = "setupHelp",
-		*kGetStoredTags = "storedTags";
+		*kGetStoredTags = "storedTags",
+		*kWireBytesPerSecond = "wireBytesPerSecond",
+		*kReceiveBufferSize = "receiveBufferSize";
 
 	std::vector<const char *> kAdapatationPythonFunctionNames = {
 		kName,
@@ -89,6 +93,7 @@ namespace knobkraft {
 		kCreateBankDumpRequest,
 		kIsPartOfBankDump,
 		kIsBankDumpFinished,
+		kBankDumpProgress,
 		kExtractPatchesFromBank,
 		kNumberOfLayers,
 		kLayerName,
@@ -98,7 +103,9 @@ namespace knobkraft {
 		kFriendlyBankName,
 		kFriendlyProgramName,
 		kSetupHelp,
-		kGetStoredTags
+		kGetStoredTags,
+		kWireBytesPerSecond,
+		kReceiveBufferSize
 	};
 
 	std::vector<const char *> kMinimalRequiredFunctionNames = {
@@ -112,9 +119,24 @@ namespace knobkraft {
 	std::unique_ptr<py::scoped_interpreter> sGenericAdaptationPythonEmbeddedGuard;
 	std::unique_ptr<py::gil_scoped_release> sGenericAdaptationDontLockGIL;
 	std::unique_ptr<PyStdErrOutStreamRedirect> sGenericAdaptationPyOutputRedirect;
+	std::unique_ptr<PyBufferedOutputSink> sGenericAdaptationPyOutputSink;
+	std::unique_ptr<MidiSendScheduler> sGenericAdaptationSendScheduler;
 
 	void checkForPythonOutputAndLog() {
-		sGenericAdaptationPyOutputRedirect->flushToLogger("Adaptation");
+		// Only needed where output should show up immediately, e.g. after loading a module. Output of regular calls is picked up by the timer of the output sink
+		if (sGenericAdaptationPyOutputSink) {
+			sGenericAdaptationPyOutputSink->drainToLogger("Adaptation");
+		}
+		else {
+			sGenericAdaptationPyOutputRedirect->flushToLogger("Adaptation");
+		}
+	}
+
+	void checkForPythonOutputAfterCall() {
+		// The buffered output sink is drained by its timer. Without it, only the simple redirect is in place, and that needs to be checked after each call
+		if (!sGenericAdaptationPyOutputSink && sGenericAdaptationPyOutputRedirect) {
+			sGenericAdaptationPyOutputRedirect->flushToLogger("Adaptation");
+		}
 	}
 
 	class FatalAdaptationException : public std::runtime_error {
@@ -143,6 +165,7 @@ namespace knobkraft {
 			}
 			adaptation_module = py::module::import(filepath_.c_str());
 			checkForPythonOutputAndLog();
+			resolveFunctionTable();
 			adaptationName_ = getName(); //TODO - shouldn't call a virtual method here!
 		}
 		catch (py::error_already_set &ex) {
@@ -163,6 +186,114 @@ namespace knobkraft {
 		programDumpCapabilityImpl_ = std::make_shared<GenericProgramDumpCapability>(this);
 		bankDumpCapabilityImpl_ = std::make_shared<GenericBankDumpCapability>(this);
 		adaptation_module = adaptationModule;		
+		resolveFunctionTable();
+	}
+
+	GenericAdaptation::GenericAdaptation(std::string const &pythonModuleName, std::string const &sourceFilePath, std::string const &name, std::set<std::string> const &functionNames
+		, std::map<std::string, int> const &manifestProperties)
+		: filepath_(pythonModuleName), adaptationName_(name), sourceFilePath_(sourceFilePath)
+		, availableFunctions_(std::make_shared<const std::set<std::string>>(functionNames)), manifestProperties_(manifestProperties)
+	{
+		editBufferCapabilityImpl_ = std::make_shared<GenericEditBufferCapability>(this);
+		programDumpCapabilityImpl_ = std::make_shared<GenericProgramDumpCapability>(this);
+		bankDumpCapabilityImpl_ = std::make_shared<GenericBankDumpCapability>(this);
+		hasBanksCapabilityImpl_ = std::make_shared<GenericHasBanksCapability>(this);
+		hasBankDescriptorsCapabilityImpl_ = std::make_shared<GenericHasBankDescriptorsCapability>(this);
+	}
+
+	GenericAdaptation::~GenericAdaptation()
+	{
+		if (Py_IsInitialized()) {
+			// Drop our references to the functions and the module while holding the GIL, the destructor of py::object doesn't acquire it
+			py::gil_scoped_acquire acquire;
+			functionTable_.clear();
+			adaptation_module = py::module();
+		}
+		else {
+			// The Python interpreter is already shut down, touching the Python objects now would crash
+			for (auto &function : functionTable_) {
+				function.second.release();
+			}
+			functionTable_.clear();
+			adaptation_module.release();
+		}
+	}
+
+	bool GenericAdaptation::ensureLoaded() const
+	{
+		if (adaptation_module) {
+			return true;
+		}
+		if (sourceFilePath_.empty()) {
+			return false;
+		}
+		py::gil_scoped_acquire acquire;
+		if (adaptation_module) {
+			// Another thread was faster
+			return true;
+		}
+		if (loadFailed_) {
+			return false;
+		}
+		try {
+			auto knobkraft = py::module::import("knobkraft");
+			adaptation_module = knobkraft.attr("import_adaptation")(sourceFilePath_).cast<py::module>();
+			checkForPythonOutputAndLog();
+			resolveFunctionTable();
+			return true;
+		}
+		catch (py::error_already_set &ex) {
+			SimpleLogger::instance()->postMessage((boost::format("Adaptation: Failure loading python module %s: %s") % sourceFilePath_ % ex.what()).str());
+			ex.restore();
+		}
+		catch (std::exception &ex) {
+			SimpleLogger::instance()->postMessage((boost::format("Adaptation: Failure loading python module %s: %s") % sourceFilePath_ % ex.what()).str());
+		}
+		loadFailed_ = true;
+		resolveFunctionTable();
+		return false;
+	}
+
+	void GenericAdaptation::resolveFunctionTable() const
+	{
+		py::gil_scoped_acquire acquire;
+		std::map<std::string, py::object> table;
+		auto available = std::make_shared<std::set<std::string>>();
+		if (adaptation_module) {
+			for (auto functionName : kAdapatationPythonFunctionNames) {
+				if (py::hasattr(adaptation_module, functionName)) {
+					table[functionName] = adaptation_module.attr(functionName);
+					available->insert(functionName);
+				}
+			}
+			try {
+				// The patch grid asks for names on every redraw, so use memoizing wrappers of the name functions
+				auto knobkraft = py::module::import("knobkraft");
+				auto memoized = knobkraft.attr("memoize_names")(adaptation_module).cast<py::dict>();
+				for (auto item : memoized) {
+					table[item.first.cast<std::string>()] = py::reinterpret_borrow<py::object>(item.second);
+				}
+			}
+			catch (std::exception &ex) {
+				// The error is not restored, the adaptation works fine with the original functions
+				SimpleLogger::instance()->postMessage((boost::format("Adaptation: Cannot memoize name functions, calling them directly: %s") % ex.what()).str());
+			}
+		}
+		functionTable_.swap(table);
+		std::atomic_store(&availableFunctions_, std::shared_ptr<const std::set<std::string>>(available));
+	}
+
+	pybind11::object GenericAdaptation::adaptationFunction(std::string const &functionName) const
+	{
+		if (!ensureLoaded()) {
+			return py::none();
+		}
+		py::gil_scoped_acquire acquire;
+		auto function = functionTable_.find(functionName);
+		if (function != functionTable_.end()) {
+			return function->second;
+		}
+		return py::none();
 	}
 
 	std::shared_ptr<GenericAdaptation> GenericAdaptation::fromBinaryCode(std::string moduleName, std::string adaptationCode)
@@ -246,6 +377,7 @@ namespace knobkraft {
 		}
 #endif
 		sGenericAdaptationPythonEmbeddedGuard = std::make_unique<py::scoped_interpreter>();
+		sGenericAdaptationSendScheduler = std::make_unique<MidiSendScheduler>();
 		sGenericAdaptationPyOutputRedirect = std::make_unique<PyStdErrOutStreamRedirect>();
         File pathToTheOrm = File::getSpecialLocation (File::SpecialLocationType::currentExecutableFile).getParentDirectory();
         std::cout << pathToTheOrm.getFullPathName().toStdString() << std::endl;
@@ -254,6 +386,8 @@ namespace knobkraft {
 				+ "sys.path.append(R\"" + pathToTheOrm.getChildFile("adaptations").getFullPathName().toStdString() + "\")\n" // This is where we place the adpatation modules
 				+ "sys.path.append(R\"" + pathToTheOrm.getChildFile("python").getFullPathName().toStdString() + "\")\n"; // This is the path in the Mac DMG
 		py::exec(command);
+		// The install directory might not be writable, so keep the compiled bytecode of the adaptations in the user's data directory
+		py::exec("import sys\nsys.pycache_prefix = R\"" + bytecodeCacheDirectory().getChildFile("pycache").getFullPathName().toStdString() + "\"\n");
 #ifdef __APPLE__
 		// For Apple (probably for Linux as well?) we need to append the path "python" to the python sys path, so it will find 
 		// python code we are installing, e.g. the generic sequential module which is used by all Sequential synths
@@ -262,6 +396,13 @@ namespace knobkraft {
 		py::exec(command);
 #endif
 		checkForPythonOutputAndLog();
+		try {
+			sGenericAdaptationPyOutputSink = std::make_unique<PyBufferedOutputSink>(py::module::import("knobkraft"), 250);
+		}
+		catch (py::error_already_set &ex) {
+			// Stay with the simple redirect, which needs to be checked after each call
+			SimpleLogger::instance()->postMessage((boost::format("Adaptation: Failure installing buffered output: %s") % ex.what()).str());
+		}
 		sGenericAdaptationDontLockGIL = std::make_unique<py::gil_scoped_release>();
 		// From this point on, whenever you want to call into python you need to acquire the GIL 
 		// with:
@@ -273,6 +414,8 @@ namespace knobkraft {
 	{
 		// Remove the global release on Python, else the destruction code will fail!
 		sGenericAdaptationDontLockGIL.reset();
+		sGenericAdaptationPyOutputSink.reset();
+		sGenericAdaptationSendScheduler.reset();
 	}
 
 	bool GenericAdaptation::hasPython()
@@ -324,11 +467,49 @@ else {
 		return false;
 	}
 
+	juce::File GenericAdaptation::adaptationManifestFile()
+	{
+		auto knobkraftorm = File::getSpecialLocation(File::userApplicationDataDirectory).getChildFile("KnobKraftOrm");
+		if (!knobkraftorm.exists()) {
+			knobkraftorm.createDirectory();
+		}
+		return knobkraftorm.getChildFile("adaptation_manifest.json");
+	}
+
+	juce::File GenericAdaptation::bytecodeCacheDirectory()
+	{
+		return adaptationManifestFile().getParentDirectory().getChildFile("bytecode");
+	}
+
 	std::vector<std::shared_ptr<GenericAdaptation>> GenericAdaptation::allAdaptationsInOneDirectory(std::string const& directory)
 	{
 		std::vector<std::shared_ptr<GenericAdaptation>> result;
 		File adaptationDirectory(directory);
 		if (adaptationDirectory.exists() && adaptationDirectory.isDirectory()) {
+			// The manifest knows name and functions of all unchanged adaptations, so only new or modified modules need to be imported now
+			py::gil_scoped_acquire acquire;
+			try {
+				auto knobkraft = py::module::import("knobkraft");
+				auto entries = knobkraft.attr("adaptation_manifest")(directory, adaptationManifestFile().getFullPathName().toStdString()).cast<std::vector<py::dict>>();
+				checkForPythonOutputAndLog();
+				for (auto const &entry : entries) {
+					std::map<std::string, int> properties;
+					for (auto property : entry["properties"].cast<py::dict>()) {
+						properties[property.first.cast<std::string>()] = property.second.cast<int>();
+					}
+					result.push_back(std::make_shared<GenericAdaptation>(entry["module"].cast<std::string>(), entry["path"].cast<std::string>()
+						, entry["name"].cast<std::string>(), entry["functions"].cast<std::set<std::string>>(), properties));
+				}
+				return result;
+			}
+			catch (py::error_already_set &ex) {
+				SimpleLogger::instance()->postMessage((boost::format("Adaptation: Failure reading adaptation manifest, loading all modules: %s") % ex.what()).str());
+				ex.restore();
+			}
+			catch (std::exception &ex) {
+				SimpleLogger::instance()->postMessage((boost::format("Adaptation: Failure reading adaptation manifest, loading all modules: %s") % ex.what()).str());
+			}
+			result.clear();
 			for (auto f : adaptationDirectory.findChildFiles(File::findFiles, false, "*.py")) {
 				try {
 					if (!f.getFileName().startsWith("test_") && f.getFileName() != "conftest.py") {
@@ -437,11 +618,8 @@ else {
 
 
 	bool GenericAdaptation::pythonModuleHasFunction(std::string const &functionName) const {
-		py::gil_scoped_acquire acquire;
-		if (!adaptation_module) {
-			return false;
-		}
-		return py::hasattr(*adaptation_module, functionName.c_str());
+		auto functions = std::atomic_load(&availableFunctions_);
+		return functions && functions->find(functionName) != functions->end();
 	}
 
 	bool GenericAdaptation::isFromFile() const
@@ -451,6 +629,9 @@ else {
 
 	std::string GenericAdaptation::getSourceFilePath() const
 	{
+		if (!sourceFilePath_.empty()) {
+			return sourceFilePath_;
+		}
 		py::gil_scoped_acquire acquire;
 		return adaptation_module.attr("__file__").cast<std::string>();
 	}
@@ -458,8 +639,15 @@ else {
 	void GenericAdaptation::reloadPython()
 	{
 		py::gil_scoped_acquire acquire;
+		if (!adaptation_module) {
+			// Never imported, so there is nothing old to reload
+			loadFailed_ = false;
+			ensureLoaded();
+			return;
+		}
 		try {
 			adaptation_module.reload();
+			resolveFunctionTable();
 			logNamespace();
 		}
 		catch (py::error_already_set &ex) {
@@ -475,7 +663,7 @@ else {
 	{
 		py::gil_scoped_acquire acquire;
 		ignoreUnused(place);
-		auto patch = std::make_shared<GenericPatch>(this, const_cast<py::module &>(adaptation_module), data, GenericPatch::PROGRAM_DUMP);
+		auto patch = std::make_shared<GenericPatch>(this, data, GenericPatch::PROGRAM_DUMP);
 		return patch;
 	}
 
@@ -488,27 +676,50 @@ else {
 		return false;
 	}
 
-	void GenericAdaptation::sendBlockOfMessagesToSynth(std::string const& midiOutput, std::vector<MidiMessage> const& buffer)
+	bool GenericAdaptation::manifestProperty(const char *functionName, int &outValue) const
+	{
+		if (adaptation_module) {
+			return false;
+		}
+		auto found = manifestProperties_.find(functionName);
+		if (found == manifestProperties_.end()) {
+			return false;
+		}
+		outValue = found->second;
+		return true;
+	}
+
+	bool GenericAdaptation::midiPacing(MidiPacing &outPacing) const
 	{
 		py::gil_scoped_acquire acquire;
-		if (pythonModuleHasFunction(kGeneralMessageDelay)) {
-			try {
-				auto result = callMethod(kGeneralMessageDelay);
-				int delay = py::cast<int>(result);
-				// Be a bit careful with this device, do specify a delay when sending messages
-				midikraft::MidiController::instance()->getMidiOutput(midiOutput)->sendBlockOfMessagesThrottled(buffer, delay);
+		try {
+			if (pythonModuleHasFunction(kGeneralMessageDelay)) {
+				outPacing.minimumGapMilliseconds = py::cast<int>(callMethod(kGeneralMessageDelay));
 			}
-			catch (py::error_already_set &ex) {
-				logAdaptationError(kGeneralMessageDelay, ex);
-				ex.restore();
+			if (pythonModuleHasFunction(kWireBytesPerSecond)) {
+				outPacing.bytesPerSecond = py::cast<int>(callMethod(kWireBytesPerSecond));
 			}
-			catch (std::exception &ex) {
-				logAdaptationError(kGeneralMessageDelay, ex);
+			if (pythonModuleHasFunction(kReceiveBufferSize)) {
+				outPacing.receiveBufferSize = py::cast<int>(callMethod(kReceiveBufferSize));
 			}
+			return true;
 		}
-		else {
-			// No special behavior - just send at full speed
-			midikraft::MidiController::instance()->getMidiOutput(midiOutput)->sendBlockOfMessagesFullSpeed(buffer);
+		catch (py::error_already_set &ex) {
+			logAdaptationError("midi pacing", ex);
+			ex.restore();
+		}
+		catch (std::exception &ex) {
+			logAdaptationError("midi pacing", ex);
+		}
+		return false;
+	}
+
+	void GenericAdaptation::sendBlockOfMessagesToSynth(std::string const& midiOutput, std::vector<MidiMessage> const& buffer)
+	{
+		// Only hold the GIL to ask the adaptation, sending to a slow synth can take a while
+		MidiPacing pacing;
+		if (midiPacing(pacing)) {
+			sGenericAdaptationSendScheduler->send(midiOutput, buffer, pacing);
 		}
 	}
 
@@ -574,6 +785,10 @@ else {
 
 	int GenericAdaptation::deviceDetectSleepMS()
 	{
+		int recorded;
+		if (manifestProperty(kDeviceDetectWaitMilliseconds, recorded)) {
+			return recorded;
+		}
 		py::gil_scoped_acquire acquire;
 		if (!pythonModuleHasFunction(kDeviceDetectWaitMilliseconds)) {
 			return 200;
@@ -620,6 +835,10 @@ else {
 
 	bool GenericAdaptation::needsChannelSpecificDetection()
 	{
+		int recorded;
+		if (manifestProperty(kNeedsChannelSpecificDetection, recorded)) {
+			return recorded != 0;
+		}
 		py::gil_scoped_acquire acquire;
 		if (!pythonModuleHasFunction(kNeedsChannelSpecificDetection)) {
 			return true;
@@ -641,6 +860,10 @@ else {
 
 	std::string GenericAdaptation::getName() const
 	{
+		if (!adaptation_module && !adaptationName_.empty()) {
+			// Lazy adaptation not yet imported, use the name recorded in the manifest
+			return adaptationName_;
+		}
 		py::gil_scoped_acquire acquire;
 		try {
 			py::object result = callMethod(kName);
@@ -720,7 +943,6 @@ else {
 
 	bool GenericAdaptation::hasCapability(midikraft::EditBufferCapability** outCapability) const
 	{
-		py::gil_scoped_acquire acquire;
 		if (pythonModuleHasFunction(kIsEditBufferDump)
 			&& pythonModuleHasFunction(kCreateEditBufferRequest)
 			&& pythonModuleHasFunction(kConvertToEditBuffer)) {
@@ -742,7 +964,6 @@ else {
 
 	bool GenericAdaptation::hasCapability(midikraft::ProgramDumpCabability  **outCapability) const
 	{
-		py::gil_scoped_acquire acquire;
 		if (pythonModuleHasFunction(kIsSingleProgramDump)
 			&& pythonModuleHasFunction(kCreateProgramDumpRequest)
 			&& pythonModuleHasFunction(kConvertToProgramDump)) {
@@ -764,7 +985,6 @@ else {
 
 	bool GenericAdaptation::hasCapability(midikraft::BankDumpCapability  **outCapability) const
 	{
-		py::gil_scoped_acquire acquire;
 		if (pythonModuleHasFunction(kCreateBankDumpRequest)
 			&& pythonModuleHasFunction(kExtractPatchesFromBank)
 			&& pythonModuleHasFunction(kIsPartOfBankDump)
@@ -787,7 +1007,6 @@ else {
 
 	bool GenericAdaptation::hasCapability(midikraft::HasBanksCapability** outCapability) const
 	{
-		py::gil_scoped_acquire acquire;
 		if (pythonModuleHasFunction(kNumberOfBanks)
 			&& pythonModuleHasFunction(kNumberOfPatchesPerBank))
 		{
@@ -809,7 +1028,6 @@ else {
 
 	bool GenericAdaptation::hasCapability(midikraft::HasBankDescriptorsCapability** outCapability) const
 	{
-		py::gil_scoped_acquire acquire;
 		if (pythonModuleHasFunction(kBankDescriptors))
 		{
 			*outCapability = dynamic_cast<midikraft::HasBankDescriptorsCapability*>(hasBankDescriptorsCapabilityImpl_.get());
@@ -14,9 +14,12 @@
 #include "EditBufferCapability.h"
 #include "ProgramDumpCapability.h"
 #include "BankDumpCapability.h"
+#include "MidiSendScheduler.h"
 
 #include <pybind11/embed.h>
 #include <boost/format.hpp>
+#include <map>
+#include <set>
 
 namespace knobkraft {
 
@@ -27,12 +30,13 @@ namespace knobkraft {
 	class GenericHasBanksCapability;
 	class GenericHasBankDescriptorsCapability;
 	void checkForPythonOutputAndLog();
+	void checkForPythonOutputAfterCall();
 
 	extern const char *kIsEditBufferDump, *kIsPartOfEditBufferDump, *kCreateEditBufferRequest, *kConvertToEditBuffer,
 		*kNumberOfBanks, * kNumberOfPatchesPerBank, * kBankDescriptors, * kFriendlyBankName,
 		*kNameFromDump, *kRenamePatch, *kIsDefaultName,
 		*kIsSingleProgramDump, *kIsPartOfSingleProgramDump, *kCreateProgramDumpRequest, *kConvertToProgramDump, *kNumberFromDump,
-		*kCreateBankDumpRequest, *kIsPartOfBankDump, *kIsBankDumpFinished, *kExtractPatchesFromBank,
+		*kCreateBankDumpRequest, *kIsPartOfBankDump, *kIsBankDumpFinished, *kBankDumpProgress, *kExtractPatchesFromBank,
 		*kNumberOfLayers,
 		*kLayerName,
 		*kSetLayerName,
@@ -54,7 +58,11 @@ namespace knobkraft {
 	public:
 		GenericAdaptation(std::string const &pythonModuleFilePath);
 		GenericAdaptation(pybind11::module adaptation_module);
+		// Lazy adaptation, created from the adaptation manifest. The module is only imported when it is first used
+		GenericAdaptation(std::string const &pythonModuleName, std::string const &sourceFilePath, std::string const &name, std::set<std::string> const &functionNames
+			, std::map<std::string, int> const &manifestProperties);
 		static std::shared_ptr<GenericAdaptation> fromBinaryCode(std::string moduleName, std::string adaptationCode);
+		virtual ~GenericAdaptation();
 
 		// This needs to be implemented, and never changed, as the result is used as a primary key in the database to store the patches
 		std::string getName() const override;
@@ -79,6 +87,9 @@ namespace knobkraft {
 
 		// Internal workings of the Generic Adaptation module
 		bool pythonModuleHasFunction(std::string const &functionName) const;
+		// The resolved function of the adaptation, or none if not implemented. Use the result only while holding the GIL
+		pybind11::object adaptationFunction(std::string const &functionName) const;
+		bool ensureLoaded() const;
 		bool isFromFile() const;
 		std::string getSourceFilePath() const;
 		void reloadPython();
@@ -117,6 +128,12 @@ namespace knobkraft {
 		virtual bool hasCapability(std::shared_ptr<midikraft::HasBankDescriptorsCapability>& outCapability) const override;
 		virtual bool hasCapability(midikraft::HasBankDescriptorsCapability** outCapability) const override;
 
+		// Results of constant functions like numberOfBanks, recorded in the adaptation manifest. Only used as long as the module is not imported
+		bool manifestProperty(const char *functionName, int &outValue) const;
+
+		// How to pace sending messages to the synth, from the optional functions generalMessageDelay, wireBytesPerSecond and receiveBufferSize
+		bool midiPacing(MidiPacing &outPacing) const;
+
 		// Common error logging
 		void logAdaptationError(const char *methodName, std::exception &e) const;
 
@@ -138,13 +155,14 @@ namespace knobkraft {
 
 		template <typename ... Args> pybind11::object callMethod(std::string const &methodName, Args& ... args) const
 		{
-			if (!adaptation_module) {
+			if (!ensureLoaded()) {
 				return pybind11::none();
 			}
 			pybind11::gil_scoped_acquire acquire;
-			if (pybind11::hasattr(*adaptation_module, methodName.c_str())) {
-				auto result = adaptation_module.attr(methodName.c_str())(args...);
-				checkForPythonOutputAndLog();
+			auto function = adaptationFunction(methodName);
+			if (!function.is_none()) {
+				auto result = function(args...);
+				checkForPythonOutputAfterCall();
 				return result;
 			}
 			else {
@@ -155,11 +173,25 @@ namespace knobkraft {
 
 		// Helper function for adding the built-in adaptations
 		static bool createCompiledAdaptationModule(std::string const &pythonModuleName, std::string const &adaptationCode, std::vector<std::shared_ptr<midikraft::SimpleDiscoverableDevice>> &outAddToThis);
+		static File adaptationManifestFile();
+		static File bytecodeCacheDirectory();
 		void logNamespace();
+		void resolveFunctionTable() const;
 
-		pybind11::module adaptation_module;
+		mutable pybind11::module adaptation_module;
 		std::string filepath_;
 		std::string adaptationName_;
+
+		// Only set for lazy adaptations
+		std::string sourceFilePath_;
+		mutable bool loadFailed_ = false;
+
+		// The adaptation functions are looked up once after loading, not on every call. The table is guarded by the GIL, 
+		// while the set of names can be read without it, so capability queries don't need to enter Python at all.
+		// Before a lazy adaptation is imported, the names come from the adaptation manifest
+		mutable std::map<std::string, pybind11::object> functionTable_;
+		mutable std::shared_ptr<const std::set<std::string>> availableFunctions_;
+		std::map<std::string, int> manifestProperties_;
 	};
 
 }
@@ -17,6 +17,19 @@ namespace py = pybind11;
 
 namespace knobkraft {
 
+	GenericBankDumpCapability::~GenericBankDumpCapability()
+	{
+		if (Py_IsInitialized()) {
+			// Drop our reference to the state object while holding the GIL, the destructor of py::object doesn't acquire it
+			py::gil_scoped_acquire acquire;
+			progressState_ = py::object();
+		}
+		else {
+			// The Python interpreter is already shut down, touching the state object now would crash
+			progressState_.release();
+		}
+	}
+
 	std::vector<juce::MidiMessage> GenericBankDumpCapability::requestBankDump(MidiBankNumber bankNo) const
 	{
 		py::gil_scoped_acquire acquire;
@@ -58,6 +71,9 @@ namespace knobkraft {
 	bool GenericBankDumpCapability::isBankDumpFinished(std::vector<MidiMessage> const &bankDump) const
 	{
 		py::gil_scoped_acquire acquire;
+		if (me_->pythonModuleHasFunction(kBankDumpProgress)) {
+			return isBankDumpFinishedIncremental(bankDump);
+		}
 		try {
 			std::vector<std::vector<int>> vector;
 			for (auto message : bankDump) {
@@ -76,6 +92,42 @@ namespace knobkraft {
 		return false;
 	}
 
+	bool GenericBankDumpCapability::isBankDumpFinishedIncremental(std::vector<MidiMessage> const& bankDump) const
+	{
+		// We get called with the list of all messages received so far, so only the new ones need to go into the adaptation. 
+		// Start over when this is obviously a new bank dump
+		if (progressFinished_ || bankDump.size() < progressMessagesSeen_ || bankDump.empty()
+			|| progressFirstMessage_ != std::vector<uint8>(bankDump[0].getRawData(), bankDump[0].getRawData() + bankDump[0].getRawDataSize())) {
+			progressState_ = py::none();
+			progressMessagesSeen_ = 0;
+			progressFinished_ = false;
+			progressFirstMessage_.clear();
+			if (!bankDump.empty()) {
+				progressFirstMessage_.assign(bankDump[0].getRawData(), bankDump[0].getRawData() + bankDump[0].getRawDataSize());
+			}
+		}
+		try {
+			for (size_t i = progressMessagesSeen_; i < bankDump.size(); i++) {
+				auto vector = me_->messageToVector(bankDump[i]);
+				py::tuple result = me_->callMethod(kBankDumpProgress, progressState_, vector);
+				progressState_ = result[0];
+				progressFinished_ = result[1].cast<bool>();
+				progressMessagesSeen_ = i + 1;
+			}
+			return progressFinished_;
+		}
+		catch (py::error_already_set &ex) {
+			me_->logAdaptationError(kBankDumpProgress, ex);
+			ex.restore();
+		}
+		catch (std::exception &ex) {
+			me_->logAdaptationError(kBankDumpProgress, ex);
+		}
+		// Make sure we start over with the next call
+		progressFinished_ = true;
+		return false;
+	}
+
 	midikraft::TPatchVector GenericBankDumpCapability::patchesFromSysexBank(const MidiMessage& message) const
 	{
 		py::gil_scoped_acquire acquire;
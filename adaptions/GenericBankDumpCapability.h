@@ -15,6 +15,7 @@ namespace knobkraft {
 	class GenericBankDumpCapability : public midikraft::BankDumpCapability {
 	public:
 		GenericBankDumpCapability(GenericAdaptation *me) : me_(me) {}
+		virtual ~GenericBankDumpCapability();
 
 		std::vector<MidiMessage> requestBankDump(MidiBankNumber bankNo) const override;
 		bool isBankDump(const MidiMessage& message) const override;
@@ -22,7 +23,15 @@ namespace knobkraft {
 		midikraft::TPatchVector patchesFromSysexBank(const MidiMessage& message) const override;
 
 	private:
+		bool isBankDumpFinishedIncremental(std::vector<MidiMessage> const& bankDump) const;
+
 		GenericAdaptation *me_;
+
+		// State of the optional bankDumpProgress protocol, so we need to pass each message only once into Python
+		mutable pybind11::object progressState_;
+		mutable std::vector<uint8> progressFirstMessage_;
+		mutable size_t progressMessagesSeen_ = 0;
+		mutable bool progressFinished_ = false;
 	};
 
 }
@@ -92,7 +92,7 @@ namespace knobkraft {
 		for (auto const& m : message) {
 			std::copy(m.getRawData(), m.getRawData() + m.getRawDataSize(), std::back_inserter(data));
 		}
-		return std::make_shared<GenericPatch>(me_, const_cast<py::module &>(me_->adaptation_module), data, GenericPatch::EDIT_BUFFER);
+		return std::make_shared<GenericPatch>(me_, data, GenericPatch::EDIT_BUFFER);
 	}
 
 	std::vector<juce::MidiMessage> GenericEditBufferCapability::patchToSysex(std::shared_ptr<midikraft::DataFile> patch) const
@@ -16,6 +16,10 @@ namespace knobkraft {
 
 	int GenericHasBanksCapability::numberOfBanks() const
 	{
+		int recorded;
+		if (me_->manifestProperty(kNumberOfBanks, recorded)) {
+			return recorded;
+		}
 		py::gil_scoped_acquire acquire;
 		try {
 			py::object result = me_->callMethod(kNumberOfBanks);
@@ -33,6 +37,10 @@ namespace knobkraft {
 
 	int GenericHasBanksCapability::numberOfPatches() const
 	{
+		int recorded;
+		if (me_->manifestProperty(kNumberOfPatchesPerBank, recorded)) {
+			return recorded;
+		}
 		py::gil_scoped_acquire acquire;
 		try {
 			py::object result = me_->callMethod(kNumberOfPatchesPerBank);
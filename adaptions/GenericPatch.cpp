@@ -17,17 +17,13 @@ namespace py = pybind11;
 
 namespace knobkraft {
 
-	GenericPatch::GenericPatch(GenericAdaptation const *me, pybind11::module &adaptation_module, midikraft::Synth::PatchData const &data, DataType dataType) : midikraft::DataFile(dataType, data), me_(me), adaptation_(adaptation_module)
+	GenericPatch::GenericPatch(GenericAdaptation const *me, midikraft::Synth::PatchData const &data, DataType dataType) : midikraft::DataFile(dataType, data), me_(me)
 	{
 	}
 
 	bool GenericPatch::pythonModuleHasFunction(std::string const &functionName) const
 	{
-		py::gil_scoped_acquire acquire;
-		if (!adaptation_) {
-			return false;
-		}
-		return py::hasattr(*adaptation_, functionName.c_str());
+		return me_->pythonModuleHasFunction(functionName);
 	}
 
 	std::string GenericPatch::name() const
@@ -35,8 +31,8 @@ namespace knobkraft {
 		py::gil_scoped_acquire acquire;
 		try {
 			std::vector<int> v(data().data(), data().data() + data().size());
-			auto result = adaptation_.attr(kNameFromDump)(v);
-			checkForPythonOutputAndLog();
+			auto result = me_->adaptationFunction(kNameFromDump)(v);
+			checkForPythonOutputAfterCall();
 			return result.cast<std::string>();
 		}
 		catch (py::error_already_set &ex) {
@@ -80,20 +80,18 @@ namespace knobkraft {
 			EDIT_BUFFER
 		};
 
-		GenericPatch(GenericAdaptation const *me, pybind11::module &adaptation_module, midikraft::Synth::PatchData const &data, DataType dataType);
+		GenericPatch(GenericAdaptation const *me, midikraft::Synth::PatchData const &data, DataType dataType);
 
 		bool pythonModuleHasFunction(std::string const &functionName) const;
 
 		template <typename ... Args>
 		pybind11::object callMethod(std::string const &methodName, Args& ... args) const {
 			pybind11::gil_scoped_acquire acquire;
-			if (!adaptation_) {
-				return pybind11::none();
-			}
-			if (pybind11::hasattr(*adaptation_, methodName.c_str())) {
+			auto function = me_->adaptationFunction(methodName);
+			if (!function.is_none()) {
 				try {
-					auto result = adaptation_.attr(methodName.c_str())(args...);
-					checkForPythonOutputAndLog();
+					auto result = function(args...);
+					checkForPythonOutputAfterCall();
 					return result;
 				}
 				catch (pybind11::error_already_set &ex) {
@@ -137,7 +135,6 @@ namespace knobkraft {
 		std::shared_ptr<GenericStoredTagCapability> genericStoredTagCapabilityImpl_;
 
 		GenericAdaptation const *me_;
-		pybind11::module &adaptation_;
 	};
 
 
@@ -38,6 +38,11 @@ def channelIfValidDeviceResponse(message):
     return -1
 
 
+def identityReplySignature():
+    # Oberheim, Matrix family, member Matrix 1000
+    return [[0x10, 0x06, 0x00, 0x02, 0x00]]
+
+
 def createEditBufferRequest(channel):
     return [0xf0, 0x10, 0x06, 0x04, 4, 0, 0xf7]
 
@@ -0,0 +1,158 @@
+/*
+   Copyright (c) 2022 Christof Ruch. All rights reserved.
+
+   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+*/
+
+#include "MidiSendScheduler.h"
+
+#include "MidiController.h"
+
+namespace knobkraft {
+
+	MidiSendScheduler::MidiSendScheduler() : juce::Thread("MidiSendScheduler")
+	{
+		startThread();
+	}
+
+	MidiSendScheduler::~MidiSendScheduler()
+	{
+		signalThreadShouldExit();
+		wakeUp_.signal();
+		stopThread(1000);
+		// Don't leave anybody waiting for blocks that will never be sent
+		ScopedLock lock(lock_);
+		for (auto const &job : jobs_) {
+			job.sent->signal();
+		}
+		jobs_.clear();
+	}
+
+	void MidiSendScheduler::send(std::string const &midiOutput, std::vector<MidiMessage> const &messages, MidiPacing const &pacing)
+	{
+		// Every block goes through the queue, also unpaced ones and those from background threads, else they could be sent
+		// while an earlier block is still being sent
+		auto sent = std::make_shared<juce::WaitableEvent>();
+		{
+			ScopedLock lock(lock_);
+			jobs_.push_back({ midiOutput, messages, pacing, sent });
+		}
+		wakeUp_.signal();
+		if (!MessageManager::getInstance()->isThisTheMessageThread()) {
+			// Already in a background thread, the caller might depend on the messages being sent when we return
+			sent->wait();
+		}
+	}
+
+	std::vector<double> MidiSendScheduler::sendTimes(std::vector<MidiMessage> const &messages, MidiPacing const &pacing)
+	{
+		// The synth's receive buffer is modelled as a leaky bucket, filled by each message sent and drained at the wire rate.
+		// A message is sent as soon as it fits into the buffer, and at least the minimum gap after the previous message
+		std::vector<double> result;
+		double now = 0.0;
+		double fill = 0.0;
+		for (size_t i = 0; i < messages.size(); i++) {
+			double size = messages[i].getRawDataSize();
+			if (i > 0) {
+				double earliest = now + pacing.minimumGapMilliseconds;
+				if (pacing.bytesPerSecond > 0) {
+					double msPerByte = 1000.0 / pacing.bytesPerSecond;
+					// A message larger than the buffer can only be sent once the buffer is empty
+					double capacity = std::max((double)pacing.receiveBufferSize, size);
+					double mustDrain = std::max(0.0, fill + size - capacity);
+					earliest = std::max(earliest, now + mustDrain * msPerByte);
+					fill = std::max(0.0, fill - (earliest - now) / msPerByte);
+				}
+				now = earliest;
+			}
+			fill += size;
+			result.push_back(now);
+		}
+		return result;
+	}
+
+	void MidiSendScheduler::sendPaced(std::string const &midiOutput, std::vector<MidiMessage> const &messages, MidiPacing const &pacing)
+	{
+		auto output = midikraft::MidiController::instance()->getMidiOutput(midiOutput);
+		if (!pacing.isPaced()) {
+			output->sendBlockOfMessagesFullSpeed(messages);
+			return;
+		}
+		auto times = sendTimes(messages, pacing);
+		double start = Time::getMillisecondCounterHiRes();
+		for (size_t i = 0; i < messages.size(); i++) {
+			double wait = start + times[i] - Time::getMillisecondCounterHiRes();
+			if (wait > 0) {
+				Thread::sleep((int)std::ceil(wait));
+			}
+			output->sendBlockOfMessagesFullSpeed({ messages[i] });
+		}
+	}
+
+	void MidiSendScheduler::run()
+	{
+		while (!threadShouldExit()) {
+			Job job;
+			{
+				ScopedLock lock(lock_);
+				if (!jobs_.empty()) {
+					job = jobs_.front();
+					jobs_.pop_front();
+				}
+			}
+			if (job.messages.empty()) {
+				wakeUp_.wait(100);
+				continue;
+			}
+			sendPaced(job.midiOutput, job.messages, job.pacing);
+			job.sent->signal();
+		}
+	}
+
+	class MidiSendSchedulerTest : public juce::UnitTest {
+	public:
+		MidiSendSchedulerTest() : juce::UnitTest("MidiSendScheduler", "KnobKraft") {}
+
+		void runTest() override
+		{
+			beginTest("Unpaced messages are sent at once");
+			expectTimes(sendTimes({ 100, 100 }, {}), { 0, 0 });
+
+			beginTest("The minimum gap spaces short messages");
+			expectTimes(sendTimes({ 3, 3, 3 }, { 1000, 0, 50 }), { 0, 50, 100 });
+
+			beginTest("The wire rate spaces long messages");
+			expectTimes(sendTimes({ 100, 10, 10 }, { 1000, 0, 0 }), { 0, 100, 110 });
+			// A gap shorter than the wire time of the previous message doesn't slow down anything
+			expectTimes(sendTimes({ 100, 100, 100 }, { 1000, 0, 50 }), { 0, 100, 200 });
+
+			beginTest("The receive buffer is filled ahead of the wire rate");
+			expectTimes(sendTimes({ 100, 100, 100 }, { 1000, 200, 0 }), { 0, 0, 100 });
+			// After a message larger than the buffer, the next one waits until it fits into the buffer
+			expectTimes(sendTimes({ 100, 10 }, { 1000, 50, 0 }), { 0, 60 });
+		}
+
+	private:
+		static std::vector<double> sendTimes(std::vector<int> const &sizes, MidiPacing const &pacing)
+		{
+			std::vector<MidiMessage> messages;
+			for (auto size : sizes) {
+				// Sysex messages of the given total length, including F0 and F7
+				std::vector<uint8> data(size - 2, 0x00);
+				messages.push_back(MidiMessage::createSysExMessage(data.data(), (int)data.size()));
+			}
+			return MidiSendScheduler::sendTimes(messages, pacing);
+		}
+
+		void expectTimes(std::vector<double> const &times, std::vector<double> const &expected)
+		{
+			expectEquals((int)times.size(), (int)expected.size());
+			for (size_t i = 0; i < std::min(times.size(), expected.size()); i++) {
+				expectWithinAbsoluteError(times[i], expected[i], 0.001);
+			}
+		}
+	};
+
+	static MidiSendSchedulerTest sMidiSendSchedulerTest;
+
+}
@@ -0,0 +1,54 @@
+/*
+   Copyright (c) 2022 Christof Ruch. All rights reserved.
+
+   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+*/
+
+#pragma once
+
+#include "JuceHeader.h"
+
+#include <deque>
+
+namespace knobkraft {
+
+	// How fast a synth can take MIDI messages, as declared by the adaptation
+	struct MidiPacing {
+		int bytesPerSecond = 0; // 0 means no limit, DIN MIDI is 3125 bytes per second
+		int receiveBufferSize = 0; // Bytes the synth can buffer, so messages can be sent ahead of the wire rate
+		int minimumGapMilliseconds = 0; // Time the synth needs to process a message before it can take the next one
+
+		bool isPaced() const { return bytesPerSecond > 0 || minimumGapMilliseconds > 0; }
+	};
+
+	// Sends blocks of MIDI messages paced by the bytes of each message instead of a fixed delay. All blocks are queued and
+	// sent by a background thread in the order they were given, so a short block can not overtake a long upload. The
+	// message thread returns right away so the UI does not block, other threads wait until their block has been sent.
+	class MidiSendScheduler : private juce::Thread {
+	public:
+		MidiSendScheduler();
+		~MidiSendScheduler() override;
+
+		void send(std::string const &midiOutput, std::vector<MidiMessage> const &messages, MidiPacing const &pacing);
+
+		// The time each message is sent, in milliseconds after the first message
+		static std::vector<double> sendTimes(std::vector<MidiMessage> const &messages, MidiPacing const &pacing);
+		// Blocks the calling thread until all messages are sent
+		static void sendPaced(std::string const &midiOutput, std::vector<MidiMessage> const &messages, MidiPacing const &pacing);
+
+	private:
+		struct Job {
+			std::string midiOutput;
+			std::vector<MidiMessage> messages;
+			MidiPacing pacing;
+			std::shared_ptr<juce::WaitableEvent> sent;
+		};
+
+		void run() override;
+
+		juce::CriticalSection lock_;
+		juce::WaitableEvent wakeUp_;
+		std::deque<Job> jobs_;
+	};
+
+}
@@ -8,6 +8,8 @@
 
 #include "Logger.h"
 
+#include <pybind11/stl.h>
+
 #include <boost/format.hpp>
 #include <boost/algorithm/string.hpp>
 
@@ -67,3 +69,52 @@ void PyStdErrOutStreamRedirect::flushToLogger(std::string const &logDomain)
 	clear();
 }
 
+
+PyBufferedOutputSink::PyBufferedOutputSink(pybind11::module knobkraftModule, int drainIntervalMilliseconds)
+{
+	py::gil_scoped_acquire acquire;
+	auto sysm = py::module::import("sys");
+	_stdout = sysm.attr("stdout");
+	_stderr = sysm.attr("stderr");
+	_buffer = knobkraftModule.attr("install_output_sink")();
+	startTimer(drainIntervalMilliseconds);
+}
+
+PyBufferedOutputSink::~PyBufferedOutputSink()
+{
+	stopTimer();
+	py::gil_scoped_acquire acquire;
+	auto sysm = py::module::import("sys");
+	sysm.attr("stdout") = _stdout;
+	sysm.attr("stderr") = _stderr;
+}
+
+void PyBufferedOutputSink::drainToLogger(std::string const &logDomain)
+{
+	std::vector<std::tuple<std::string, bool, std::string>> lines;
+	{
+		py::gil_scoped_acquire acquire;
+		try {
+			lines = _buffer.attr("drain")().cast<std::vector<std::tuple<std::string, bool, std::string>>>();
+		}
+		catch (py::error_already_set &) {
+			// Don't restore the error, this is not called on behalf of any adaptation
+			return;
+		}
+	}
+	// Post outside of the GIL, the logger might need to wait for the message thread
+	for (auto const &line : lines) {
+		auto const &[tag, isError, text] = line;
+		if (isError) {
+			SimpleLogger::instance()->postMessage((boost::format("%s[%s] ERROR: %s") % logDomain % tag % text).str());
+		}
+		else {
+			SimpleLogger::instance()->postMessage((boost::format("%s[%s]: %s") % logDomain % tag % text).str());
+		}
+	}
+}
+
+void PyBufferedOutputSink::timerCallback()
+{
+	drainToLogger("Adaptation");
+}
@@ -6,6 +6,8 @@
 
 #pragma once
 
+#include "JuceHeader.h"
+
 #include <string>
 #include <pybind11/pybind11.h>
 
@@ -26,3 +28,20 @@ private:
 	pybind11::object _stdout_buffer;
 	pybind11::object _stderr_buffer;
 };
+
+// Lets Python collect its output into a ring buffer (knobkraft.install_output_sink), which a timer on the message thread
+// drains into the log. So calling into Python needs no check for output afterwards.
+class PyBufferedOutputSink : private juce::Timer {
+public:
+	PyBufferedOutputSink(pybind11::module knobkraftModule, int drainIntervalMilliseconds);
+	~PyBufferedOutputSink() override;
+
+	void drainToLogger(std::string const &logDomain);
+
+private:
+	void timerCallback() override;
+
+	pybind11::object _buffer;
+	pybind11::object _stdout;
+	pybind11::object _stderr;
+};
@@ -18,10 +18,11 @@ def deviceDetectWaitMilliseconds():
     return 200
 
 
-def generalMessageDelay():
-    # It seems the Blofeld is not the fastest horse in the MIDI stable, so better build in a small delay before
-    # sending messages
-    return 100
+def wireBytesPerSecond():
+    # It seems the Blofeld is not the fastest horse in the MIDI stable. Pacing at the 31250 baud of a DIN MIDI cable
+    # spaces the 392 byte single dumps by 125 ms, more than the fixed 100 ms delay used before, while short messages
+    # need not wait
+    return 3125
 
 
 def needsChannelSpecificDetection():
@@ -45,6 +46,10 @@ def channelIfValidDeviceResponse(message):
     return -1
 
 
+def identityReplySignature():
+    return [[0x3e, 0x13]]
+
+
 def createEditBufferRequest(channel):
     return [0xf0, 0x3e, 0x13, channel, 0x00, 0x7f, 0x00, 0xf7]
 
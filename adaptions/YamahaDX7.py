@@ -107,6 +107,11 @@ def isBankDumpFinished(messages):
     return any([isPartOfBankDump(m) for m in messages])
 
 
+def bankDumpProgress(state, message):
+    finished = bool(state) or isPartOfBankDump(message)
+    return finished, finished
+
+
 def extractPatchesFromBank(message):
     patches = []
     if isPartOfBankDump(message):
@@ -136,6 +141,13 @@ def nameFromDump(message):
     raise Exception("Can only extract a name from a single program dump")
 
 
+def parameterArrayFromDump(message):
+    if isEditBufferDump(message):
+        # The single voice format is unpacked already, one byte per parameter in the order of the DX7 manual
+        return message[6:-2]
+    raise Exception("Can only extract parameters from a single voice dump")
+
+
 def setupHelp():
     return "The Yamaha DX7 is an early synth, it's MIDI implementation is really simple.\n" \
         "Sorry to say that you cannot request the edit buffer or a bank dump from the computer, you need" \
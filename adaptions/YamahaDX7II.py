@@ -129,6 +129,11 @@ def isBankDumpFinished(messages):
     return any([isEditBufferDump(m) for m in messages])
 
 
+def bankDumpProgress(state, message):
+    finished = bool(state) or isEditBufferDump(message)
+    return finished, finished
+
+
 def extractPatchesFromBank(message):
     patches = []
     if isOwnSysexOfSubstatusAndGroup(message, 0x00, 9):
@@ -6,31 +6,135 @@
 
 import importlib.util
 import os
+import subprocess
 import sys
+import tempfile
+
+import pytest
+
+from knobkraft.test_helper import TestData
+
+# pytest_generate_tests is called once per test function, so keep the loaded modules for the whole session instead of
+# executing every adaptation again for each of the generic tests
+_loaded_adaptations = {}
 
 
 def load_adaptation(adaptation_file):
     # Dynamically load the adaptation and create the generic test suite all adaptations must undergo
+    if adaptation_file in _loaded_adaptations:
+        return _loaded_adaptations[adaptation_file]
     spec = importlib.util.spec_from_file_location(adaptation_file, adaptation_file)
     synth_under_test = importlib.util.module_from_spec(spec)
     sys.modules[adaptation_file] = synth_under_test
     spec.loader.exec_module(synth_under_test)
+    _loaded_adaptations[adaptation_file] = synth_under_test
     return synth_under_test
 
 
+def all_adaptation_files():
+    # Sorted, so every shard sees the same list
+    result = []
+    for file in sorted(os.listdir(os.path.dirname(os.path.realpath(__file__)))):
+        if os.path.isfile(file) and file != "conftest.py" and file != "test_adaptations.py" and file.lower().endswith(".py") and not file.lower().startswith("test_"):
+            result += [file]
+    return result
+
+
 def pytest_addoption(parser):
     parser.addoption("--all", action="store_true", help="run all combinations")
     parser.addoption("--adaptation", help="specify adaptation to test")
+    parser.addoption("--shard", help="only run the adaptations of shard i of n, given as i/n with i starting at 0")
+    parser.addoption("--parallel", type=int, default=0, help="run the adaptations sharded across this many worker processes")
+    parser.addoption("--update-performance-baseline", action="store_true", help="record the measured timings as the new performance baseline")
+    parser.addoption("--performance-tolerance", type=float, default=None, help="factor a function may be slower than its baseline")
+    parser.addoption("--profile-allocations", action="store_true", help="report peak and net allocations of the adaptation functions")
+    parser.addoption("--scaling-corpus-size", type=int, default=0, help="check the scaling of each adaptation on synthetic corpora up to this many patches")
+
+
+def _shard(config):
+    shard = config.getoption("shard")
+    if shard is None:
+        return None
+    index, count = (int(x) for x in shard.split("/"))
+    if not 0 <= index < count:
+        raise pytest.UsageError(f"--shard {shard} is not of the form i/n with 0 <= i < n")
+    return index, count
 
 
 def pytest_generate_tests(metafunc):
     if "adaptation" in metafunc.fixturenames:
         if metafunc.config.getoption("all"):
-            adaptations_to_test = []
-            for file in os.listdir(os.path.dirname(os.path.realpath(__file__))):
-                if os.path.isfile(file) and file != "conftest.py" and file != "test_adaptations.py" and file.lower().endswith(".py") and not file.lower().startswith("test_"):
-                    adaptations_to_test += [file]
-            metafunc.parametrize("adaptation", [load_adaptation(a) for a in adaptations_to_test])
+            adaptations_to_test = all_adaptation_files()
+            shard = _shard(metafunc.config)
+            if shard is not None:
+                adaptations_to_test = adaptations_to_test[shard[0]::shard[1]]
         else:
-            metafunc.parametrize("adaptation", [load_adaptation(metafunc.config.getoption("adaptation"))])
+            adaptations_to_test = [metafunc.config.getoption("adaptation")]
+        # Session scope allows fixtures derived from the adaptation, like the parsed test data, to be computed only once
+        metafunc.parametrize("adaptation", [load_adaptation(a) for a in adaptations_to_test], scope="session")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Tests not parametrized by adaptation run in the first shard only
+    shard = _shard(config)
+    if shard is not None and shard[0] != 0:
+        deselected = [item for item in items if not hasattr(item, "callspec") or "adaptation" not in item.callspec.params]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = [item for item in items if item not in deselected]
+
+
+#
+# Fixtures prepare the test data for the generic tests
+#
+@pytest.fixture(scope="session")
+def parsed_test_data(adaptation):
+    # Parsed once per adaptation
+    if hasattr(adaptation, "test_data"):
+        return TestData(adaptation)
+    else:
+        return None
+
+
+@pytest.fixture
+def test_data(parsed_test_data):
+    # Each test gets its own copy, as some adaptations modify the messages they are given in place, e.g. the Roland
+    # fingerprint blanking out the name
+    return parsed_test_data.copy() if parsed_test_data is not None else None
+
+
+def _worker_arguments(args):
+    # The arguments of this run without --parallel, which must not be passed on to the workers
+    result = []
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg == "--parallel":
+            skip_next = True
+        elif not arg.startswith("--parallel="):
+            result.append(arg)
+    return result
+
 
+def pytest_cmdline_main(config):
+    workers = config.getoption("parallel")
+    if workers > 1 and config.getoption("shard") is None:
+        arguments = _worker_arguments(config.invocation_params.args)
+        # The output goes to temporary files instead of pipes, a shard writing more than fits into a pipe would block
+        # until it is read, while we are still waiting for an earlier shard
+        outputs = [tempfile.TemporaryFile(mode="w+") for _ in range(workers)]
+        processes = [subprocess.Popen([sys.executable, "-m", "pytest"] + arguments + ["--shard", f"{i}/{workers}"],
+                                      cwd=config.invocation_params.dir, stdout=outputs[i], stderr=subprocess.STDOUT, text=True)
+                     for i in range(workers)]
+        exit_codes = []
+        for i, (process, output) in enumerate(zip(processes, outputs)):
+            exit_codes.append(process.wait())
+            output.seek(0)
+            print(f"==== shard {i}/{workers} ====")
+            print(output.read())
+            output.close()
+        # An empty shard collects no tests, that is not a failure of the whole run
+        failures = [code for code in exit_codes if code not in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED)]
+        return max(failures) if failures else pytest.ExitCode.OK
+    return None
@@ -5,3 +5,9 @@
 #
 from .sysex import *
 from .test_helper import *
+from .template_adaptation import *
+from .adaptation_module import *
+from .manifest import *
+from .output_sink import *
+from .identity_routing import *
+from .name_cache import *
@@ -0,0 +1,73 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import importlib.util
+import os
+import sys
+import sysconfig
+import types
+from typing import List
+
+__all__ = ["load_adaptation", "import_adaptation", "adaptation_source_files", "source_name"]
+
+
+def load_adaptation(adaptation_file):
+    # Load an adaptation from its file the same way the Orm does, i.e. with the file name as module name
+    module_name = os.path.splitext(os.path.basename(adaptation_file))[0]
+    spec = importlib.util.spec_from_file_location(module_name, adaptation_file)
+    adaptation = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = adaptation
+    spec.loader.exec_module(adaptation)
+    return adaptation
+
+
+def import_adaptation(adaptation_file):
+    # Return the module already loaded from this file, e.g. while building the adaptation manifest, or load it now
+    module_name = os.path.splitext(os.path.basename(adaptation_file))[0]
+    loaded = sys.modules.get(module_name)
+    if loaded is not None and os.path.abspath(getattr(loaded, "__file__", "")) == os.path.abspath(adaptation_file):
+        return loaded
+    return load_adaptation(adaptation_file)
+
+
+def _library_directories():
+    # The standard library and installed packages, which are not part of an adaptation
+    paths = sysconfig.get_paths()
+    return tuple(os.path.join(os.path.abspath(paths[key]), "") for key in ["stdlib", "platstdlib", "purelib", "platlib"] if key in paths)
+
+
+def adaptation_source_files(adaptation) -> List[str]:
+    # The adaptation file and all Python files it refers to, directly or through other modules, e.g.
+    # sequential/GenericSequential.py or knobkraft/template_adaptation.py. These together determine what the adaptation
+    # does. In an installation, the helper packages are not in the adaptation directory but next to the executable
+    libraries = _library_directories()
+    result = set()
+    pending = [adaptation]
+    seen = set()
+    while pending:
+        module = pending.pop()
+        if id(module) in seen:
+            continue
+        seen.add(id(module))
+        file_name = getattr(module, "__file__", None)
+        if file_name is None or not file_name.endswith(".py") or os.path.abspath(file_name).startswith(libraries):
+            continue
+        result.add(os.path.abspath(file_name))
+        for value in list(vars(module).values()):
+            if isinstance(value, types.ModuleType):
+                pending.append(value)
+            else:
+                owner = sys.modules.get(getattr(value, "__module__", None) or "")
+                if owner is not None:
+                    pending.append(owner)
+    return sorted(result)
+
+
+def source_name(file_name, directory) -> str:
+    # Files of the adaptation directory relative to it, all others with their absolute path
+    file_name = os.path.abspath(file_name)
+    if file_name.startswith(os.path.join(os.path.abspath(directory), "")):
+        return os.path.relpath(file_name, directory).replace(os.sep, "/")
+    return file_name
@@ -0,0 +1,309 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from .adaptation_module import load_adaptation
+from .corpus import split_programs
+from .manifest import is_adaptation_file
+from .metadata_cache import MetadataCache, compute_metadata
+from .sysex import load_sysex, splitSysexMessage
+from .worker_pool import AdaptationWorkerPool
+
+#
+# Headless batch processing of sysex files with the adaptations, without the Orm. Whole directories of .syx files are
+# processed file by file in a pool of worker processes, each of which loads the adaptations once. The result is
+# written as JSON lines, one object per file or patch, with progress and throughput reported on stderr. E.g.
+#
+#     python -m knobkraft.batch classify ~/sounds
+#     python -m knobkraft.batch fingerprint --unique ~/sounds > unique.jsonl
+#     python -m knobkraft.batch convert --synth "Matrix 1000 Adaptation" --to edit_buffer --output-directory out ~/sounds
+#
+# The operations are
+#
+#     classify     which synths recognize which kinds of patches in a file
+#     extract      one line per patch with name, number, fingerprint and the sysex as hex
+#     fingerprint  one line per patch with name and fingerprint, --unique drops patches already seen
+#     rename       rename all patches with --name, e.g. "{file} {index}", and write them to the output directory
+#     convert      convert all patches with --to edit_buffer or program_dump and write them to the output directory
+#
+# rename and convert keep the subdirectories of the input files in the output directory.
+#
+# Without --synth, the patches of a file are read by the adaptation that finds the most patches in it. With --cache,
+# extract and fingerprint take names, numbers and fingerprints from a metadata cache file where already known.
+# --cleanup-cache afterwards deletes the cache entries of older versions of the adaptations.
+#
+
+operations = ["classify", "extract", "fingerprint", "rename", "convert"]
+
+# The adaptations and metadata cache of a worker process, loaded for the first file and used for all others
+_worker_state: Dict[tuple, tuple] = {}
+
+
+def load_adaptations(directory, synth: Optional[str] = None) -> List:
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    result = []
+    for file_name in sorted(os.listdir(directory)):
+        if is_adaptation_file(file_name):
+            try:
+                adaptation = load_adaptation(os.path.join(directory, file_name))
+                if synth is None or synth in (adaptation.name(), adaptation.__name__, file_name):
+                    result.append(adaptation)
+            except Exception as e:
+                print(f"Adaptation {file_name} failed to load: {e}", file=sys.stderr)
+    if synth is not None and not result:
+        raise Exception(f"No adaptation for synth {synth} found in {directory}")
+    return result
+
+
+def extract_patches(adaptation, messages: List[List[int]]) -> List[Dict]:
+    # Program dumps and edit buffers, plus the patches of bank dumps the same way the Orm splits the result of
+    # extractPatchesFromBank into single messages
+    result = []
+    has_bank_dumps = hasattr(adaptation, "isPartOfBankDump") and hasattr(adaptation, "extractPatchesFromBank")
+    other = []
+    for message in messages:
+        if has_bank_dumps and adaptation.isPartOfBankDump(message):
+            for patch in splitSysexMessage(adaptation.extractPatchesFromBank(message)):
+                result.append({"kind": "bank", "data": list(patch)})
+        else:
+            other.append(message)
+    for patch in split_programs(adaptation, other):
+        kind = "program_dump" if hasattr(adaptation, "isSingleProgramDump") and adaptation.isSingleProgramDump(patch) else "edit_buffer"
+        result.append({"kind": kind, "data": list(patch)})
+    return result
+
+
+def _patches_or_none(adaptation, messages):
+    try:
+        return extract_patches(adaptation, messages)
+    except Exception:
+        # An adaptation not made for this file may well fail on it
+        return []
+
+
+def fingerprint(adaptation, data: List[int]) -> str:
+    if hasattr(adaptation, "calculateFingerprint"):
+        # On a copy, as some adaptations blank out the name in place
+        return adaptation.calculateFingerprint(list(data))
+    return hashlib.md5(bytearray(data)).hexdigest()
+
+
+def _patch_name(adaptation, data):
+    return adaptation.nameFromDump(data) if hasattr(adaptation, "nameFromDump") else None
+
+
+def _metadata(adaptation, data, operation):
+    if operation in ["extract", "fingerprint"]:
+        return compute_metadata(adaptation, data)
+    return {"name": _patch_name(adaptation, data)}
+
+
+def _output_file(options, file_name, suffix):
+    # Keep the path below the common directory of all input files, so files of the same name in different directories
+    # are written to different output files, also when processed by different workers at the same time
+    relative = os.path.relpath(file_name, options.get("input_directory", os.path.dirname(file_name)))
+    output_file = os.path.join(options["output_directory"], os.path.splitext(relative)[0] + suffix + ".syx")
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    return output_file
+
+
+def process_file(adaptations, file_name, operation, options, cache: Optional[MetadataCache] = None) -> List[Dict]:
+    messages = load_sysex(file_name)
+    if operation == "classify":
+        synths = []
+        most_patches = 0
+        for adaptation in adaptations:
+            patches = _patches_or_none(adaptation, messages)
+            if patches:
+                kinds = {}
+                for patch in patches:
+                    kinds[patch["kind"]] = kinds.get(patch["kind"], 0) + 1
+                synths.append(dict(synth=adaptation.name(), **kinds))
+                most_patches = max(most_patches, len(patches))
+        return [{"file": file_name, "messages": len(messages), "patches": most_patches, "synths": synths}]
+
+    adaptation, patches = None, []
+    for candidate in adaptations:
+        found = _patches_or_none(candidate, messages)
+        if len(found) > len(patches):
+            adaptation, patches = candidate, found
+    if adaptation is None:
+        return [{"file": file_name, "error": "No adaptation recognizes any patch in this file"}]
+
+    records = []
+    written = []
+    metadata = None
+    if cache is not None and operation in ["extract", "fingerprint"]:
+        metadata = cache.metadata_batch(adaptation, [patch["data"] for patch in patches])
+    for index, patch in enumerate(patches):
+        data = patch["data"]
+        known = metadata[index] if metadata is not None else _metadata(adaptation, data, operation)
+        record = {"file": file_name, "synth": adaptation.name(), "index": index, "kind": patch["kind"], "name": known.get("name")}
+        if operation == "extract":
+            record["number"] = known.get("number")
+            record["tags"] = known.get("tags")
+            record["fingerprint"] = known.get("fingerprint") or fingerprint(adaptation, data)
+            record["sysex"] = bytes(data).hex()
+        elif operation == "fingerprint":
+            record["fingerprint"] = known.get("fingerprint") or fingerprint(adaptation, data)
+        elif operation == "rename":
+            if not hasattr(adaptation, "renamePatch"):
+                return [{"file": file_name, "synth": adaptation.name(), "error": "Adaptation does not implement renamePatch"}]
+            new_name = options["name"].format(index=index, name=record["name"], file=os.path.splitext(os.path.basename(file_name))[0])
+            data = adaptation.renamePatch(data, new_name)
+            record["old_name"] = record["name"]
+            record["name"] = _patch_name(adaptation, data)
+            written.append(data)
+        elif operation == "convert":
+            if options["to"] == "edit_buffer":
+                if not hasattr(adaptation, "convertToEditBuffer"):
+                    return [{"file": file_name, "synth": adaptation.name(), "error": "Adaptation does not implement convertToEditBuffer"}]
+                data = adaptation.convertToEditBuffer(options["channel"], data)
+            else:
+                if not hasattr(adaptation, "convertToProgramDump"):
+                    return [{"file": file_name, "synth": adaptation.name(), "error": "Adaptation does not implement convertToProgramDump"}]
+                data = adaptation.convertToProgramDump(options["channel"], data, options["program"] + index)
+            record["kind"] = options["to"]
+            written.append(data)
+        records.append(record)
+    if written:
+        output_file = _output_file(options, file_name, "_renamed" if operation == "rename" else "_" + options["to"])
+        with open(output_file, "wb") as f:
+            for data in written:
+                f.write(bytes(data))
+        for record in records:
+            record["output"] = output_file
+    return records
+
+
+def _worker(setup):
+    if setup not in _worker_state:
+        directory, synth, cache_file = setup
+        adaptations = load_adaptations(directory, synth)
+        _worker_state[setup] = (adaptations, MetadataCache(cache_file) if cache_file is not None else None)
+    return _worker_state[setup]
+
+
+def _close_worker(setup):
+    _, cache = _worker_state.pop(setup, (None, None))
+    if cache is not None:
+        cache.close()
+
+
+def _process_in_worker(setup, file_name, operation, options):
+    # Output of the adaptations goes to stderr, stdout is reserved for the JSON lines
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            adaptations, cache = _worker(setup)
+            return process_file(adaptations, file_name, operation, options, cache)
+        except Exception as e:
+            return [{"file": file_name, "error": str(e)}]
+
+
+def sysex_files(paths) -> List[str]:
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                result.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(".syx"))
+        else:
+            result.append(path)
+    return result
+
+
+def run(operation, paths, adaptation_directory, output, synth=None, processes=None, unique=False, options=None, progress=sys.stderr,
+        cache_file=None):
+    # Returns the number of lines written
+    files = sysex_files(paths)
+    setup = (adaptation_directory, synth, cache_file)
+    options = dict(options or {})
+    if files:
+        options["input_directory"] = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    arguments = [(setup, f, operation, options) for f in files]
+    seen = set()
+    lines = 0
+    patches = 0
+    start = time.perf_counter()
+    last_report = start
+
+    def results():
+        workers = 0 if processes == 1 or len(files) < 2 else processes
+        with AdaptationWorkerPool(workers, adaptation_directory) as pool:
+            try:
+                # One file per batch and in order, so --unique keeps the same patches no matter which worker was faster
+                yield from pool.imap(None, _process_in_worker, arguments, batch_size=1)
+            finally:
+                _close_worker(setup)
+
+    for done, records in enumerate(results(), start=1):
+        for record in records:
+            patches += record.get("patches", 1 if "index" in record else 0)
+            if "index" in record:
+                if unique and "fingerprint" in record:
+                    key = (record["synth"], record["fingerprint"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+            output.write(json.dumps(record) + "\n")
+            lines += 1
+        now = time.perf_counter()
+        if progress is not None and (now - last_report > 1.0 or done == len(files)):
+            last_report = now
+            print(f"{done}/{len(files)} files, {patches} patches, {patches / max(now - start, 1e-9):.0f} patches/s", file=progress)
+    return lines
+
+
+def cleanup_cache(cache_file, adaptation_directory, synth=None) -> int:
+    with MetadataCache(cache_file) as cache:
+        return cache.cleanup(load_adaptations(adaptation_directory, synth))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m knobkraft.batch", description="Process directories of sysex files with the KnobKraft adaptations")
+    parser.add_argument("operation", choices=operations)
+    parser.add_argument("paths", nargs="+", help="sysex files or directories searched for .syx files")
+    parser.add_argument("--adaptations", default=os.path.dirname(os.path.dirname(os.path.realpath(__file__))), help="adaptation directory")
+    parser.add_argument("--synth", help="only use this adaptation, given by synth name or file name")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes, default one per core")
+    parser.add_argument("--output", help="JSON lines output file, default stdout")
+    parser.add_argument("--unique", action="store_true", help="skip patches with a fingerprint already seen")
+    parser.add_argument("--cache", help="SQLite file caching names, numbers and fingerprints between runs")
+    parser.add_argument("--cleanup-cache", action="store_true", help="delete the cache entries of outdated adaptations after the run")
+    parser.add_argument("--output-directory", help="where rename and convert write their sysex files")
+    parser.add_argument("--name", default="{name}", help="new name for rename, with {index}, {name} and {file}")
+    parser.add_argument("--to", choices=["edit_buffer", "program_dump"], default="edit_buffer", help="target of convert")
+    parser.add_argument("--channel", type=int, default=0, help="MIDI channel used by convert")
+    parser.add_argument("--program", type=int, default=0, help="first program number used by convert to program_dump")
+    args = parser.parse_args(argv)
+    if args.cleanup_cache and args.cache is None:
+        parser.error("--cleanup-cache requires --cache")
+    if args.operation in ["rename", "convert"]:
+        if args.output_directory is None:
+            parser.error(f"{args.operation} requires --output-directory")
+        os.makedirs(args.output_directory, exist_ok=True)
+    options = {"output_directory": args.output_directory, "name": args.name, "to": args.to, "channel": args.channel, "program": args.program}
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        run(args.operation, args.paths, os.path.abspath(args.adaptations), output, args.synth, args.processes, args.unique, options,
+            cache_file=args.cache)
+        if args.cleanup_cache:
+            deleted = cleanup_cache(args.cache, os.path.abspath(args.adaptations), args.synth)
+            print(f"{deleted} outdated cache entries deleted", file=sys.stderr)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
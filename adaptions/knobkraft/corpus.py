@@ -0,0 +1,268 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import contextlib
+import math
+import mmap
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List
+
+from .adaptation_module import load_adaptation
+
+#
+# Synthetic corpora for scale testing. The test data of an adaptation holds at most a few hundred patches, which hides
+# quadratic behaviour. The corpus generator takes the programs of the adaptation's test_data() as seeds and uses the
+# adaptation's own functions to create as many valid patches as needed: the payload of a seed is mutated by copying
+# bytes within the payload (so nibbled or 7 bit formats stay in their value range), then renamePatch gives it a unique
+# name and convertToProgramDump a program place. A mutated patch the adaptation no longer recognizes is replaced by the
+# unmutated one.
+#
+# Adaptations that extract patches from bank dumps get a second corpus of bank dumps, made the same way by mutating the
+# bank dumps found in the sysex file of their test data.
+#
+# Corpora are written to a temporary file and read back memory-mapped, so a million patches do not have to be held
+# as Python lists. Run
+#
+#     python -m knobkraft.corpus Matrix1000.py 10000 100000 1000000
+#
+# to print the scaling of the adaptation functions, and plot them if matplotlib is installed.
+#
+
+# Bytes at the start and end of each sysex message that are left alone, to keep headers and checksums recognizable
+header_bytes = 10
+trailer_bytes = 2
+
+
+def _mutate(program: List[int], rng: random.Random, mutations: int) -> List[int]:
+    result = list(program)
+    payload = []
+    start = 0
+    for index, byte in enumerate(result):
+        if byte == 0xf0:
+            start = index
+        elif byte == 0xf7:
+            payload.extend(range(start + header_bytes, index + 1 - trailer_bytes))
+    if len(payload) > 1:
+        for _ in range(mutations):
+            result[rng.choice(payload)] = result[rng.choice(payload)]
+    return result
+
+
+def _dump_checks(adaptation):
+    return [getattr(adaptation, check) for check in ["isSingleProgramDump", "isEditBufferDump"] if hasattr(adaptation, check)]
+
+
+def _synthesize(adaptation, original, number, patches_per_bank, rng, mutations) -> List[int]:
+    program = _mutate(original, rng, mutations) if mutations > 0 else list(original)
+    if hasattr(adaptation, "renamePatch"):
+        program = adaptation.renamePatch(program, f"S{number:06d}")
+    if hasattr(adaptation, "convertToProgramDump") and hasattr(adaptation, "isSingleProgramDump") and adaptation.isSingleProgramDump(program):
+        program = adaptation.convertToProgramDump(0x00, program, number % patches_per_bank)
+    # The result must still be recognized as a patch, and be readable
+    if not any(check(program) for check in _dump_checks(adaptation)):
+        raise Exception(f"Synthesized patch {number} is neither a program dump nor an edit buffer")
+    if hasattr(adaptation, "nameFromDump"):
+        adaptation.nameFromDump(program)
+    return program
+
+
+def synthesize_programs(adaptation, seeds: List[List[int]], count: int, seed=0, mutations=8) -> Iterator[List[int]]:
+    if not seeds:
+        raise Exception(f"Adaptation {adaptation.name()} has no seed programs to synthesize a corpus from")
+    rng = random.Random(seed)
+    patches_per_bank = adaptation.numberOfPatchesPerBank() if hasattr(adaptation, "numberOfPatchesPerBank") else 128
+    for number in range(count):
+        original = seeds[number % len(seeds)]
+        try:
+            yield _synthesize(adaptation, original, number, patches_per_bank, rng, mutations)
+        except Exception:
+            # The mutation broke the patch, e.g. by invalidating a checksum renamePatch does not recompute
+            yield _synthesize(adaptation, original, number, patches_per_bank, rng, 0)
+
+
+def split_programs(adaptation, messages: Iterator[List[int]]) -> Iterator[List[int]]:
+    # Collect messages until they form a complete program dump or edit buffer, like the librarian does when loading a file
+    checks = _dump_checks(adaptation)
+    parts = [getattr(adaptation, part) for part in ["isPartOfSingleProgramDump", "isPartOfEditBufferDump"] if hasattr(adaptation, part)]
+    patch = []
+    for message in messages:
+        if parts:
+            if not any(part(message) for part in parts):
+                continue
+            patch.extend(message)
+        else:
+            # Single message dumps, anything else like the store command following a Matrix edit buffer is ignored
+            patch = message
+        if any(check(patch) for check in checks):
+            yield patch
+            patch = []
+
+
+def _test_messages(adaptation):
+    test_dict = adaptation.test_data()
+    if "sysex" in test_dict:
+        from .sysex import load_sysex
+        return test_dict, load_sysex(test_dict["sysex"])
+    return test_dict, []
+
+
+def seed_programs(adaptation) -> List[List[int]]:
+    # The programs of the test data, where available
+    if not hasattr(adaptation, "test_data"):
+        return []
+    test_dict, messages = _test_messages(adaptation)
+    if "program_generator" not in test_dict:
+        return []
+    return [program["message"] for program in test_dict["program_generator"](messages)]
+
+
+def seed_banks(adaptation) -> List[List[int]]:
+    # The bank dumps in the sysex file of the test data, for adaptations that can extract patches from them
+    if not hasattr(adaptation, "test_data") or not hasattr(adaptation, "isPartOfBankDump") or not hasattr(adaptation, "extractPatchesFromBank"):
+        return []
+    _, messages = _test_messages(adaptation)
+    return [message for message in messages if adaptation.isPartOfBankDump(message)]
+
+
+def synthesize_banks(adaptation, seeds: List[List[int]], count: int, seed=0, mutations=64) -> Iterator[List[int]]:
+    # Bank dumps have no renamePatch, so they are only mutated. A mutated bank the adaptation no longer recognizes is
+    # replaced by the unmutated one
+    if not seeds:
+        raise Exception(f"Adaptation {adaptation.name()} has no seed bank dumps to synthesize a corpus from")
+    rng = random.Random(seed)
+    for number in range(count):
+        original = seeds[number % len(seeds)]
+        bank = _mutate(original, rng, mutations)
+        yield bank if adaptation.isPartOfBankDump(bank) else list(original)
+
+
+def patches_per_bank(adaptation, bank: List[int]) -> int:
+    from .sysex import splitSysexMessage
+    return max(1, len(splitSysexMessage(adaptation.extractPatchesFromBank(bank))))
+
+
+class CorpusFile:
+    # A corpus on disk, read memory-mapped
+
+    def __init__(self, file_name, count):
+        self.file_name = file_name
+        self.count = count
+        self._file = open(file_name, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def messages(self) -> Iterator[List[int]]:
+        # Split into sysex messages, the same way knobkraft.load_sysex does
+        start = 0
+        end = self.data.find(b"\xf7", start)
+        while end != -1:
+            yield list(self.data[start:end + 1])
+            start = end + 1
+            end = self.data.find(b"\xf7", start)
+
+    def __len__(self):
+        # Number of patches or bank dumps written
+        return self.count
+
+    def size(self) -> int:
+        return len(self.data)
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+
+def write_corpus(programs: Iterator[List[int]], file_name) -> int:
+    count = 0
+    with open(file_name, "wb") as f:
+        for program in programs:
+            f.write(bytes(program))
+            count += 1
+    return count
+
+
+@contextlib.contextmanager
+def synthetic_corpus(adaptation, count, seed=0, directory=None, banks=False):
+    # count patches, or with banks=True count bank dumps
+    handle, file_name = tempfile.mkstemp(suffix=".syx", dir=directory)
+    os.close(handle)
+    corpus = None
+    try:
+        if banks:
+            written = write_corpus(synthesize_banks(adaptation, seed_banks(adaptation), count, seed), file_name)
+        else:
+            written = write_corpus(synthesize_programs(adaptation, seed_programs(adaptation), count, seed), file_name)
+        corpus = CorpusFile(file_name, written)
+        yield corpus
+    finally:
+        if corpus is not None:
+            corpus.close()
+        os.remove(file_name)
+
+
+def scaling_benchmark(adaptation, sizes: List[int], functions=("nameFromDump", "calculateFingerprint")) -> Dict[str, List[float]]:
+    # Seconds per step and corpus size. Splitting the file into patches is where list concatenations turn quadratic. The
+    # memory-mapped corpus is read lazily while splitting, so the raw messages are never all held as lists
+    result: Dict[str, List[float]] = {}
+    banks = seed_banks(adaptation)
+    for size in sizes:
+        with synthetic_corpus(adaptation, size) as corpus:
+            start = time.perf_counter()
+            programs = list(split_programs(adaptation, corpus.messages()))
+            result.setdefault("split_programs", []).append(time.perf_counter() - start)
+            for function_name in functions:
+                if hasattr(adaptation, function_name):
+                    function = getattr(adaptation, function_name)
+                    start = time.perf_counter()
+                    for program in programs:
+                        function(program)
+                    result.setdefault(function_name, []).append(time.perf_counter() - start)
+        if banks:
+            # A corpus of bank dumps holding about as many patches
+            with synthetic_corpus(adaptation, max(1, size // patches_per_bank(adaptation, banks[0])), banks=True) as corpus:
+                start = time.perf_counter()
+                for bank in corpus.messages():
+                    adaptation.extractPatchesFromBank(bank)
+                result.setdefault("extractPatchesFromBank", []).append(time.perf_counter() - start)
+    return result
+
+
+def scaling_exponent(sizes: List[int], seconds: List[float]) -> float:
+    # Slope in the log-log plot between the smallest and the largest corpus, 1 is linear and 2 quadratic
+    if len(sizes) < 2 or seconds[0] <= 0 or seconds[-1] <= 0:
+        return math.nan
+    return math.log(seconds[-1] / seconds[0]) / math.log(sizes[-1] / sizes[0])
+
+
+def plot_scaling(name, sizes, timings, file_name):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots()
+    for step, seconds in timings.items():
+        axes.loglog(sizes, seconds, marker="o", label=step)
+    axes.set_xlabel("patches")
+    axes.set_ylabel("seconds")
+    axes.set_title(name)
+    axes.legend()
+    figure.savefig(file_name)
+
+
+if __name__ == "__main__":
+    adaptation = load_adaptation(sys.argv[1])
+    corpus_sizes = [int(x) for x in sys.argv[2:]] or [10000, 30000, 100000]
+    timings = scaling_benchmark(adaptation, corpus_sizes)
+    for step, seconds in timings.items():
+        print(f"{step}: " + ", ".join(f"{size} in {s * 1000:.0f} ms" for size, s in zip(corpus_sizes, seconds)) +
+              f", exponent {scaling_exponent(corpus_sizes, seconds):.2f}")
+    try:
+        plot_scaling(adaptation.name(), corpus_sizes, timings, "scaling.png")
+        print("Plot written to scaling.png")
+    except ImportError:
+        print("Install matplotlib to plot the scaling curves")
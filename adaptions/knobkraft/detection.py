@@ -0,0 +1,144 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import asyncio
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from .identity_routing import IdentityReplyRouter
+
+#
+# Parallel device detection. Instead of probing one adaptation after the other and sleeping its wait time after each,
+# all detect messages of all adaptations (and all 16 channels where needed) are sent to an output in one paced burst.
+# Identical messages, e.g. the universal device inquiry used by many adaptations, are sent only once. Replies are matched
+# by content as they arrive, using the identity reply signatures of the adaptations to only ask those adaptations'
+# channelIfValidDeviceResponse() a reply can belong to, and the output is done when the longest wait window has
+# expired. Without an extra routing table it is not possible to tell which output a reply belongs to if several outputs
+# are probed at the same time, so outputs are probed one after the other, but each only takes a single wait window.
+#
+# The MIDI system is anything with the methods of LoopbackMidi, i.e. send(output, message) and add_listener(callback).
+#
+
+default_wait_milliseconds = 200  # Same default as GenericAdaptation::deviceDetectSleepMS
+
+
+class Detection(NamedTuple):
+    synth: str
+    output: str
+    input: str
+    channel: int
+
+
+_message_lengths = {0x80: 3, 0x90: 3, 0xa0: 3, 0xb0: 3, 0xc0: 2, 0xd0: 2, 0xe0: 3}
+
+
+def split_midi_messages(data: List[int]) -> List[List[int]]:
+    # createDeviceDetectMessage() may return several messages in one list, sysex or short messages without running status
+    result = []
+    index = 0
+    while index < len(data):
+        if data[index] == 0xf0:
+            end = data.index(0xf7, index) + 1
+        else:
+            end = index + _message_lengths.get(data[index] & 0xf0, 1)
+        result.append(list(data[index:end]))
+        index = end
+    return result
+
+
+class DetectionProbe:
+
+    def __init__(self, adaptation):
+        self.adaptation = adaptation
+        self.name = adaptation.name()
+        self.wait_milliseconds = adaptation.deviceDetectWaitMilliseconds() if hasattr(adaptation, "deviceDetectWaitMilliseconds") \
+            else default_wait_milliseconds
+        channel_specific = adaptation.needsChannelSpecificDetection() if hasattr(adaptation, "needsChannelSpecificDetection") else True
+        channels = range(16) if channel_specific else [0]
+        self.messages = [m for channel in channels for m in split_midi_messages(adaptation.createDeviceDetectMessage(channel))]
+
+    def channel(self, message) -> int:
+        try:
+            return self.adaptation.channelIfValidDeviceResponse(message)
+        except Exception as e:
+            print(f"Error in channelIfValidDeviceResponse of {self.name}: {e}")
+            return -1
+
+
+class DetectionScheduler:
+
+    def __init__(self, midi, adaptations, pace_milliseconds=2):
+        self.midi = midi
+        self.pace = pace_milliseconds / 1000.0
+        # A negative wait time is the old way to opt out of detection
+        self.probes = [p for p in (DetectionProbe(a) for a in adaptations) if p.wait_milliseconds >= 0]
+        self.router = IdentityReplyRouter(self.probes, lambda probe: probe.adaptation)
+
+    async def detect_on_output(self, output) -> List[Detection]:
+        found: Dict[str, Detection] = {}
+
+        def on_message(input_name, message):
+            for probe in self.router.candidates(message):
+                if probe.name not in found:
+                    channel = probe.channel(message)
+                    if 0 <= channel < 16:
+                        found[probe.name] = Detection(probe.name, output, input_name, channel)
+
+        remove_listener = self.midi.add_listener(on_message)
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time()
+            sent = set()
+            for probe in self.probes:
+                for message in probe.messages:
+                    if tuple(message) not in sent:
+                        sent.add(tuple(message))
+                        self.midi.send(output, message)
+                        await asyncio.sleep(self.pace)
+                # Each adaptation's window starts after its last message went out
+                deadline = max(deadline, loop.time() + probe.wait_milliseconds / 1000.0)
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+        finally:
+            remove_listener()
+        return list(found.values())
+
+    async def detect(self, outputs) -> List[Detection]:
+        result = []
+        for output in outputs:
+            result.extend(await self.detect_on_output(output))
+        return result
+
+
+def detect_devices(midi, adaptations, outputs, pace_milliseconds=2) -> List[Detection]:
+    return asyncio.run(DetectionScheduler(midi, adaptations, pace_milliseconds).detect(outputs))
+
+
+class LoopbackMidi:
+    # Stand-in for the MIDI system, connecting outputs to simulated synths that reply on an input after some latency
+
+    def __init__(self, latency_milliseconds=5):
+        self.latency = latency_milliseconds / 1000.0
+        self.synths: Dict[str, List] = {}
+        self.listeners: List[Callable] = []
+        self.sent: List = []
+
+    def connect(self, output, input_name, responder: Callable[[List[int]], Optional[List[int]]]):
+        # The responder gets every message sent to the output and returns the reply, or None
+        self.synths.setdefault(output, []).append((input_name, responder))
+
+    def add_listener(self, callback: Callable) -> Callable:
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback)
+
+    def send(self, output, message):
+        self.sent.append((output, message))
+        loop = asyncio.get_running_loop()
+        for input_name, responder in self.synths.get(output, []):
+            reply = responder(message)
+            if reply is not None:
+                loop.call_later(self.latency, self._deliver, input_name, reply)
+
+    def _deliver(self, input_name, message):
+        for listener in list(self.listeners):
+            listener(input_name, message)
@@ -0,0 +1,53 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+from typing import Dict, List, Tuple
+
+__all__ = ["is_identity_reply", "IdentityReplyRouter"]
+
+#
+# Most adaptations detect their synth by the Universal Identity Reply
+#
+#     F0 7E <channel> 06 02 <manufacturer> <family> <member> <version> F7
+#
+# An adaptation can declare which replies are its own by implementing the optional function
+#
+#     def identityReplySignature() -> List[List[int]]
+#
+# returning one or more byte sequences that must follow the 06 02, e.g. [[0x42, 0x58, 0x00]] for manufacturer Korg and
+# family MS2000. The router looks up these signatures in a dictionary, so an incoming reply is only handed to the
+# channelIfValidDeviceResponse() of the adaptations it can belong to, instead of to all of them. Adaptations without
+# a signature still see every message.
+#
+
+_identity_reply_header = (0xf0, 0x7e)
+_signature_offset = 5
+
+
+def is_identity_reply(message) -> bool:
+    return len(message) > _signature_offset and tuple(message[:2]) == _identity_reply_header and message[3] == 0x06 and message[4] == 0x02
+
+
+class IdentityReplyRouter:
+
+    def __init__(self, items, adaptation=lambda item: item):
+        # items are adaptations or anything that knows its adaptation, e.g. the probes of the detection scheduler
+        self.table: Dict[Tuple, List] = {}
+        self.fallback = []
+        for item in items:
+            a = adaptation(item)
+            if hasattr(a, "identityReplySignature"):
+                for signature in a.identityReplySignature():
+                    self.table.setdefault(tuple(signature), []).append(item)
+            else:
+                self.fallback.append(item)
+        self.lengths = sorted(set(len(signature) for signature in self.table))
+
+    def candidates(self, message) -> List:
+        result = []
+        if is_identity_reply(message):
+            for length in self.lengths:
+                result.extend(self.table.get(tuple(message[_signature_offset:_signature_offset + length]), []))
+        return result + self.fallback
@@ -0,0 +1,191 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import hashlib
+import json
+import os
+from typing import Dict, List
+
+from .adaptation_module import adaptation_source_files, load_adaptation, source_name
+
+__all__ = ["manifest_version", "api_function_names", "is_adaptation_file", "file_hash", "capability_groups",
+           "property_functions", "describe_adaptation", "inspect_adaptation", "AdaptationManifest",
+           "adaptation_manifest", "capability_matrix"]
+
+#
+# The manifest records for each adaptation file its name(), which functions of the adaptation API it implements, which
+# capabilities these make up, and the values of the functions that just return a constant like the bank sizes, so the
+# Orm can list, display and detect synths without importing all adaptation modules at startup. An entry is reused as
+# long as the file's modification time and size are unchanged, or if they changed but the content hash is still the same.
+# The same check is done for the modules of the adaptation directory the adaptation uses, e.g.
+# sequential/GenericSequential.py, as these install most of the functions.
+#
+# The same information for all adaptations of a directory, without the file bookkeeping, is the capability matrix
+#
+#     python -m knobkraft.manifest <adaptation directory> capabilities.json
+#
+
+manifest_version = 4
+
+# Same list as kAdapatationPythonFunctionNames in GenericAdaptation.cpp
+api_function_names = ["name", "numberOfBanks", "numberOfPatchesPerBank", "bankDescriptors", "createDeviceDetectMessage",
+                      "channelIfValidDeviceResponse", "needsChannelSpecificDetection", "deviceDetectWaitMilliseconds",
+                      "nameFromDump", "isDefaultName", "renamePatch", "isEditBufferDump", "isPartOfEditBufferDump",
+                      "createEditBufferRequest", "convertToEditBuffer", "isSingleProgramDump", "isPartOfSingleProgramDump",
+                      "createProgramDumpRequest", "convertToProgramDump", "numberFromDump", "createBankDumpRequest",
+                      "isPartOfBankDump", "isBankDumpFinished", "bankDumpProgress", "extractPatchesFromBank", "numberOfLayers",
+                      "layerName", "setLayerName", "generalMessageDelay", "calculateFingerprint", "friendlyBankName",
+                      "friendlyProgramName", "setupHelp", "storedTags", "parameterArrayFromDump",
+                      "identityReplySignature", "wireBytesPerSecond", "receiveBufferSize"]
+
+
+def is_adaptation_file(file_name) -> bool:
+    # Same filter as GenericAdaptation::allAdaptationsInOneDirectory
+    return file_name.endswith(".py") and not file_name.startswith("test_") and file_name != "conftest.py"
+
+
+def file_hash(file_name) -> str:
+    with open(file_name, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# A capability is available if all of its functions are implemented, same as in the hasCapability() methods of the Orm
+capability_groups = {"Edit Buffer Capability": ["createEditBufferRequest", "isEditBufferDump", "convertToEditBuffer"],
+                     "Program Dump Capability": ["createProgramDumpRequest", "isSingleProgramDump", "convertToProgramDump"],
+                     "Bank Dump Capability": ["createBankDumpRequest", "isPartOfBankDump", "isBankDumpFinished", "extractPatchesFromBank"],
+                     "Has Banks Capability": ["numberOfBanks", "numberOfPatchesPerBank"],
+                     "Has Bank Descriptors Capability": ["bankDescriptors"],
+                     "Layer Capability": ["numberOfLayers", "layerName"]}
+
+# Functions without arguments whose results are recorded, so the Orm needs not call them before the module is imported
+property_functions = ["numberOfBanks", "numberOfPatchesPerBank", "needsChannelSpecificDetection", "deviceDetectWaitMilliseconds",
+                      "generalMessageDelay", "wireBytesPerSecond", "receiveBufferSize"]
+
+
+def describe_adaptation(adaptation) -> Dict:
+    properties = {}
+    for function_name in property_functions:
+        if hasattr(adaptation, function_name):
+            try:
+                value = getattr(adaptation, function_name)()
+            except Exception as e:
+                print(f"Adaptation {adaptation.__name__}: {function_name} failed, not recorded: {e}")
+                continue
+            if isinstance(value, (bool, int)):
+                properties[function_name] = value
+    return {"module": adaptation.__name__,
+            "name": adaptation.name(),
+            "functions": [f for f in api_function_names if hasattr(adaptation, f)],
+            "capabilities": [c for c, functions in capability_groups.items() if all(hasattr(adaptation, f) for f in functions)],
+            "properties": properties}
+
+
+def inspect_adaptation(adaptation_file) -> Dict:
+    # This is the expensive part, the adaptation module needs to be imported to find out what it implements. The sources
+    # are the Python files it depends on, relative to the adaptation directory where they are in it
+    adaptation = load_adaptation(adaptation_file)
+    directory = os.path.dirname(os.path.abspath(adaptation_file))
+    return dict(describe_adaptation(adaptation), sources=[source_name(f, directory) for f in adaptation_source_files(adaptation)])
+
+
+class AdaptationManifest:
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(manifest_file, "r") as f:
+                content = json.load(f)
+            if content.get("version") == manifest_version:
+                self.entries = content["adaptations"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            # No manifest yet or unreadable, it will be rebuilt
+            pass
+
+    def _unchanged(self, path, recorded) -> bool:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if recorded["mtime"] == stat.st_mtime and recorded["size"] == stat.st_size:
+            return True
+        if recorded["hash"] == file_hash(path):
+            # Touched, but not modified
+            recorded.update(mtime=stat.st_mtime, size=stat.st_size)
+            self.dirty = True
+            return True
+        return False
+
+    def entry(self, adaptation_file) -> Dict:
+        path = os.path.abspath(adaptation_file)
+        cached = self.entries.get(path)
+        if cached is not None and self._unchanged(path, cached) and \
+                all(self._unchanged(dependency, state) for dependency, state in cached["dependencies"].items()):
+            return cached
+        stat = os.stat(path)
+        cached = dict(inspect_adaptation(path), mtime=stat.st_mtime, size=stat.st_size, hash=file_hash(path))
+        directory = os.path.dirname(path)
+        cached["dependencies"] = {}
+        for source in cached["sources"]:
+            dependency = os.path.normpath(os.path.join(directory, source))
+            if dependency != path:
+                dependency_stat = os.stat(dependency)
+                cached["dependencies"][dependency] = {"mtime": dependency_stat.st_mtime, "size": dependency_stat.st_size,
+                                                      "hash": file_hash(dependency)}
+        self.entries[path] = cached
+        self.dirty = True
+        return cached
+
+    def entries_for_directory(self, directory) -> List[Dict]:
+        # Adaptations failing to load are not recorded, and are tried again on the next run
+        result = []
+        for file_name in sorted(os.listdir(directory)):
+            if is_adaptation_file(file_name):
+                try:
+                    result.append(dict(self.entry(os.path.join(directory, file_name)), path=os.path.join(directory, file_name)))
+                except Exception as e:
+                    print(f"Adaptation {file_name} failed to load: {e}")
+        return result
+
+    def save(self):
+        if not self.dirty:
+            return
+        # Drop entries of files that don't exist anymore, and write atomically so a crash can't leave half a manifest
+        self.entries = {path: entry for path, entry in self.entries.items() if os.path.isfile(path)}
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": manifest_version, "adaptations": self.entries}, f, indent=1)
+        os.replace(temp_file, self.manifest_file)
+        self.dirty = False
+
+
+def adaptation_manifest(directory, manifest_file) -> List[Dict]:
+    # Entry point for the Orm, returns one entry per adaptation in the directory, and updates the manifest file
+    manifest = AdaptationManifest(manifest_file)
+    result = manifest.entries_for_directory(directory)
+    manifest.save()
+    return result
+
+
+def capability_matrix(directory) -> Dict:
+    # One pass over the directory, importing each adaptation once
+    result = {}
+    for file_name in sorted(os.listdir(directory)):
+        if is_adaptation_file(file_name):
+            try:
+                result[file_name] = inspect_adaptation(os.path.join(directory, file_name))
+            except Exception as e:
+                print(f"Adaptation {file_name} failed to load: {e}")
+    return {"version": manifest_version, "capability_groups": capability_groups, "adaptations": result}
+
+
+if __name__ == "__main__":
+    import sys
+
+    matrix = capability_matrix(sys.argv[1])
+    with open(sys.argv[2], "w") as f:
+        json.dump(matrix, f, indent=1)
+    print(f"Wrote capabilities of {len(matrix['adaptations'])} adaptations to {sys.argv[2]}")
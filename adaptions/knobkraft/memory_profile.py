@@ -0,0 +1,159 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import math
+import sys
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional
+
+from .adaptation_module import load_adaptation
+from .corpus import seed_programs, split_programs, synthetic_corpus
+
+#
+# Allocation profiling of adaptation functions with tracemalloc. For every call the peak allocation (the most memory
+# held at any point during the call, above what was held before) and the net allocation (what is still held after the
+# call returned, normally the result) are recorded together with the size of the input. Functions whose peak grows
+# faster than their input, e.g. by repeatedly concatenating lists, are flagged by the exponent of a log-log fit of
+# peak over input size. Run
+#
+#     python -m knobkraft.memory_profile YamahaDX7.py 1000 10000
+#
+# to print the profile of the test data calls and of splitting synthetic corpora of the given sizes.
+#
+
+# Peak allocation growing with input size to a power above this is reported as superlinear
+superlinear_exponent = 1.3
+
+profiled_program_functions = ["nameFromDump", "calculateFingerprint", "numberFromDump", "parameterArrayFromDump", "storedTags"]
+
+
+class AllocationSample(NamedTuple):
+    input_size: int
+    peak: int
+    net: int
+
+
+def _reset_peak():
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        # Python 3.8 has no reset_peak, restarting forgets all traces and with them the peak
+        frames = tracemalloc.get_traceback_limit()
+        tracemalloc.stop()
+        tracemalloc.start(frames)
+
+
+def measure_allocations(function, *args):
+    # Returns the result of the call and its allocation sample, the size of the input is the length of the first argument
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        _reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = function(*args)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    input_size = len(args[0]) if args and hasattr(args[0], "__len__") else 0
+    return result, AllocationSample(input_size, max(0, peak - before), after - before)
+
+
+def growth_exponent(samples: List[AllocationSample]) -> Optional[float]:
+    # Least squares slope of log(peak) over log(input size). None if the input sizes don't vary enough to tell
+    points = [(math.log(s.input_size), math.log(s.peak)) for s in samples if s.input_size > 0 and s.peak > 0]
+    if len(points) < 2:
+        return None
+    xs = [x for x, _ in points]
+    if max(xs) - min(xs) < math.log(4):
+        return None
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class AllocationProfile:
+
+    def __init__(self):
+        self.samples: Dict[str, Dict[str, List[AllocationSample]]] = {}
+
+    def call(self, adaptation_name, function_name, function, *args):
+        result, sample = measure_allocations(function, *args)
+        self.samples.setdefault(adaptation_name, {}).setdefault(function_name, []).append(sample)
+        return result
+
+    def add(self, adaptation_name, function_name, sample: AllocationSample):
+        self.samples.setdefault(adaptation_name, {}).setdefault(function_name, []).append(sample)
+
+    def superlinear(self) -> List[str]:
+        result = []
+        for adaptation_name, functions in sorted(self.samples.items()):
+            for function_name, samples in sorted(functions.items()):
+                exponent = growth_exponent(samples)
+                if exponent is not None and exponent > superlinear_exponent:
+                    result.append(f"{adaptation_name} {function_name}: peak allocation grows with input size to the power {exponent:.2f}")
+        return result
+
+    def report(self) -> List[str]:
+        lines = []
+        for adaptation_name, functions in sorted(self.samples.items()):
+            total_peak = max(s.peak for samples in functions.values() for s in samples)
+            lines.append(f"{adaptation_name}: peak {total_peak / 1024:.1f} kB")
+            for function_name, samples in sorted(functions.items()):
+                exponent = growth_exponent(samples)
+                lines.append(f"    {function_name}: {len(samples)} calls, peak {max(s.peak for s in samples) / 1024:.1f} kB, "
+                             f"net {sum(s.net for s in samples) / len(samples) / 1024:.1f} kB per call" +
+                             (f", growth exponent {exponent:.2f}" if exponent is not None else ""))
+        return lines
+
+
+def profile_calls(profile: AllocationProfile, adaptation, adaptation_name, programs: List[List[int]], messages: List[List[int]]):
+    # Profile the API calls an import makes, on the programs and the raw messages of a corpus
+    for function_name in profiled_program_functions:
+        if hasattr(adaptation, function_name):
+            for program in programs:
+                profile.call(adaptation_name, function_name, getattr(adaptation, function_name), program)
+    if hasattr(adaptation, "renamePatch"):
+        for program in programs:
+            profile.call(adaptation_name, "renamePatch", adaptation.renamePatch, program, "new name")
+    if hasattr(adaptation, "extractPatchesFromBank") and hasattr(adaptation, "isPartOfBankDump"):
+        for message in messages:
+            if adaptation.isPartOfBankDump(message):
+                profile.call(adaptation_name, "extractPatchesFromBank", adaptation.extractPatchesFromBank, message)
+
+
+def profile_input_scaling(profile: AllocationProfile, adaptation_name, function_name, function, make_input, sizes: List[int]):
+    # For helpers that take data of any length, like unescaping sysex, make_input(size) creates an input of that size
+    for size in sizes:
+        profile.call(adaptation_name, function_name, function, make_input(size))
+
+
+def profile_corpus_scaling(profile: AllocationProfile, adaptation, adaptation_name, sizes: List[int]):
+    # Split synthetic corpora of growing size into programs, the peak should grow linearly with the corpus
+    if not seed_programs(adaptation):
+        return
+    for size in sizes:
+        with synthetic_corpus(adaptation, size) as corpus:
+            # The messages are read lazily from the memory-mapped corpus, so the peak is what splitting holds on to
+            _, sample = measure_allocations(lambda c: list(split_programs(adaptation, c.messages())), corpus)
+            profile.add(adaptation_name, "split_programs", sample)
+
+
+if __name__ == "__main__":
+    from .sysex import load_sysex
+
+    adaptation = load_adaptation(sys.argv[1])
+    allocation_profile = AllocationProfile()
+    test_dict = adaptation.test_data() if hasattr(adaptation, "test_data") else {}
+    all_messages = load_sysex(test_dict["sysex"]) if "sysex" in test_dict else []
+    profile_calls(allocation_profile, adaptation, sys.argv[1], seed_programs(adaptation), all_messages)
+    corpus_sizes = [int(x) for x in sys.argv[2:]]
+    if corpus_sizes:
+        profile_corpus_scaling(allocation_profile, adaptation, sys.argv[1], corpus_sizes)
+    print("\n".join(allocation_profile.report()))
+    for line in allocation_profile.superlinear():
+        print("Superlinear: " + line)
@@ -0,0 +1,136 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, List
+
+from .adaptation_module import adaptation_source_files, source_name
+
+#
+# Persistent cache of the metadata the adaptations derive from a patch, i.e. fingerprint, name, program number and
+# stored tags. Re-importing the same archives then doesn't run calculateFingerprint() and friends in Python again for
+# every patch. Entries are keyed by the adaptation name, a hash of the adaptation's source and a fast hash of the raw
+# patch bytes. The source hash covers the adaptation file and every Python module it uses outside of the standard
+# library, e.g. sequential/GenericSequential.py wherever it is installed, so editing any of them invalidates the entries
+# automatically. Entries of outdated sources stay in the file until cleanup() is called with the current adaptations,
+# as two adaptations may share a name, e.g. a built-in one and a copy in the user adaptation directory, and must not
+# delete each other's entries.
+#
+# The cache is used by the batch command line (python -m knobkraft.batch --cache). The Orm itself keeps the metadata
+# of imported patches in its patch database and does not use it.
+#
+
+metadata_functions = ["nameFromDump", "numberFromDump", "storedTags", "calculateFingerprint"]
+
+# SQLite allows at most 999 parameters per statement in older versions
+_lookup_chunk = 500
+
+
+def content_hash(message) -> bytes:
+    return hashlib.blake2b(bytes(message), digest_size=16).digest()
+
+
+def source_hash(adaptation) -> str:
+    directory = os.path.dirname(os.path.abspath(adaptation.__file__))
+    digest = hashlib.sha256()
+    for file_name in adaptation_source_files(adaptation):
+        digest.update(source_name(file_name, directory).encode("utf-8") + b"\0")
+        with open(file_name, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:32]
+
+
+def compute_metadata(adaptation, message) -> Dict:
+    result = {}
+    if hasattr(adaptation, "nameFromDump"):
+        result["name"] = adaptation.nameFromDump(message)
+    if hasattr(adaptation, "numberFromDump"):
+        result["number"] = adaptation.numberFromDump(message)
+    if hasattr(adaptation, "storedTags"):
+        result["tags"] = list(adaptation.storedTags(message))
+    if hasattr(adaptation, "calculateFingerprint"):
+        # On a copy, as some adaptations blank out the name in place
+        result["fingerprint"] = adaptation.calculateFingerprint(list(message))
+    return result
+
+
+class MetadataCache:
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.hits = 0
+        self.misses = 0
+        self._sources: Dict[int, str] = {}
+        self._connection = sqlite3.connect(file_name, timeout=30)
+        # Several batch workers may write to the same cache
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (adaptation TEXT NOT NULL, source TEXT NOT NULL, "
+                                 "content BLOB NOT NULL, data TEXT NOT NULL, PRIMARY KEY (adaptation, source, content)) WITHOUT ROWID")
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _source(self, adaptation) -> str:
+        key = id(adaptation)
+        if key not in self._sources:
+            self._sources[key] = source_hash(adaptation)
+        return self._sources[key]
+
+    def cleanup(self, adaptations) -> int:
+        # Deletes the entries of all other sources of the given adaptations' names, returns the number of entries deleted
+        current: Dict[str, set] = {}
+        for adaptation in adaptations:
+            current.setdefault(adaptation.name(), set()).add(self._source(adaptation))
+        deleted = 0
+        with self._connection:
+            for name, sources in current.items():
+                cursor = self._connection.execute(f"DELETE FROM metadata WHERE adaptation = ? AND source NOT IN ({','.join('?' * len(sources))})",
+                                                  [name] + sorted(sources))
+                deleted += cursor.rowcount
+        return deleted
+
+    def metadata(self, adaptation, message) -> Dict:
+        return self.metadata_batch(adaptation, [message])[0]
+
+    def metadata_batch(self, adaptation, messages) -> List[Dict]:
+        # One lookup per chunk of patches, and one transaction for all patches that had to be computed
+        name = adaptation.name()
+        source = self._source(adaptation)
+        hashes = [content_hash(message) for message in messages]
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique_hashes), _lookup_chunk):
+            chunk = unique_hashes[start:start + _lookup_chunk]
+            rows = self._connection.execute(f"SELECT content, data FROM metadata WHERE adaptation = ? AND source = ? AND content IN "
+                                            f"({','.join('?' * len(chunk))})", [name, source] + chunk)
+            found.update((content, json.loads(data)) for content, data in rows)
+        computed = []
+        result = []
+        for content, message in zip(hashes, messages):
+            if content in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                found[content] = compute_metadata(adaptation, message)
+                computed.append((name, source, content, json.dumps(found[content])))
+            result.append(dict(found[content]))
+        if computed:
+            with self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)", computed)
+        return result
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
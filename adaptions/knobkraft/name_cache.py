@@ -0,0 +1,133 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+__all__ = ["default_capacity", "name_caches", "patch_key", "NameCache", "memoize_names"]
+
+#
+# Bounded LRU cache for the names of patches. The patch grid redraws the names and layer names of all visible patches
+# often, and for many synths nameFromDump() and layerName() unescape or parse the whole patch every time. The Orm puts
+# memoizing wrappers of these functions into the function table of the adaptation (see memoize_names), keyed by the
+# patch bytes, so a patch is decoded once until it drops out of the cache. renamePatch() and setLayerName() evict the
+# patch they were given, and reloading the adaptation creates a new cache.
+#
+
+default_capacity = 4096
+
+memoized_functions = ["nameFromDump", "layerName"]
+invalidating_functions = ["renamePatch", "setLayerName"]
+
+# The cache of each adaptation module by name, to look at the hit rate
+name_caches: Dict[str, "NameCache"] = {}
+
+
+def patch_key(message):
+    # An immutable view of the patch. Sysex is all bytes, anything else falls back to a tuple
+    try:
+        return bytes(message)
+    except (ValueError, TypeError):
+        return tuple(message)
+
+
+class NameCache:
+
+    def __init__(self, capacity=default_capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # One entry per patch, holding the results of all memoized calls for it
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key, call):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and call in entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[call]
+            self.misses += 1
+        return False, None
+
+    def store(self, key, call, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {}
+            else:
+                self._entries.move_to_end(key)
+            entry[call] = value
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def resize(self, capacity):
+        with self._lock:
+            self.capacity = capacity
+            while len(self._entries) > capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def statistics(self) -> Dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / total if total > 0 else 0.0}
+
+
+def _memoized(function, function_name, cache: NameCache):
+    def wrapper(message, *args):
+        key = patch_key(message)
+        call = (function_name,) + args
+        found, value = cache.lookup(key, call)
+        if found:
+            return value
+        value = function(message, *args)
+        cache.store(key, call, value)
+        return value
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def _invalidating(function, cache: NameCache):
+    def wrapper(message, *args):
+        # Adaptations may change the message in place, so take the key before the call
+        key = patch_key(message)
+        try:
+            return function(message, *args)
+        finally:
+            cache.invalidate(key)
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def memoize_names(adaptation, capacity=None) -> Dict:
+    # The memoizing and invalidating wrappers of the adaptation's functions, by function name. The module itself is not
+    # changed, so tests and the worker pool still call the original functions
+    cache = NameCache(default_capacity if capacity is None else capacity)
+    name_caches[adaptation.__name__] = cache
+    result = {}
+    for function_name in memoized_functions:
+        if hasattr(adaptation, function_name):
+            result[function_name] = _memoized(getattr(adaptation, function_name), function_name, cache)
+    if result:
+        for function_name in invalidating_functions:
+            if hasattr(adaptation, function_name):
+                result[function_name] = _invalidating(getattr(adaptation, function_name), cache)
+    return result
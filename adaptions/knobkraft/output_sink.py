@@ -0,0 +1,124 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import sys
+import time
+from collections import deque
+from typing import List, Tuple
+
+__all__ = ["OutputBuffer", "OutputStream", "install_output_sink"]
+
+#
+# Replacement for sys.stdout and sys.stderr in the Orm. Everything the adaptations print is collected line by line into a
+# ring buffer, tagged with the adaptation module that printed it, and the Orm drains the buffer into its log on a timer
+# instead of checking for output after every call. Chatty adaptations are rate limited, errors are never suppressed.
+#
+
+
+def _printing_module(frame) -> str:
+    # The adaptation is the first top level module on the stack, helper packages like sequential have dotted names.
+    # Adaptations built on a generic class like TemplateAdaptation have no frame of their own module on the stack, as
+    # the Orm calls the installed bound methods directly. Their instance knows the module it was installed into
+    innermost = None
+    while frame is not None:
+        name = frame.f_globals.get("__name__", "")
+        if innermost is None:
+            innermost = name
+        if name and "." not in name and name != "__main__":
+            return name
+        installed_module = getattr(frame.f_locals.get("self"), "installed_module", None)
+        if isinstance(installed_module, str):
+            return installed_module
+        frame = frame.f_back
+    return innermost or "Adaptation"
+
+
+class OutputBuffer:
+
+    def __init__(self, max_lines=1000, lines_per_second=20, burst=100):
+        self.lines = deque(maxlen=max_lines)
+        self.lines_per_second = lines_per_second
+        self.burst = burst
+        self.buckets = {}  # tag -> (tokens, time of last refill)
+        self.suppressed = {}
+        self.lost = 0
+        self.streams = []
+
+    def _allowed(self, tag) -> bool:
+        now = time.monotonic()
+        tokens, last = self.buckets.get(tag, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.lines_per_second)
+        if tokens < 1:
+            self.buckets[tag] = (tokens, now)
+            return False
+        self.buckets[tag] = (tokens - 1, now)
+        return True
+
+    def append(self, tag, is_error, line):
+        if not is_error and not self._allowed(tag):
+            self.suppressed[tag] = self.suppressed.get(tag, 0) + 1
+            return
+        if len(self.lines) == self.lines.maxlen:
+            self.lost += 1
+        self.lines.append((tag, is_error, line))
+
+    def drain(self) -> List[Tuple[str, bool, str]]:
+        # Consecutive lines of the same adaptation and stream are joined into one log message
+        for stream in self.streams:
+            stream.flush()
+        result = []
+        while self.lines:
+            tag, is_error, line = self.lines.popleft()
+            if result and result[-1][0] == tag and result[-1][1] == is_error:
+                result[-1] = (tag, is_error, result[-1][2] + "\n" + line)
+            else:
+                result.append((tag, is_error, line))
+        for tag, count in self.suppressed.items():
+            result.append((tag, False, f"{count} lines of output suppressed"))
+        self.suppressed = {}
+        if self.lost > 0:
+            result.append(("Adaptation", True, f"{self.lost} lines of output lost"))
+            self.lost = 0
+        return result
+
+
+class OutputStream:
+    # Minimal file like object, print() calls write() for the text and the line end separately
+
+    def __init__(self, buffer: OutputBuffer, is_error: bool):
+        self.buffer = buffer
+        self.is_error = is_error
+        self.pending = ""
+        self.pending_tag = None
+        buffer.streams.append(self)
+
+    def write(self, text):
+        if not self.pending:
+            self.pending_tag = _printing_module(sys._getframe(1))
+        if "\n" not in text:
+            self.pending += text
+            return len(text)
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.buffer.append(self.pending_tag, self.is_error, line.rstrip())
+        if self.pending:
+            self.pending_tag = _printing_module(sys._getframe(1))
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.buffer.append(self.pending_tag, self.is_error, self.pending.rstrip())
+            self.pending = ""
+
+    def isatty(self):
+        return False
+
+
+def install_output_sink(max_lines=1000, lines_per_second=20, burst=100) -> OutputBuffer:
+    buffer = OutputBuffer(max_lines, lines_per_second, burst)
+    sys.stdout = OutputStream(buffer, False)
+    sys.stderr = OutputStream(buffer, True)
+    return buffer
@@ -0,0 +1,168 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+from typing import Dict, List, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Columnar cache of the parameter arrays returned by the optional parameterArrayFromDump() adaptation function. All
+# patches of a synth are kept in one matrix with a row per patch and a column per parameter, so a query like
+# "cutoff below 40" is a single vectorized comparison, e.g.
+#
+#     cache.filter_expression("P[:, 20] < 40")
+#
+# instead of decoding the sysex of every patch in Python. Patches with shorter parameter arrays are padded with -1.
+#
+# The same matrix answers "find similar patches": every parameter is scaled to 0..1 over its range in the cache, and
+# the k nearest patches by Euclidean distance are found for a whole batch of queries with a few matrix products. The
+# padding counts neither for the ranges nor for the distances, only the parameters both patches have are compared. The cache
+# can be saved to and loaded from a .npz file, so it only needs to be extended by the newly imported patches.
+#
+
+
+def _npz_file_name(file_name) -> str:
+    # numpy.savez appends .npz to a file name without it, but numpy.load does not
+    file_name = str(file_name)
+    return file_name if file_name.endswith(".npz") else file_name + ".npz"
+
+
+class ParameterCache:
+
+    def __init__(self, adaptation):
+        if numpy is None:
+            raise ImportError("The parameter cache requires numpy, please install it with pip install numpy")
+        if not hasattr(adaptation, "parameterArrayFromDump"):
+            raise Exception(f"Adaptation {adaptation.name()} does not implement parameterArrayFromDump")
+        self.adaptation = adaptation
+        self.keys = []
+        self.rows: Dict = {}
+        self._pending = []
+        self._matrix = numpy.zeros((0, 0), dtype=numpy.int16)
+        self._range = None
+        self._vectors = None
+
+    def add(self, key, message):
+        # The key identifies the patch, normally its fingerprint, so adding the same patch again is free
+        if key not in self.rows:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+            self._pending.append(self.adaptation.parameterArrayFromDump(message))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def parameters(self):
+        if self._pending:
+            # Grow the matrix once for all patches added since the last query
+            width = max([self._matrix.shape[1]] + [len(p) for p in self._pending])
+            matrix = numpy.full((len(self.keys), width), -1, dtype=numpy.int16)
+            matrix[:self._matrix.shape[0], :self._matrix.shape[1]] = self._matrix
+            for row, parameters in enumerate(self._pending, start=self._matrix.shape[0]):
+                matrix[row, :len(parameters)] = parameters
+            self._matrix = matrix
+            self._pending = []
+            self._vectors = None
+        return self._matrix
+
+    def _scaled(self, parameters):
+        # Scaled to 0..1 and the mask of the parameters present, the padding is scaled to 0
+        low, high = self._range
+        present = parameters != -1
+        scaled = numpy.where(present, (parameters.astype(numpy.float32) - low) / high, 0).astype(numpy.float32)
+        return scaled, present.astype(numpy.float32)
+
+    def vectors(self):
+        # The scaled parameter matrix and the mask of the parameters each patch has, recalculated only after patches were
+        # added. The range of each parameter is taken over the patches that have it, a parameter nobody has gets 0..1
+        parameters = self.parameters
+        if self._vectors is None:
+            present = parameters != -1
+            largest, smallest = numpy.iinfo(numpy.int16).max, numpy.iinfo(numpy.int16).min
+            low = numpy.where(present, parameters, largest).min(axis=0, initial=largest).astype(numpy.float32)
+            high = numpy.where(present, parameters, smallest).max(axis=0, initial=smallest).astype(numpy.float32)
+            missing = low > high
+            low[missing] = 0
+            high[missing] = 0
+            self._range = (low, numpy.maximum(high - low, 1))
+            self._vectors = self._scaled(parameters)
+        return self._vectors
+
+    def nearest(self, queries, k=20, exclude=None) -> List[List[Tuple]]:
+        # queries is a list of parameter arrays, the result for each is a list of (key, distance) of the k closest patches.
+        # The rows in exclude, one per query or None, are skipped, so a patch does not find itself
+        vectors, present = self.vectors()
+        if len(self.keys) == 0:
+            return [[] for _ in queries]
+        query_matrix = numpy.full((len(queries), vectors.shape[1]), -1, dtype=numpy.int16)
+        for row, parameters in enumerate(queries):
+            width = min(len(parameters), vectors.shape[1])
+            query_matrix[row, :width] = parameters[:width]
+        query_vectors, query_present = self._scaled(query_matrix)
+        # Only the parameters both patches have count. With the padding scaled to 0 the sum over those of (q - v)^2 is
+        # q^2 . mask_v + mask_q . v^2 - 2 q . v, for all pairs at once
+        distances = (query_vectors * query_vectors) @ present.T + query_present @ (vectors * vectors).T - 2 * query_vectors @ vectors.T
+        if exclude is not None:
+            for row, excluded in enumerate(exclude):
+                if excluded is not None:
+                    distances[row, excluded] = numpy.inf
+        count = min(k, len(self.keys))
+        closest = numpy.argpartition(distances, count - 1, axis=1)[:, :count]
+        result = []
+        for row, candidates in enumerate(closest):
+            # Equal distances in the order the patches were added
+            ordered = candidates[numpy.lexsort((candidates, distances[row, candidates]))]
+            result.append([(self.keys[c], float(numpy.sqrt(max(distances[row, c], 0)))) for c in ordered if numpy.isfinite(distances[row, c])])
+        return result
+
+    def similar(self, message, k=20) -> List[Tuple]:
+        return self.nearest([self.adaptation.parameterArrayFromDump(message)], k)[0]
+
+    def similar_to(self, keys, k=20) -> List[List[Tuple]]:
+        # The k most similar other patches for each of the given keys of cached patches
+        parameters = self.parameters
+        rows = [self.rows[key] for key in keys]
+        return self.nearest([parameters[row] for row in rows], k, exclude=rows)
+
+    def save(self, file_name) -> str:
+        # Keys must be strings, e.g. fingerprints, so the file can be read without pickle. Returns the file name written
+        file_name = _npz_file_name(file_name)
+        numpy.savez(file_name, keys=numpy.array(self.keys, dtype=str), parameters=self.parameters)
+        return file_name
+
+    @classmethod
+    def load(cls, adaptation, file_name):
+        cache = cls(adaptation)
+        with numpy.load(_npz_file_name(file_name), allow_pickle=False) as data:
+            cache.keys = [str(key) for key in data["keys"]]
+            cache._matrix = data["parameters"].astype(numpy.int16)
+        cache.rows = {key: row for row, key in enumerate(cache.keys)}
+        return cache
+
+    def filter(self, predicate) -> List:
+        # The predicate is called once with the whole matrix and returns a boolean mask with one entry per patch
+        mask = numpy.asarray(predicate(self.parameters), dtype=bool)
+        return [self.keys[row] for row in numpy.flatnonzero(mask)]
+
+    def filter_expression(self, expression: str) -> List:
+        code = compile(expression, "<parameter query>", "eval")
+        return self.filter(lambda parameters: eval(code, {"numpy": numpy, "np": numpy, "P": parameters}))
+
+
+class ParameterCaches:
+    # One parameter cache per synth, for all adaptations that implement parameterArrayFromDump
+
+    def __init__(self):
+        self.caches: Dict[str, ParameterCache] = {}
+
+    def cache_for(self, adaptation) -> ParameterCache:
+        name = adaptation.name()
+        if name not in self.caches:
+            self.caches[name] = ParameterCache(adaptation)
+        return self.caches[name]
@@ -0,0 +1,159 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import sys
+from typing import Dict, List, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Near-duplicate detection for patches. calculateFingerprint() only finds exact duplicates, but libraries are full of
+# patches that differ in a single parameter. Comparing all pairs is quadratic, so every patch gets a MinHash signature
+# instead: each byte of the payload together with its position is a shingle, and for every one of the hash functions
+# the signature stores the smallest hash over all shingles. The fraction of equal signature entries estimates the
+# Jaccard similarity of two patches, and locality sensitive hashing (LSH) puts patches with equal bands of the signature
+# into the same bucket. Only patches sharing a bucket are compared, which makes clustering near-linear.
+#
+# The payload is what the adaptation's fingerprint hashes where the generic adaptations expose it, i.e. the unescaped
+# data of GenericSequential or the Roland messages with name, program position and checksums blanked out. Renamed or
+# moved copies are therefore identical, and a tweaked parameter changes one shingle. Other adaptations are compared on
+# their raw messages. Run
+#
+#     python -m knobkraft.similarity DSI_Mopho.py ~/sounds
+#
+# to print the near-duplicate clusters of all patches found in the given files or directories.
+#
+
+default_threshold = 0.9
+default_permutations = 128
+
+
+def fingerprint_payload(adaptation, message) -> List[int]:
+    # The generic adaptations install bound methods, so the object behind calculateFingerprint can give us its payload
+    owner = getattr(getattr(adaptation, "calculateFingerprint", None), "__self__", None)
+    if owner is not None and hasattr(owner, "fingerprint_payload"):
+        return owner.fingerprint_payload(message)
+    return list(message)
+
+
+def shingles(payload: List[int]):
+    # Byte value and position, so patches that differ in one parameter share all but one shingle
+    data = numpy.asarray(payload, dtype=numpy.uint64) & numpy.uint64(0xff)
+    return numpy.arange(len(data), dtype=numpy.uint64) * numpy.uint64(256) + data
+
+
+def lsh_parameters(permutations: int, threshold: float) -> Tuple[int, int]:
+    # Bands and rows per band, with b * r = permutations, whose S-curve (1/b)^(1/r) is closest to the threshold
+    candidates = [(permutations // rows, rows) for rows in range(1, permutations + 1) if permutations % rows == 0]
+    return min(candidates, key=lambda c: abs((1.0 / c[0]) ** (1.0 / c[1]) - threshold))
+
+
+class MinHash:
+    # Multiply-shift hashing, (a * x + b) mod 2^64 keeping the upper 32 bits, which avoids a slow 64 bit modulo
+
+    def __init__(self, permutations=default_permutations, seed=1):
+        if numpy is None:
+            raise ImportError("Near-duplicate detection requires numpy, please install it with pip install numpy")
+        rng = numpy.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 64, permutations, dtype=numpy.uint64, endpoint=False)[:, None] | numpy.uint64(1)
+        self.b = rng.integers(0, 1 << 64, permutations, dtype=numpy.uint64, endpoint=False)[:, None]
+
+    def signature(self, shingle_array):
+        if len(shingle_array) == 0:
+            return numpy.full(len(self.a), 1 << 32, dtype=numpy.uint64)
+        return ((self.a * shingle_array[None, :] + self.b) >> numpy.uint64(32)).min(axis=1)
+
+
+class NearDuplicateIndex:
+    # The patches of one synth, identified by a key, normally their fingerprint
+
+    def __init__(self, adaptation, threshold=default_threshold, permutations=default_permutations, seed=1):
+        self.adaptation = adaptation
+        self.threshold = threshold
+        self.minhash = MinHash(permutations, seed)
+        self.bands, self.rows = lsh_parameters(permutations, threshold)
+        self.keys = []
+        self.index: Dict = {}
+        self.signatures = []
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+
+    def signature(self, message):
+        return self.minhash.signature(shingles(fingerprint_payload(self.adaptation, message)))
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key, message):
+        if key in self.index:
+            return
+        signature = self.signature(message)
+        row = len(self.keys)
+        self.index[key] = row
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(band_key, []).append(row)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _similarity(self, signature_a, signature_b) -> float:
+        return float(numpy.count_nonzero(signature_a == signature_b)) / len(signature_a)
+
+    def similarity(self, key_a, key_b) -> float:
+        # Estimated Jaccard similarity of the two patches' shingles
+        return self._similarity(self.signatures[self.index[key_a]], self.signatures[self.index[key_b]])
+
+    def similar(self, message) -> List[Tuple]:
+        # Keys and estimated similarities of the indexed patches at or above the threshold, most similar first
+        signature = self.signature(message)
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates.update(self.buckets[band].get(band_key, []))
+        result = [(self.keys[row], self._similarity(signature, self.signatures[row])) for row in sorted(candidates)]
+        return sorted([r for r in result if r[1] >= self.threshold], key=lambda r: -r[1])
+
+    def clusters(self) -> List[List]:
+        # Groups of two or more near-duplicate keys, in the order the keys were added. Each member of a bucket is only
+        # compared to the first one in it, so a bucket of a thousand identical patches does not turn quadratic
+        parent = list(range(len(self.keys)))
+
+        def find(row):
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for buckets in self.buckets:
+            for rows in buckets.values():
+                first = rows[0]
+                for other in rows[1:]:
+                    root_first, root_other = find(first), find(other)
+                    if root_first != root_other and self._similarity(self.signatures[first], self.signatures[other]) >= self.threshold:
+                        parent[max(root_first, root_other)] = min(root_first, root_other)
+        groups: Dict[int, List] = {}
+        for row, key in enumerate(self.keys):
+            groups.setdefault(find(row), []).append(key)
+        return [group for _, group in sorted(groups.items()) if len(group) > 1]
+
+
+if __name__ == "__main__":
+    import os
+    from .batch import extract_patches, fingerprint, load_adaptations, sysex_files
+    from .sysex import load_sysex
+
+    adaptation = load_adaptations(os.path.dirname(os.path.abspath(sys.argv[1])), os.path.basename(sys.argv[1]))[0]
+    near_duplicates = NearDuplicateIndex(adaptation)
+    names = {}
+    for file_name in sysex_files(sys.argv[2:]):
+        for patch in extract_patches(adaptation, load_sysex(file_name)):
+            key = fingerprint(adaptation, list(patch["data"]))
+            names.setdefault(key, adaptation.nameFromDump(patch["data"]) if hasattr(adaptation, "nameFromDump") else key)
+            near_duplicates.add(key, patch["data"])
+    for cluster in near_duplicates.clusters():
+        print(", ".join(names[key] for key in cluster))
@@ -6,6 +6,9 @@
 from typing import List, Tuple
 import binascii
 
+__all__ = ["load_sysex", "splitSysexMessage", "stringToSyx", "findSysexDelimiters", "splitSysex",
+           "unescapeSysex_deepmind"]
+
 def load_sysex(filename):
     with open(filename, mode="rb") as midi_messages:
         content = midi_messages.read()
@@ -0,0 +1,281 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+from typing import List, Dict, Callable, Optional
+
+__all__ = ["kawaiK1K4Checksum", "rolandChecksum", "checksum_types", "data_type_tokens", "CompiledTemplate",
+           "TemplateIndex", "CompiledBankDriver", "TemplateAdaptation"]
+
+
+#
+# Engine for adaptations that are fully described by data, as pioneered by the KawaiK1.py adaptation. The descriptor
+# dictionary contains the request and reply templates of each bank driver, e.g.
+#
+#     [0xf0, 0x40, 0x00, 0x20, 0x00, 0x03, 0x00, "EN#", "SUM", "SIN", "CHK", 0xf7]
+#
+# with the pseudo bytes
+#
+#     "EN#"  the program number (one byte)
+#     "SUM"  start of the checksum summation (no byte)
+#     "SIN"  the data block of the data type "Single", other data types can be registered in data_type_tokens
+#     "CHK"  the checksum byte, calculated with the "Checksum Type" of the bank driver over the bytes since "SUM"
+#     "[" "]" the enclosed tokens are repeated "# of Entries" times
+#
+# Each template is compiled once into fixed offsets, so matching a message is a comparison of a few bytes and parsing
+# is just slicing.
+#
+
+def kawaiK1K4Checksum(data) -> int:
+    return (0xA5 + sum(data)) & 0x7f
+
+
+def rolandChecksum(data) -> int:
+    return (128 - (sum(data) & 0x7f)) & 0x7f
+
+
+checksum_types: Dict[str, Callable] = {"Kawai K1/K4": kawaiK1K4Checksum,
+                                       "Roland": rolandChecksum}
+
+data_type_tokens: Dict[str, str] = {"SIN": "Single"}
+
+
+class CompiledTemplate:
+
+    def __init__(self, template: List, device_id_offset: int, data_sizes: Optional[Dict[str, int]] = None, number_of_entries: int = 1,
+                 checksum: Optional[Callable] = None):
+        self.fixed = []  # (offset, value) of all constant bytes
+        self.program_offsets = []
+        self.data_offsets = []
+        self.checksums = []  # (start, end, offset of checksum byte)
+        self.data_size = 0
+        self.checksum_function = checksum
+        self.nested = "[" in template
+        if self.nested:
+            loop_start = template.index("[")
+            loop_end = template.index("]")
+            tokens = template[:loop_start] + template[loop_start + 1:loop_end] * number_of_entries + template[loop_end + 1:]
+        else:
+            tokens = template
+        offset = 0
+        summation_start = 0
+        for token in tokens:
+            if token == "SUM":
+                summation_start = offset
+            elif token == "EN#":
+                self.program_offsets.append(offset)
+                offset += 1
+            elif token in data_type_tokens:
+                self.data_size = data_sizes[data_type_tokens[token]]
+                self.data_offsets.append(offset)
+                offset += self.data_size
+            elif token == "CHK":
+                if checksum is None:
+                    raise Exception("Template contains a checksum, but no Checksum Type is given")
+                self.checksums.append((summation_start, offset, offset))
+                offset += 1
+            elif type(token) is str:
+                raise Exception("Unknown pseudo byte " + token)
+            else:
+                self.fixed.append((offset, token))
+                offset += 1
+        self.length = offset
+        # The device ID is not part of the comparison when matching a message
+        matched = [(o, v) for o, v in self.fixed if o != device_id_offset]
+        self.match_offsets = tuple(o for o, _ in matched)
+        self.match_values = tuple(v for _, v in matched)
+
+    def matches(self, message) -> bool:
+        return len(message) == self.length and tuple(message[o] for o in self.match_offsets) == self.match_values
+
+    def checksumsValid(self, message) -> bool:
+        if not self.checksums:
+            return True
+        data = bytes(message)
+        return all(self.checksum_function(data[start:end]) == data[chk] for start, end, chk in self.checksums)
+
+    def parse(self, message):
+        # Returns program number and data block, or lists of both for a template with a repeated section
+        programs = [message[o] for o in self.program_offsets]
+        datas = [list(message[o:o + self.data_size]) for o in self.data_offsets]
+        if self.nested:
+            return programs, datas
+        return programs[0] if programs else -1, datas[0] if datas else []
+
+    def build(self, program_no: int, data_block=None, with_checksums: bool = True) -> List[int]:
+        result = [0] * self.length
+        for offset, value in self.fixed:
+            result[offset] = value
+        for offset in self.program_offsets:
+            result[offset] = program_no
+        datas = data_block if self.nested else [data_block]
+        for offset, data in zip(self.data_offsets, datas):
+            result[offset:offset + self.data_size] = data
+        if with_checksums:
+            for start, end, chk in self.checksums:
+                result[chk] = self.checksum_function(result[start:end])
+        return result
+
+
+class TemplateIndex:
+    # Index over several compiled templates, finding the matching template with a single dictionary lookup
+
+    def __init__(self, templates: List[CompiledTemplate]):
+        self.tables = {}
+        for template in templates:
+            table = self.tables.setdefault((template.length, template.match_offsets), {})
+            # The first template wins, just as the bank drivers are tried in order
+            table.setdefault(template.match_values, template)
+
+    def find(self, message, verify_checksum=False) -> Optional[CompiledTemplate]:
+        for (length, offsets), table in self.tables.items():
+            if len(message) == length:
+                template = table.get(tuple(message[o] for o in offsets))
+                if template is not None and (not verify_checksum or template.checksumsValid(message)):
+                    return template
+        return None
+
+
+class CompiledBankDriver:
+
+    def __init__(self, driver: Dict, device_id_offset: int, data_sizes: Dict[str, int]):
+        if driver.get("Transmission Format", "7bit") != "7bit":
+            raise Exception("Only the 7bit transmission format is implemented")
+        self.driver = driver
+        checksum = checksum_types[driver["Checksum Type"]] if "Checksum Type" in driver else None
+        self.single_request = CompiledTemplate(driver["Single Request"], device_id_offset)
+        self.single_reply = CompiledTemplate(driver["Single Reply"], device_id_offset, data_sizes, checksum=checksum)
+        self.bank_request = CompiledTemplate(driver["Bank Request"], device_id_offset)
+        self.bank_reply = CompiledTemplate(driver["Bank Reply"], device_id_offset, data_sizes, driver["# of Entries"], checksum)
+
+
+class TemplateAdaptation:
+    # The functions of the KnobKraft adaptation API implemented by this class, see install()
+    api_functions = ["name", "createDeviceDetectMessage", "needsChannelSpecificDetection", "deviceDetectWaitMilliseconds",
+                     "generalMessageDelay", "channelIfValidDeviceResponse", "numberOfBanks", "numberOfPatchesPerBank",
+                     "createProgramDumpRequest", "isSingleProgramDump", "convertToProgramDump", "nameFromDump", "numberFromDump",
+                     "createBankDumpRequest", "isPartOfBankDump", "isBankDumpFinished", "bankDumpProgress", "extractPatchesFromBank",
+                     "friendlyBankName"]
+
+    def __init__(self, adaptation: Dict):
+        self.adaptation = adaptation
+        self.device_id_offset = adaptation["Device ID"][0]
+        data_sizes = {name: data_type["Size"] for name, data_type in adaptation["Data Types"].items()}
+        # Compile the descriptor once, so the functions below need not interpret the templates for every message
+        self.scan_reply = CompiledTemplate(adaptation["Scan reply"], self.device_id_offset)
+        self.bank_drivers = [CompiledBankDriver(d, self.device_id_offset, data_sizes) for d in adaptation["Bank Drivers"]]
+        self._driver_for_single_reply = {d.single_reply: d for d in self.bank_drivers}
+        self._driver_for_bank_reply = {d.bank_reply: d for d in self.bank_drivers}
+        self.single_replies = TemplateIndex([d.single_reply for d in self.bank_drivers])
+        self.bank_replies = TemplateIndex([d.bank_reply for d in self.bank_drivers])
+
+    def name(self) -> str:
+        return self.adaptation["Manufacturer Name"] + " " + self.adaptation["Model"]
+
+    def createDeviceDetectMessage(self, channel) -> List[int]:
+        if self.adaptation["Scan with Universal Device Inquiry"]:
+            raise Exception("Universal Device Inquiry not implemented yet")
+        else:
+            return self.insertDeviceID(channel, self.adaptation["Scan request"])
+
+    def needsChannelSpecificDetection(self) -> bool:
+        return True
+
+    def deviceDetectWaitMilliseconds(self) -> int:
+        return self.adaptation["Default Timeout"]
+
+    def generalMessageDelay(self) -> int:
+        return self.adaptation["Default Send Pause"]
+
+    def channelIfValidDeviceResponse(self, message) -> int:
+        if self.scan_reply.matches(message):
+            return message[self.device_id_offset] & 0x0f
+        return -1
+
+    def numberOfBanks(self) -> int:
+        return len(self.bank_drivers)
+
+    def numberOfPatchesPerBank(self) -> int:
+        # Ouch, that is not necessarily the same for all banks
+        return self.adaptation["Bank Drivers"][0]["# of Entries"]
+
+    def createProgramDumpRequest(self, channel, program_no) -> List[int]:
+        driver = self.bank_drivers[self.bankNoForProgramNo(program_no)]
+        request = driver.single_request.build(program_no - driver.driver["Offsets"][0])
+        return self.insertDeviceID(channel, request)
+
+    def isSingleProgramDump(self, message) -> bool:
+        # Don't verify the checksum here, older versions of the KawaiK1 adaptation stored single programs with a zero checksum
+        return self.single_replies.find(message) is not None
+
+    def convertToProgramDump(self, channel, message, program_no) -> List[int]:
+        template = self.single_replies.find(message)
+        if template is not None:
+            _, data = template.parse(message)
+            return self.insertDeviceID(channel, template.build(program_no, data))
+        raise Exception("Can only convert single program dumps!")
+
+    def nameFromDump(self, message) -> str:
+        template = self.single_replies.find(message)
+        if template is not None:
+            data_type = self.adaptation["Data Types"][self._driver_for_single_reply[template].driver["Data Type"]]
+            name_offset = template.data_offsets[0] + data_type["Name Offset"]
+            # Ignoring character set conversion for now
+            return "".join([chr(c) for c in message[name_offset:name_offset + data_type["Name Size"]]])
+        raise Exception("Not implemented yet")
+
+    def numberFromDump(self, message) -> int:
+        template = self.single_replies.find(message)
+        if template is not None:
+            return message[template.program_offsets[0]]
+        raise Exception("Only single program dumps have program numbers")
+
+    def createBankDumpRequest(self, channel, bank) -> List[int]:
+        return self.insertDeviceID(channel, self.bank_drivers[bank].bank_request.build(0))
+
+    def isPartOfBankDump(self, message) -> bool:
+        return self.bank_replies.find(message, verify_checksum=True) is not None
+
+    def isBankDumpFinished(self, messages) -> bool:
+        for message in messages:
+            if self.isPartOfBankDump(message):
+                return True
+        return False
+
+    def bankDumpProgress(self, state, message):
+        finished = bool(state) or self.isPartOfBankDump(message)
+        return finished, finished
+
+    def extractPatchesFromBank(self, message) -> List[int]:
+        result = []
+        template = self.bank_replies.find(message, verify_checksum=True)
+        if template is not None:
+            single_reply = self._driver_for_bank_reply[template].single_reply
+            _, datas = template.parse(message)
+            # The patches are stored with a zero checksum as in older versions of the KawaiK1 adaptation, so their
+            # fingerprint over the whole message stays the same. convertToProgramDump() writes the checksum when sending
+            for i in range(len(datas)):
+                result.extend(single_reply.build(i, datas[i], with_checksums=False))
+        return result
+
+    def friendlyBankName(self, bank) -> str:
+        return self.adaptation["Bank Drivers"][bank]["Bank Name"]
+
+    def bankNoForProgramNo(self, program_number) -> int:
+        bank = 0
+        count = 0
+        while self.adaptation["Bank Drivers"][bank]["# of Entries"] + count < program_number + 1:
+            count = count + self.adaptation["Bank Drivers"][bank]["# of Entries"]
+            bank = bank + 1
+        return bank
+
+    def insertDeviceID(self, channel, message) -> List[int]:
+        # TODO not sure what to do with the device ID min and max values. Is this for display?
+        return message[0:self.device_id_offset] + [(channel & 0x0f) if channel != -1 else 0] + message[self.device_id_offset + 1:]
+
+    def install(self, module):
+        # Expose our objects methods in the top level module namespace so the C++ code finds it
+        self.installed_module = module.__name__
+        for function_name in self.api_functions:
+            setattr(module, function_name, getattr(self, function_name))
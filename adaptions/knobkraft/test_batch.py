@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import shutil
+
+from .batch import run, sysex_files
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+_mopho_file = os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx")
+
+
+def _run(operation, paths, **kwargs):
+    output = io.StringIO()
+    run(operation, paths, _adaptation_directory, output, synth="DSI_Mopho.py", processes=1, progress=None, **kwargs)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_classify_and_fingerprint(tmp_path):
+    shutil.copy(_mopho_file, tmp_path / "a.syx")
+    shutil.copy(_mopho_file, tmp_path / "b.SYX")
+    assert sysex_files([str(tmp_path)]) == [str(tmp_path / "a.syx"), str(tmp_path / "b.SYX")]
+    classified = _run("classify", [str(tmp_path)])
+    assert [c["synths"] for c in classified] == [[{"synth": "DSI Mopho", "program_dump": 384}]] * 2
+    everything = _run("fingerprint", [str(tmp_path)])
+    unique = _run("fingerprint", [str(tmp_path)], unique=True)
+    assert len(everything) == 768
+    assert len(unique) == len(set(record["fingerprint"] for record in everything)) < 384
+    assert everything[0]["name"] == "RandomStepper"
+
+
+def test_convert_writes_sysex(tmp_path):
+    records = _run("convert", [_mopho_file], options={"output_directory": str(tmp_path), "to": "edit_buffer", "channel": 0})
+    assert all(record["kind"] == "edit_buffer" for record in records)
+    assert os.path.isfile(records[0]["output"])
+
+
+def test_convert_keeps_files_of_the_same_name_apart(tmp_path):
+    for directory in ["a", "b"]:
+        os.makedirs(tmp_path / "in" / directory)
+        shutil.copy(_mopho_file, tmp_path / "in" / directory / "x.syx")
+    options = {"output_directory": str(tmp_path / "out"), "to": "program_dump", "channel": 0, "program": 0}
+    records = _run("convert", [str(tmp_path / "in")], options=options)
+    outputs = sorted(set(record["output"] for record in records))
+    assert outputs == [str(tmp_path / "out" / "a" / "x_program_dump.syx"), str(tmp_path / "out" / "b" / "x_program_dump.syx")]
+    assert all(os.path.getsize(output) == os.path.getsize(_mopho_file) for output in outputs)
+
+
+def test_metadata_cache_gives_same_records(tmp_path):
+    cache_file = str(tmp_path / "cache.sqlite")
+    uncached = _run("extract", [_mopho_file])
+    assert _run("extract", [_mopho_file], cache_file=cache_file) == uncached
+    assert _run("extract", [_mopho_file], cache_file=cache_file) == uncached
+
+
+def test_worker_processes_give_same_records(tmp_path):
+    shutil.copy(_mopho_file, tmp_path / "a.syx")
+    shutil.copy(_mopho_file, tmp_path / "b.syx")
+    output = io.StringIO()
+    run("fingerprint", [str(tmp_path)], _adaptation_directory, output, synth="DSI_Mopho.py", processes=2, unique=True, progress=None)
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == _run("fingerprint", [str(tmp_path)], unique=True)
@@ -0,0 +1,45 @@
+import os
+
+from .adaptation_module import load_adaptation
+from .corpus import scaling_benchmark, seed_banks, seed_programs, split_programs, synthesize_programs, synthetic_corpus, scaling_exponent, _mutate
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_mutation_keeps_header_and_value_range():
+    import random
+    program = [0xf0, 0x10, 0x06, 0x0d, 0x00, 0x03, 0x00, 0x00, 0x00, 0x00] + [i % 16 for i in range(100)] + [0x55, 0xf7]
+    mutated = _mutate(program, random.Random(1), 50)
+    assert mutated[:10] == program[:10]
+    assert mutated[-2:] == program[-2:]
+    assert all(0 <= x < 16 for x in mutated[10:-2])
+    assert mutated != program
+
+
+def test_synthetic_matrix_corpus():
+    matrix = load_adaptation(os.path.join(_adaptation_directory, "Matrix1000.py"))
+    programs = list(synthesize_programs(matrix, seed_programs(matrix), 50))
+    assert len(set(matrix.nameFromDump(p) for p in programs)) == 50
+    assert programs == list(synthesize_programs(matrix, seed_programs(matrix), 50))
+    with synthetic_corpus(matrix, 50) as corpus:
+        assert corpus.count == 50
+        assert corpus.size() == sum(len(p) for p in programs)
+        split = list(split_programs(matrix, corpus.messages()))
+        assert len(split) == 50
+        assert all(matrix.isEditBufferDump(p) for p in split)
+
+
+def test_synthetic_bank_corpus():
+    esq1 = load_adaptation(os.path.join(_adaptation_directory, "Ensoniqesq1.py"))
+    assert len(seed_banks(esq1)) == 2
+    with synthetic_corpus(esq1, 5, banks=True) as corpus:
+        banks = list(corpus.messages())
+        assert len(banks) == corpus.count == 5
+        assert all(esq1.isPartOfBankDump(bank) for bank in banks)
+    timings = scaling_benchmark(esq1, [40, 400])
+    assert len(timings["extractPatchesFromBank"]) == 2
+
+
+def test_scaling_exponent():
+    assert abs(scaling_exponent([1000, 10000], [0.1, 1.0]) - 1.0) < 1e-9
+    assert abs(scaling_exponent([1000, 10000], [0.1, 10.0]) - 2.0) < 1e-9
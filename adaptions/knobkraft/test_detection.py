@@ -0,0 +1,38 @@
+import os
+import time
+
+from .adaptation_module import load_adaptation
+from .detection import Detection, LoopbackMidi, detect_devices, split_midi_messages
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _identity_responder(channel, reply_tail):
+    # A synth answering the universal device inquiry if it is addressed on its channel or omni
+    def respond(message):
+        if message[:2] == [0xf0, 0x7e] and message[3:5] == [0x06, 0x01] and message[2] in (channel, 0x7f):
+            return [0xf0, 0x7e, channel, 0x06, 0x02] + reply_tail + [0xf7]
+        return None
+
+    return respond
+
+
+def test_split_midi_messages():
+    assert split_midi_messages([0xf0, 0x7e, 0x00, 0x06, 0x01, 0xf7, 0xb0, 0x07, 0x64, 0xc0, 0x01]) == \
+           [[0xf0, 0x7e, 0x00, 0x06, 0x01, 0xf7], [0xb0, 0x07, 0x64], [0xc0, 0x01]]
+
+
+def test_parallel_detection_on_loopback():
+    matrix = load_adaptation(os.path.join(_adaptation_directory, "Matrix1000.py"))
+    mopho = load_adaptation(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    midi = LoopbackMidi()
+    midi.connect("Out A", "In A", _identity_responder(5, [0x10, 0x06, 0x00, 0x02, 0x00, 0x00, 0x00, 0x00, 0x00]))
+    midi.connect("Out B", "In B", _identity_responder(0, [0x01, 0x25, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]))
+    start = time.perf_counter()
+    detected = detect_devices(midi, [matrix, mopho], ["Out A", "Out B", "Out C"], pace_milliseconds=1)
+    elapsed = time.perf_counter() - start
+    assert sorted(detected) == [Detection("DSI Mopho", "Out B", "In B", 0), Detection("Matrix 1000 Adaptation", "Out A", "In A", 5)]
+    # The universal device inquiry on channel 0 is shared by both adaptations, and sent only once per output
+    assert len(midi.sent) == 3 * 16
+    # One wait window per output, not one per adaptation and channel
+    assert elapsed < 3 * (16 * 0.001 + 0.2) + 0.5
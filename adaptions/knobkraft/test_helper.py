@@ -1,6 +1,11 @@
+import copy
 from typing import List
 import functools
 
+from .sysex import load_sysex
+
+__all__ = ["list_compare", "TestData"]
+
 def list_compare(list1: List, list2: List) -> bool:
     if len(list1) != len(list2):
         print(f"\nlist1: {list1}")
@@ -16,3 +21,29 @@ def list_compare(list1: List, list2: List) -> bool:
     return True
 
 
+class TestData:
+    # The parsed test data of an adaptation for the generic tests in test_adaptations.py
+    __test__ = False
+
+    def __init__(self, adaptation):
+        self.test_dict = adaptation.test_data()
+        self.all_messages = []
+        if "sysex" in self.test_dict:
+            self.sysex_file = self.test_dict["sysex"]
+            self.all_messages = load_sysex(self.sysex_file)
+        if "program_generator" in self.test_dict:
+            self.programs = list(self.test_dict["program_generator"](self.all_messages))
+            self.program_dump = self.programs[0]["message"]
+        if "detection_reply" in self.test_dict:
+            self.detection_reply = self.test_dict["detection_reply"]
+
+    def copy(self) -> "TestData":
+        # Copies of all messages, as some adaptations modify the messages they are given in place. Much faster than
+        # copy.deepcopy() for the large sysex files
+        result = copy.copy(self)
+        result.test_dict = dict(self.test_dict)
+        result.all_messages = [list(message) for message in self.all_messages]
+        if hasattr(self, "programs"):
+            result.programs = [dict(program, message=list(program["message"])) for program in self.programs]
+            result.program_dump = result.programs[0]["message"]
+        return result
@@ -0,0 +1,22 @@
+import os
+
+from .adaptation_module import load_adaptation
+from .identity_routing import IdentityReplyRouter
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _load(*names):
+    return [load_adaptation(os.path.join(_adaptation_directory, name)) for name in names]
+
+
+def test_replies_are_routed_by_signature():
+    matrix, mopho, ms2000, dw6000 = _load("Matrix1000.py", "DSI_Mopho.py", "KorgMS2000.py", "KorgDW6000.py")
+    router = IdentityReplyRouter([matrix, mopho, ms2000, dw6000])
+    assert router.fallback == [dw6000]
+    matrix_reply = [0xf0, 0x7e, 0x05, 0x06, 0x02, 0x10, 0x06, 0x00, 0x02, 0x00, 0x00, 0x00, 0x00, 0x00, 0xf7]
+    assert router.candidates(matrix_reply) == [matrix, dw6000]
+    mopho_reply = [0xf0, 0x7e, 0x00, 0x06, 0x02, 0x01, 0x25, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xf7]
+    assert router.candidates(mopho_reply) == [mopho, dw6000]
+    # Other messages only go to the adaptations without signature
+    assert router.candidates([0xf0, 0x42, 0x30, 0x04, 0xf7]) == [dw6000]
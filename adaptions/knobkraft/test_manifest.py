@@ -0,0 +1,102 @@
+import os
+
+from . import manifest
+from .manifest import AdaptationManifest
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _write_adaptation(directory, name, synth_name):
+    file = os.path.join(directory, name + ".py")
+    with open(file, "w") as f:
+        f.write(f"def name():\n    return '{synth_name}'\n\n\n"
+                "def createDeviceDetectMessage(channel):\n    return [0xf0, 0xf7]\n")
+    return file
+
+
+def test_manifest_records_name_and_functions():
+    cache = AdaptationManifest(os.devnull)
+    entry = cache.entry(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    assert "sequential/GenericSequential.py" in entry["sources"]
+    assert entry["name"] == "DSI Mopho"
+    assert "isEditBufferDump" in entry["functions"]
+    assert "bankDescriptors" not in entry["functions"]
+
+
+def test_manifest_records_capabilities_and_properties():
+    cache = AdaptationManifest(os.devnull)
+    entry = cache.entry(os.path.join(_adaptation_directory, "KorgMS2000.py"))
+    assert "Edit Buffer Capability" in entry["capabilities"]
+    assert "Program Dump Capability" not in entry["capabilities"]
+    assert entry["properties"]["generalMessageDelay"] == 400
+    assert entry["properties"]["needsChannelSpecificDetection"] is True
+
+
+def test_capability_matrix_is_json(tmp_path):
+    import json
+    _write_adaptation(str(tmp_path), "matrix_synth", "Matrix Synth")
+    matrix = json.loads(json.dumps(manifest.capability_matrix(str(tmp_path))))
+    assert matrix["adaptations"]["matrix_synth.py"]["functions"] == ["name", "createDeviceDetectMessage"]
+    assert matrix["adaptations"]["matrix_synth.py"]["capabilities"] == []
+
+
+def test_manifest_is_reused_without_import(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    manifest_file = os.path.join(directory, "manifest.json")
+    file = _write_adaptation(directory, "manifest_synth", "Manifest Synth")
+    first = manifest.adaptation_manifest(directory, manifest_file)
+    assert [(e["module"], e["name"]) for e in first] == [("manifest_synth", "Manifest Synth")]
+
+    def fail(adaptation_file):
+        raise Exception("Adaptation must not be imported")
+
+    monkeypatch.setattr(manifest, "inspect_adaptation", fail)
+    assert manifest.adaptation_manifest(directory, manifest_file) == first
+    # Only touching the file keeps the entry, as the content hash is unchanged
+    os.utime(file, (1000, 1000))
+    assert manifest.adaptation_manifest(directory, manifest_file)[0]["functions"] == first[0]["functions"]
+    monkeypatch.undo()
+
+    _write_adaptation(directory, "manifest_synth", "Renamed Synth")
+    os.utime(file, (2000, 2000))
+    assert manifest.adaptation_manifest(directory, manifest_file)[0]["name"] == "Renamed Synth"
+
+
+def test_unreadable_manifest_is_rebuilt(tmp_path):
+    directory = str(tmp_path)
+    manifest_file = os.path.join(directory, "manifest.json")
+    with open(manifest_file, "w") as f:
+        f.write("{ not json")
+    _write_adaptation(directory, "broken_manifest_synth", "Broken Manifest Synth")
+    entries = manifest.adaptation_manifest(directory, manifest_file)
+    assert entries[0]["name"] == "Broken Manifest Synth"
+    assert AdaptationManifest(manifest_file).entries
+
+
+def test_changed_helper_module_invalidates_entry(tmp_path):
+    # Installed like the Orm does it, the helper packages are next to the executable and not in the adaptation directory
+    directory = str(tmp_path / "adaptations")
+    helpers = str(tmp_path / "bin")
+    os.makedirs(directory)
+    os.makedirs(os.path.join(helpers, "helper_package"))
+    manifest_file = os.path.join(directory, "manifest.json")
+    helper = os.path.join(helpers, "helper_package", "__init__.py")
+    with open(helper, "w") as f:
+        f.write("def install(module):\n    module.name = lambda: 'Helper Synth'\n")
+    with open(os.path.join(directory, "helper_synth.py"), "w") as f:
+        f.write("import sys\nimport helper_package\n\nhelper_package.install(sys.modules[__name__])\n\n\n"
+                "def createDeviceDetectMessage(channel):\n    return [0xf0, 0xf7]\n")
+    import sys
+    sys.path.insert(0, helpers)
+    try:
+        first = manifest.adaptation_manifest(directory, manifest_file)[0]
+        assert sorted(first["sources"]) == sorted([os.path.abspath(helper), "helper_synth.py"])
+        assert "bankDescriptors" not in first["functions"]
+        with open(helper, "a") as f:
+            f.write("    module.bankDescriptors = lambda: []\n")
+        os.utime(helper, (3000, 3000))
+        del sys.modules["helper_package"]
+        assert "bankDescriptors" in manifest.adaptation_manifest(directory, manifest_file)[0]["functions"]
+    finally:
+        sys.path.remove(helpers)
+        sys.modules.pop("helper_package", None)
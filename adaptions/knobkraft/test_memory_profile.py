@@ -0,0 +1,37 @@
+import os
+
+from .adaptation_module import load_adaptation
+from .memory_profile import AllocationProfile, measure_allocations, growth_exponent, profile_input_scaling
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _prefixes(data):
+    # Quadratic, keeps every prefix of the input
+    return [data[:i] for i in range(len(data))]
+
+
+def test_measure_allocations():
+    result, sample = measure_allocations(lambda data: [x + 1 for x in data], list(range(10000)))
+    assert result[0] == 1
+    assert sample.input_size == 10000
+    assert sample.peak >= sample.net > 10000 * 8
+
+
+def test_superlinear_growth_is_flagged():
+    profile = AllocationProfile()
+    profile_input_scaling(profile, "Test", "prefixes", _prefixes, lambda size: list(range(size)), [100, 400, 1600])
+    profile_input_scaling(profile, "Test", "copy", list, lambda size: list(range(size)), [1000, 4000, 16000])
+    assert growth_exponent(profile.samples["Test"]["prefixes"]) > 1.8
+    assert 0.8 < growth_exponent(profile.samples["Test"]["copy"]) < 1.2
+    flagged = profile.superlinear()
+    assert len(flagged) == 1 and "prefixes" in flagged[0]
+    assert any("copy: 3 calls" in line for line in profile.report())
+
+
+def test_korg_unescape_is_linear():
+    korg03rw = load_adaptation(os.path.join(_adaptation_directory, "Korg_03RW.py"))
+    profile = AllocationProfile()
+    profile_input_scaling(profile, "Korg_03RW", "unescapeSysex", korg03rw.unescapeSysex,
+                          lambda size: [x & 0x7f for x in range(size)], [800, 8000, 80000])
+    assert profile.superlinear() == []
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sys
+
+from .sysex import load_sysex
+from .adaptation_module import adaptation_source_files, load_adaptation
+from .metadata_cache import MetadataCache, compute_metadata, source_hash
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_cached_metadata_matches_adaptation(tmp_path):
+    mopho = load_adaptation(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    programs = load_sysex(os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx"))[:20]
+    expected = [compute_metadata(mopho, program) for program in programs]
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.metadata_batch(mopho, programs) == expected
+        assert (cache.hits, cache.misses) == (0, 20)
+        assert cache.metadata(mopho, programs[3]) == expected[3]
+        assert cache.hits == 1
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.metadata_batch(mopho, programs) == expected
+        assert (cache.hits, cache.misses) == (20, 0)
+        assert len(cache) == 20
+
+
+def test_changed_adaptation_invalidates(tmp_path):
+    # A private copy of the adaptation, so it can be edited
+    shutil.copytree(os.path.join(_adaptation_directory, "sequential"), str(tmp_path / "sequential"))
+    shutil.copy(os.path.join(_adaptation_directory, "DSI_Mopho.py"), str(tmp_path / "Mopho_Copy.py"))
+    mopho = load_adaptation(str(tmp_path / "Mopho_Copy.py"))
+    program = load_sysex(os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx"))[0]
+    before = source_hash(mopho)
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.metadata(mopho, program)
+        with open(str(tmp_path / "Mopho_Copy.py"), "a") as f:
+            f.write("\n# changed\n")
+        changed = load_adaptation(str(tmp_path / "Mopho_Copy.py"))
+        assert source_hash(changed) != before
+        cache.metadata(changed, program)
+        assert (cache.hits, cache.misses) == (0, 2)
+        # The entry of the old source is only deleted on cleanup
+        assert len(cache) == 2
+        assert cache.cleanup([changed]) == 1
+        assert len(cache) == 1
+        assert cache.metadata(changed, program) == compute_metadata(changed, program)
+        assert cache.hits == 1
+
+
+def test_adaptations_with_the_same_name_keep_their_entries(tmp_path):
+    # Like a built-in adaptation and an edited copy of it in the user adaptation directory
+    shutil.copytree(os.path.join(_adaptation_directory, "sequential"), str(tmp_path / "sequential"))
+    shutil.copy(os.path.join(_adaptation_directory, "DSI_Mopho.py"), str(tmp_path / "DSI_Mopho.py"))
+    with open(str(tmp_path / "DSI_Mopho.py"), "a") as f:
+        f.write("\n# user copy\n")
+    builtin = load_adaptation(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    user = load_adaptation(str(tmp_path / "DSI_Mopho.py"))
+    assert builtin.name() == user.name()
+    program = load_sysex(os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx"))[0]
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.metadata(builtin, program)
+        cache.metadata(user, program)
+        cache.metadata(builtin, program)
+        cache.metadata(user, program)
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert cache.cleanup([builtin, user]) == 0
+        assert len(cache) == 2
+
+
+def test_changed_installed_helper_package_invalidates(tmp_path):
+    # Installed like the Orm does it, the helper packages are next to the executable and not in the adaptation directory
+    helpers = tmp_path / "bin"
+    shutil.copytree(os.path.join(_adaptation_directory, "sequential"), str(helpers / "sequential"))
+    os.mkdir(str(tmp_path / "adaptations"))
+    shutil.copy(os.path.join(_adaptation_directory, "DSI_Mopho.py"), str(tmp_path / "adaptations" / "DSI_Mopho.py"))
+    saved = {name: module for name, module in sys.modules.items() if name == "sequential" or name.startswith("sequential.")}
+    sys.path.insert(0, str(helpers))
+    try:
+        for name in saved:
+            del sys.modules[name]
+        mopho = load_adaptation(str(tmp_path / "adaptations" / "DSI_Mopho.py"))
+        assert os.path.abspath(str(helpers / "sequential" / "GenericSequential.py")) in adaptation_source_files(mopho)
+        before = source_hash(mopho)
+        with open(str(helpers / "sequential" / "GenericSequential.py"), "a") as f:
+            f.write("\n# changed\n")
+        assert source_hash(mopho) != before
+    finally:
+        sys.path.remove(str(helpers))
+        for name in [name for name in sys.modules if name == "sequential" or name.startswith("sequential.")]:
+            del sys.modules[name]
+        sys.modules.update(saved)
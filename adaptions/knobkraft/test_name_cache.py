@@ -0,0 +1,40 @@
+import os
+
+from .sysex import load_sysex
+from .adaptation_module import load_adaptation
+from .name_cache import NameCache, memoize_names, name_caches
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_lru_eviction_and_counters():
+    cache = NameCache(capacity=2)
+    cache.store(b"a", ("nameFromDump",), "A")
+    cache.store(b"b", ("nameFromDump",), "B")
+    assert cache.lookup(b"a", ("nameFromDump",)) == (True, "A")
+    cache.store(b"c", ("nameFromDump",), "C")
+    # b was the least recently used
+    assert cache.lookup(b"b", ("nameFromDump",)) == (False, None)
+    assert cache.lookup(b"c", ("layerName", 0)) == (False, None)
+    assert cache.statistics()["hits"] == 1
+    assert (cache.misses, cache.evictions, len(cache)) == (2, 1, 2)
+    cache.resize(1)
+    assert len(cache) == 1 and cache.evictions == 2
+
+
+def test_memoized_names_and_rename():
+    prophet = load_adaptation(os.path.join(_adaptation_directory, "DSI Prophet 12.py"))
+    program = load_sysex(os.path.join(_adaptation_directory, "testData", "P12_Programs_v1.1c.syx"))[0]
+    functions = memoize_names(prophet, capacity=10)
+    cache = name_caches[prophet.__name__]
+    name = functions["nameFromDump"](program)
+    assert name == prophet.nameFromDump(program)
+    assert functions["nameFromDump"](list(program)) == name
+    assert functions["layerName"](program, 1) == prophet.layerName(program, 1)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 1)
+    renamed = functions["renamePatch"](program, "Renamed")
+    assert len(cache) == 0
+    assert functions["nameFromDump"](renamed) == "Renamed"
+    layer_renamed = functions["setLayerName"](renamed, 1, "Layer B")
+    assert functions["layerName"](layer_renamed, 1) == "Layer B"
+    assert cache.misses == 4
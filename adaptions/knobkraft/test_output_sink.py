@@ -0,0 +1,53 @@
+import types
+
+from .output_sink import OutputBuffer, OutputStream
+
+
+def test_lines_are_collected_and_joined():
+    buffer = OutputBuffer()
+    out = OutputStream(buffer, False)
+    err = OutputStream(buffer, True)
+    # Output is tagged with the adaptation module printing it
+    exec("print('first', file=out)", {"__name__": "Test_Synth", "out": out})
+    print("second", 2, file=out)
+    print("failed", file=err)
+    out.write("no line end")
+    drained = buffer.drain()
+    assert [(is_error, text) for _, is_error, text in drained] == [(False, "first"), (False, "second 2"), (True, "failed"), (False, "no line end")]
+    assert drained[0][0] == "Test_Synth"
+    assert buffer.drain() == []
+
+
+def test_rate_limit_and_ring_buffer():
+    buffer = OutputBuffer(max_lines=8, lines_per_second=0, burst=5)
+    out = OutputStream(buffer, False)
+    err = OutputStream(buffer, True)
+    for i in range(10):
+        print(i, file=out)
+    drained = buffer.drain()
+    assert drained[0][2] == "0\n1\n2\n3\n4"
+    assert drained[1][2] == "5 lines of output suppressed"
+    # Errors are not rate limited, but the ring buffer only keeps the last lines
+    for i in range(10):
+        print(i, file=err)
+    drained = buffer.drain()
+    assert drained[0][2] == "2\n3\n4\n5\n6\n7\n8\n9"
+    assert drained[1][2] == "2 lines of output lost"
+
+
+def test_generic_adaptations_are_tagged_with_their_module():
+    # The Orm calls the installed bound methods directly, so no frame of the adaptation module is on the stack
+    class Generic:
+        def install(self, module):
+            self.installed_module = module.__name__
+
+        def name(self):
+            print("called", file=out)
+            return "Generic"
+
+    buffer = OutputBuffer()
+    out = OutputStream(buffer, False)
+    generic = Generic()
+    generic.install(types.ModuleType("Test_Synth"))
+    generic.name()
+    assert buffer.drain() == [("Test_Synth", False, "called")]
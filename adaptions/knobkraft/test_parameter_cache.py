@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from .sysex import load_sysex
+from .adaptation_module import load_adaptation
+
+numpy = pytest.importorskip("numpy")
+
+from .parameter_cache import ParameterCache, ParameterCaches
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _dx7_voices():
+    dx7 = load_adaptation(os.path.join(_adaptation_directory, "YamahaDX7.py"))
+    bank = load_sysex(os.path.join(_adaptation_directory, "testData", "yamahaDX7-ROM2B.SYX"))[0]
+    return dx7, dx7.splitSysexMessage(dx7.extractPatchesFromBank(bank))
+
+
+def test_vectorized_filter_matches_per_patch_filter():
+    dx7, voices = _dx7_voices()
+    cache = ParameterCaches().cache_for(dx7)
+    for voice in voices:
+        cache.add(dx7.nameFromDump(voice), voice)
+    assert len(cache) == 32
+    assert cache.parameters.shape == (32, 155)
+    # Algorithm is parameter 134 in the DX7 single voice format
+    expected = [dx7.nameFromDump(v) for v in voices if dx7.parameterArrayFromDump(v)[134] < 10]
+    assert cache.filter_expression("P[:, 134] < 10") == expected
+    assert cache.filter(lambda p: p[:, 134] < 10) == expected
+
+
+def test_matrix_grows_incrementally():
+    dx7, voices = _dx7_voices()
+    cache = ParameterCache(dx7)
+    cache.add("first", voices[0])
+    assert cache.parameters.shape == (1, 155)
+    cache.add("first", voices[0])
+    cache.add("second", voices[1])
+    assert cache.parameters.shape == (2, 155)
+    assert list(cache.parameters[1]) == dx7.parameterArrayFromDump(voices[1])
+
+
+def test_adaptation_without_parameters_is_rejected():
+    mopho = load_adaptation(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    assert len(ParameterCache(mopho)) == 0
+    kawai = load_adaptation(os.path.join(_adaptation_directory, "KawaiK1.py"))
+    with pytest.raises(Exception):
+        ParameterCache(kawai)
+
+
+def test_nearest_patches_match_brute_force():
+    dx7, voices = _dx7_voices()
+    cache = ParameterCache(dx7)
+    for voice in voices[:20]:
+        cache.add(dx7.nameFromDump(voice), voice)
+    parameters = numpy.array([dx7.parameterArrayFromDump(v) for v in voices[:20]], dtype=float)
+    scaled = (parameters - parameters.min(axis=0)) / numpy.maximum(parameters.max(axis=0) - parameters.min(axis=0), 1)
+    query = voices[3]
+    expected = numpy.argsort(numpy.linalg.norm(scaled - scaled[3], axis=1), kind="stable")[:5]
+    found = cache.similar(query, k=5)
+    assert [key for key, _ in found] == [dx7.nameFromDump(voices[i]) for i in expected]
+    assert found[0][1] < 1e-3
+    # Without the patch itself, and for several patches in one batch
+    others = cache.similar_to([dx7.nameFromDump(voices[3]), dx7.nameFromDump(voices[7])], k=4)
+    assert [key for key, _ in others[0]] == [dx7.nameFromDump(voices[i]) for i in expected[1:5]]
+    assert len(others[1]) == 4 and dx7.nameFromDump(voices[7]) not in [key for key, _ in others[1]]
+    # Adding patches invalidates the scaled vectors
+    for voice in voices[20:]:
+        cache.add(dx7.nameFromDump(voice), voice)
+    assert len(cache.similar(query, k=50)) == 32
+
+
+def test_save_and_load(tmp_path):
+    dx7, voices = _dx7_voices()
+    cache = ParameterCache(dx7)
+    for number, voice in enumerate(voices):
+        cache.add(f"voice {number}", voice)
+    # Without the suffix, which numpy.savez would add
+    file_name = str(tmp_path / "dx7")
+    assert cache.save(file_name) == file_name + ".npz"
+    loaded = ParameterCache.load(dx7, file_name)
+    assert loaded.keys == cache.keys
+    assert (loaded.parameters == cache.parameters).all()
+    assert loaded.similar(voices[5], k=3) == cache.similar(voices[5], k=3)
+    loaded.add("voice 0", voices[0])
+    loaded.add("new", voices[0])
+    assert len(loaded) == 33
+    assert [key for key, _ in loaded.similar(voices[0], k=2)] == ["voice 0", "new"]
+
+
+class _VariableLengthParameters:
+    # The parameters are the message itself, so patches can have different numbers of parameters
+
+    @staticmethod
+    def name():
+        return "Variable"
+
+    @staticmethod
+    def parameterArrayFromDump(message):
+        return list(message)
+
+
+def test_padding_is_ignored():
+    cache = ParameterCache(_VariableLengthParameters())
+    cache.add("short", [10, 20])
+    cache.add("long", [10, 20, 5])
+    cache.add("other", [50, 60, 100])
+    vectors, present = cache.vectors()
+    assert present[0].tolist() == [1, 1, 0]
+    # The range of the third parameter is 5..100, not -1..100
+    assert vectors[1, 2] == 0
+    found = dict(cache.similar([10, 20, 100], k=3))
+    assert found["short"] == 0
+    assert abs(found["long"] - 1) < 1e-6
+    assert found["other"] > 1
+    assert dict(cache.similar([10, 20], k=3)) == {"short": 0, "long": 0, "other": pytest.approx(2 ** 0.5)}
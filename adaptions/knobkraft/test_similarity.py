@@ -0,0 +1,46 @@
+import hashlib
+import os
+
+import pytest
+
+from .sysex import load_sysex
+from .adaptation_module import load_adaptation
+
+numpy = pytest.importorskip("numpy")
+
+from .similarity import NearDuplicateIndex, fingerprint_payload, lsh_parameters
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_lsh_parameters():
+    assert lsh_parameters(128, 0.9) == (8, 16)
+    assert lsh_parameters(128, 0.5) == (32, 4)
+
+
+def test_tweaked_and_renamed_patches_cluster():
+    mopho = load_adaptation(os.path.join(_adaptation_directory, "DSI_Mopho.py"))
+    programs = load_sysex(os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx"))[:50]
+    index = NearDuplicateIndex(mopho)
+    for program in programs:
+        index.add(mopho.calculateFingerprint(program), program)
+    original = programs[10]
+    tweaked = list(original)
+    tweaked[20] = (tweaked[20] + 1) & 0x7f
+    renamed = mopho.renamePatch(programs[20], "Renamed")
+    # The payload is what the fingerprint hashes, so a renamed copy has the same one
+    assert hashlib.md5(bytearray(fingerprint_payload(mopho, renamed))).hexdigest() == mopho.calculateFingerprint(programs[20])
+    assert index.similar(renamed)[0] == (mopho.calculateFingerprint(programs[20]), 1.0)
+    index.add("tweaked", tweaked)
+    assert index.similarity("tweaked", mopho.calculateFingerprint(original)) > 0.9
+    cluster = [c for c in index.clusters() if "tweaked" in c]
+    assert cluster == [[mopho.calculateFingerprint(original), "tweaked"]]
+
+
+def test_roland_payload_matches_fingerprint():
+    jv = load_adaptation(os.path.join(_adaptation_directory, "Roland_JV1080.py"))
+    test_data = jv.test_data()
+    program = next(test_data["program_generator"](load_sysex(test_data["sysex"])))["message"]
+    payload = fingerprint_payload(jv, program)
+    assert payload != program
+    assert hashlib.md5(bytearray(payload)).hexdigest() == jv.calculateFingerprint(list(program))
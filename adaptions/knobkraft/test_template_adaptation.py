@@ -0,0 +1,48 @@
+import os
+
+from .adaptation_module import load_adaptation
+from .template_adaptation import *
+
+_single_reply = [0xf0, 0x40, 0x00, 0x20, 0x00, 0x03, 0x00, "EN#", "SUM", "SIN", "CHK", 0xf7]
+_bank_reply = [0xf0, 0x40, 0x00, 0x21, 0x00, 0x03, 0x00, 0x00, "[", "SUM", "SIN", "CHK", "]", 0xf7]
+
+
+def test_compiled_template():
+    template = CompiledTemplate(_single_reply, 2, {"Single": 4}, checksum=kawaiK1K4Checksum)
+    assert template.length == 14
+    message = template.build(5, [1, 2, 3, 4])
+    assert message == [0xf0, 0x40, 0x00, 0x20, 0x00, 0x03, 0x00, 5, 1, 2, 3, 4, (0xa5 + 10) & 0x7f, 0xf7]
+    # The device ID is ignored when matching
+    message[2] = 0x07
+    assert template.matches(message)
+    assert template.checksumsValid(message)
+    assert template.parse(message) == (5, [1, 2, 3, 4])
+    message[9] = 0x00
+    assert template.matches(message)
+    assert not template.checksumsValid(message)
+
+
+def test_template_index():
+    bank = CompiledTemplate(_bank_reply, 2, {"Single": 4}, 3, kawaiK1K4Checksum)
+    other_bank = CompiledTemplate(_bank_reply[:7] + [0x20] + _bank_reply[8:], 2, {"Single": 4}, 3, kawaiK1K4Checksum)
+    index = TemplateIndex([bank, other_bank])
+    message = other_bank.build(0, [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]])
+    assert len(message) == 9 + 3 * 5
+    assert index.find(message, verify_checksum=True) is other_bank
+    assert other_bank.parse(message) == ([], [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]])
+    assert index.find(message[:-2] + [0xf7]) is None
+
+
+def test_bank_patches_keep_their_stored_bytes():
+    k1 = load_adaptation(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "KawaiK1.py"))
+    driver = k1.k1.bank_drivers[0]
+    datas = [[(i * 7 + j) & 0x7f for i in range(driver.single_reply.data_size)] for j in range(len(driver.bank_reply.data_offsets))]
+    bank = driver.bank_reply.build(0, datas)
+    patches = k1.extractPatchesFromBank(bank)
+    first = patches[:driver.single_reply.length]
+    # Same bytes, and with them the same fingerprint, as patches extracted by older versions
+    assert first == [0xf0, 0x40, 0x00, 0x20, 0x00, 0x03, 0x00, 0] + datas[0] + [0x00, 0xf7]
+    assert not hasattr(k1, "calculateFingerprint")
+    sent = k1.convertToProgramDump(5, first, 17)
+    assert sent[2] == 5 and sent[7] == 17
+    assert driver.single_reply.checksumsValid(sent)
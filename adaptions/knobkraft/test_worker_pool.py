@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+from .sysex import load_sysex
+from .adaptation_module import load_adaptation
+from .worker_pool import AdaptationWorkerPool, configure_executable, worker_executable
+
+_adaptation_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def _mopho():
+    file = os.path.join(_adaptation_directory, "DSI_Mopho.py")
+    messages = load_sysex(os.path.join(_adaptation_directory, "testData", "Mopho_Programs_v1.0.syx"))
+    return file, [(m,) for m in messages]
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_pool_results_identical_to_in_process(processes):
+    file, arguments = _mopho()
+    adaptation = load_adaptation(file)
+    with AdaptationWorkerPool(processes, _adaptation_directory) as pool:
+        assert pool.processes == processes
+        for function_name in ["nameFromDump", "calculateFingerprint"]:
+            expected = [getattr(adaptation, function_name)(*args) for args in arguments]
+            assert pool.map(file, function_name, arguments, batch_size=7) == expected
+
+
+def test_pool_raises_adaptation_exceptions():
+    file, _ = _mopho()
+    with AdaptationWorkerPool(1, _adaptation_directory) as pool:
+        with pytest.raises(Exception):
+            pool.map(file, "convertToEditBuffer", [(0, [0xf0, 0xf7])])
+
+
+def _exit_in_worker(value):
+    # Kills the worker process, but works when called in-process
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return value * 2
+
+
+def test_dead_worker_falls_back_to_in_process():
+    with AdaptationWorkerPool(2, _adaptation_directory) as pool:
+        assert pool.map(None, _exit_in_worker, [(i,) for i in range(10)], batch_size=3) == [i * 2 for i in range(10)]
+        assert pool.processes == 0
+
+
+def test_configured_executable():
+    assert worker_executable() == sys.executable
+    configure_executable(sys.executable)
+    try:
+        with AdaptationWorkerPool(1, _adaptation_directory) as pool:
+            assert pool.processes == 1
+            assert pool.map(None, abs, [(-1,), (2,)]) == [1, 2]
+    finally:
+        configure_executable(None)
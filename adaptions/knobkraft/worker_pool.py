@@ -0,0 +1,216 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+from typing import Iterator, List, Dict, Optional
+
+from .adaptation_module import load_adaptation
+
+#
+# A pool of Python worker processes which load the same adaptation modules as the Orm, and evaluate batches of calls
+# like nameFromDump or calculateFingerprint on all cores. It is used by the headless batch processor knobkraft.batch.
+# The import in the Orm does not use it, there all adaptation calls still run in the embedded interpreter.
+#
+# The protocol over the pipe to each worker is
+#
+#     request:  (adaptation_file, function_name, [args, args, ...])  or None to shut down the worker
+#     reply:    [(True, result) or (False, exception), ...]          one entry per args in the request
+#
+# With adaptation_file None, function_name is instead a module level function that is called with the args, for tools
+# like the batch processor which do more per call than a single adaptation function.
+#
+# If a worker dies, its batch and all further batches sent to it are evaluated in the calling process instead.
+#
+# Should a script run inside the Orm use the pool, sys.executable is the Orm itself, which must not be started as a
+# worker. The workers are started with the interpreter of the Python installation instead, or the one given to
+# configure_executable().
+#
+
+batchable_functions = ["nameFromDump", "calculateFingerprint", "extractPatchesFromBank", "numberFromDump", "storedTags",
+                       "isDefaultName", "isSingleProgramDump", "isEditBufferDump", "parameterArrayFromDump"]
+
+
+# The Python interpreter the workers are started with, None to find it automatically
+_executable: Optional[str] = None
+
+
+def configure_executable(executable: Optional[str]):
+    global _executable
+    _executable = executable
+
+
+def worker_executable() -> Optional[str]:
+    if _executable is not None:
+        return _executable
+    if os.path.basename(sys.executable or "").lower().startswith("python"):
+        return sys.executable
+    # Embedded into another program, look for the interpreter of the Python installation we are running from
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    for candidate in [os.path.join(sys.exec_prefix, "python.exe"), os.path.join(sys.exec_prefix, "bin", "python" + version),
+                      os.path.join(sys.exec_prefix, "bin", "python3")]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _call_batch(function, batch) -> List:
+    results = []
+    for args in batch:
+        try:
+            results.append((True, function(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+def _worker_main(connection, adaptation_directory):
+    if adaptation_directory is not None and adaptation_directory not in sys.path:
+        sys.path.insert(0, adaptation_directory)
+    modules = {}
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        adaptation_file, function_name, batch = request
+        try:
+            if adaptation_file is None:
+                function = function_name
+            else:
+                if adaptation_file not in modules:
+                    modules[adaptation_file] = load_adaptation(adaptation_file)
+                function = getattr(modules[adaptation_file], function_name)
+            results = _call_batch(function, batch)
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+        try:
+            connection.send(results)
+        except Exception as e:
+            # Some result or exception could not be pickled
+            connection.send([(False, RuntimeError(f"Worker could not send result of {function_name}: {e}"))] * len(batch))
+    connection.close()
+
+
+def _unpack(results):
+    for worked, result in results:
+        if not worked:
+            raise result
+        yield result
+
+
+class AdaptationWorkerPool:
+
+    def __init__(self, processes: Optional[int] = None, adaptation_directory: Optional[str] = None):
+        self.adaptation_directory = adaptation_directory
+        self._workers = []
+        self._in_process_modules: Dict[str, object] = {}
+        if processes is None:
+            processes = os.cpu_count() or 1
+        executable = worker_executable() if processes > 0 else None
+        if processes > 0 and executable is None:
+            print("No Python interpreter found to start adaptation worker processes, falling back to in-process execution")
+            return
+        # Spawn instead of fork, so the workers behave the same on all platforms
+        context = multiprocessing.get_context("spawn")
+        try:
+            if executable is not None:
+                context.set_executable(executable)
+            for _ in range(processes):
+                parent_end, child_end = context.Pipe()
+                process = context.Process(target=_worker_main, args=(child_end, adaptation_directory), daemon=True)
+                process.start()
+                child_end.close()
+                self._workers.append((process, parent_end))
+        except (OSError, ImportError) as e:
+            print(f"Could not start adaptation worker processes, falling back to in-process execution: {e}")
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def processes(self) -> int:
+        return len(self._workers)
+
+    def map(self, adaptation_file: Optional[str], function_name, arguments: List[tuple], batch_size: int = 256) -> List:
+        # Evaluate function_name(*args) for all args given, and return the results in the same order
+        return list(self.imap(adaptation_file, function_name, arguments, batch_size))
+
+    def imap(self, adaptation_file: Optional[str], function_name, arguments: List[tuple], batch_size: int = 256) -> Iterator:
+        # Like map, but yields each result as soon as it and all results before it are available
+        batches = [arguments[i:i + batch_size] for i in range(0, len(arguments), batch_size)]
+        if not self._workers:
+            for batch in batches:
+                yield from _unpack(self._in_process(adaptation_file, function_name, batch))
+            return
+        results = {}
+        next_batch = 0
+        next_result = 0
+        busy = {}
+        idle = [connection for _, connection in self._workers]
+        while next_batch < len(batches) or busy:
+            while idle and next_batch < len(batches):
+                connection = idle.pop()
+                try:
+                    connection.send((adaptation_file, function_name, batches[next_batch]))
+                except OSError:
+                    self._worker_died(connection)
+                    continue
+                busy[connection] = next_batch
+                next_batch += 1
+            if not busy:
+                # All workers are gone
+                results[next_batch] = self._in_process(adaptation_file, function_name, batches[next_batch])
+                next_batch += 1
+                ready = []
+            else:
+                ready = multiprocessing.connection.wait(list(busy.keys()))
+            for connection in ready:
+                batch_index = busy.pop(connection)
+                try:
+                    results[batch_index] = connection.recv()
+                    idle.append(connection)
+                except (EOFError, OSError):
+                    self._worker_died(connection)
+                    results[batch_index] = self._in_process(adaptation_file, function_name, batches[batch_index])
+            while next_result in results:
+                yield from _unpack(results.pop(next_result))
+                next_result += 1
+
+    def _worker_died(self, connection):
+        print("Adaptation worker process died, continuing in-process")
+        for process, worker_connection in self._workers:
+            if worker_connection is connection:
+                connection.close()
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        self._workers = [(process, c) for process, c in self._workers if c is not connection]
+
+    def _in_process(self, adaptation_file, function_name, batch):
+        if adaptation_file is None:
+            return _call_batch(function_name, batch)
+        if self.adaptation_directory is not None and self.adaptation_directory not in sys.path:
+            sys.path.insert(0, self.adaptation_directory)
+        if adaptation_file not in self._in_process_modules:
+            self._in_process_modules[adaptation_file] = load_adaptation(adaptation_file)
+        return _call_batch(getattr(self._in_process_modules[adaptation_file], function_name), batch)
+
+    def close(self):
+        for process, connection in self._workers:
+            try:
+                connection.send(None)
+                connection.close()
+            except OSError:
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
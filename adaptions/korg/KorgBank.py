@@ -0,0 +1,68 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import itertools
+from typing import List, Iterator
+
+
+# The Korg synths of the 90s and 2000s all use the same 7 bit encoding for their data dumps: One byte carrying the most
+# significant bits of the following seven data bytes, then the seven data bytes with their top bit cleared.
+def unescapeSysex(sysex) -> bytearray:
+    data = bytes(sysex)
+    result = bytearray()
+    for group_start in range(0, len(data), 8):
+        ms_bits = data[group_start]
+        result.extend(byte | (((ms_bits >> i) & 0x01) << 7) for i, byte in enumerate(data[group_start + 1:group_start + 8]))
+    return result
+
+
+def escapeSysex(data) -> bytearray:
+    data = bytes(data)
+    result = bytearray()
+    for group_start in range(0, len(data), 7):
+        group = data[group_start:group_start + 7]
+        ms_bits = 0
+        for i, byte in enumerate(group):
+            ms_bits |= (byte & 0x80) >> (7 - i)
+        result.append(ms_bits)
+        result.extend(byte & 0x7f for byte in group)
+    return result
+
+
+class KorgBankFormat:
+    """Describes the ALL DATA DUMP of a Korg synth as a sequence of fixed-size program records, so the bank can be
+    decoded once and split into individual program dumps without copying the data for every program."""
+
+    def __init__(self, name: str, model_id: int, record_size: int, header_size: int, program_dump_function: int = 0x40):
+        self.name = name
+        self.model_id = model_id
+        # Size of one decoded (8 bit) program record
+        self.record_size = record_size
+        # Number of bytes before the escaped data starts, including the 0xf0 and the function byte(s)
+        self.header_size = header_size
+        self.program_dump_function = program_dump_function
+
+    def programDumpHeader(self, channel: int) -> List[int]:
+        return [0xf0, 0x42, 0x30 | (channel & 0x0f), self.model_id, self.program_dump_function]
+
+    def programRecords(self, message) -> Iterator[memoryview]:
+        # Decode the whole bank once, the records returned are views into the decoded data
+        data = memoryview(unescapeSysex(message[self.header_size:-1]))
+        # There are different files out there with different number of patches (64 or 128), plus the global data,
+        # so just return as many complete records as we can find
+        for data_pointer in range(0, len(data) - self.record_size + 1, self.record_size):
+            yield data[data_pointer:data_pointer + self.record_size]
+
+    def programDumps(self, message) -> Iterator[List[int]]:
+        header = self.programDumpHeader(message[2] & 0x0f)
+        for record in self.programRecords(message):
+            yield header + list(escapeSysex(record)) + [0xf7]
+
+    def extractPatchesFromBank(self, message) -> List[int]:
+        return list(itertools.chain.from_iterable(self.programDumps(message)))
+
+
+korg_03rw_bank = KorgBankFormat("Korg 03R/W", model_id=0x30, record_size=172, header_size=6)
+korg_ms2000_bank = KorgBankFormat("Korg MS2000", model_id=0x58, record_size=254, header_size=5)
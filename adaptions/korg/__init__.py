@@ -0,0 +1 @@
+from .KorgBank import *
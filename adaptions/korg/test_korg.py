@@ -0,0 +1,22 @@
+from .KorgBank import *
+
+
+def test_escaping():
+    test_data = [x for x in range(254)]
+    escaped = escapeSysex(test_data)
+    assert all(x < 0x80 for x in escaped)
+    assert list(unescapeSysex(escaped)) == test_data
+
+
+def test_bank_split():
+    # Build a fake 03R/W ALL DATA DUMP with three programs and some global data trailing
+    programs = [[(p * 17 + i) & 0xff for i in range(korg_03rw_bank.record_size)] for p in range(3)]
+    payload = [x for program in programs for x in program] + [0x55] * 20
+    bank = [0xf0, 0x42, 0x35, 0x30, 0x4c, 0x00] + list(escapeSysex(payload)) + [0xf7]
+    dumps = list(korg_03rw_bank.programDumps(bank))
+    assert len(dumps) == 3
+    for program, dump in zip(programs, dumps):
+        assert dump[:5] == [0xf0, 0x42, 0x35, 0x30, 0x40]
+        assert dump[-1] == 0xf7
+        assert list(unescapeSysex(dump[5:-1])) == program
+    assert korg_03rw_bank.extractPatchesFromBank(bank) == [x for dump in dumps for x in dump]
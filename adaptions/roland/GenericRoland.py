@@ -352,6 +352,14 @@ class GenericRoland:
         else:
             return hashlib.md5(bytearray(message)).hexdigest()
 
+    def fingerprint_payload(self, message) -> List[int]:
+        # A copy of what calculateFingerprint hashes, i.e. the message with program position, checksums and name blanked out
+        if self.isEditBufferDump(message):
+            return self._apply_blankout(list(message), self.edit_buffer.blank_out_zones)
+        elif self.isSingleProgramDump(message):
+            return self._apply_blankout(list(message), self.program_dump.blank_out_zones)
+        return list(message)
+
     @knobkraft_api
     def numberFromDump(self, message) -> int:
         if not self.isSingleProgramDump(message):
@@ -384,6 +392,7 @@ class GenericRoland:
     def install(self, module):
         # This is required because the original KnobKraft modules are not objects, but rather a module namespace with
         # methods declared. Expose our objects methods in the top level module namespace so the C++ code finds it
+        self.installed_module = module.__name__
         for a in dir(self):
             if callable(getattr(self, a)) and hasattr(getattr(self, a), "_is_knobkraft"):
                 # this was helpful: http://stupidpythonideas.blogspot.com/2013/06/how-methods-work.html
@@ -498,6 +507,12 @@ class GenericRolandWithBackwardCompatibility:
             return model.calculateFingerprint(message)
         raise Exception("Can't fingerprint data that is not of one of the defined Roland Synths")
 
+    def fingerprint_payload(self, message) -> List[int]:
+        model = self.model_from_message(message)
+        if model is not None:
+            return model.fingerprint_payload(message)
+        raise Exception("Can't fingerprint data that is not of one of the defined Roland Synths")
+
     @knobkraft_api
     def storedTags(self, message) -> List[str]:
         model = self.model_from_message(message)
@@ -508,6 +523,7 @@ class GenericRolandWithBackwardCompatibility:
     def install(self, module):
         # This is required because the original KnobKraft modules are not objects, but rather a module namespace with
         # methods declared. Expose our objects methods in the top level module namespace so the C++ code finds it
+        self.installed_module = module.__name__
         for a in dir(self):
             if callable(getattr(self, a)) and hasattr(getattr(self, a), "_is_knobkraft"):
                 # this was helpful: http://stupidpythonideas.blogspot.com/2013/06/how-methods-work.html
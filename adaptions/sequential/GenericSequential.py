@@ -94,6 +94,9 @@ class GenericSequential:
             return message[2]
         return -1
 
+    def identityReplySignature(self):
+        return [[0x01, device_id] for device_id in self.__id_list]
+
     def createEditBufferRequest(self, channel):
         if self.__file_version is None:
             # Modern style
@@ -173,13 +176,16 @@ class GenericSequential:
         raise Exception("Program error - friendlyBankName not defined but code reached in GenericSequential module!")
 
     def calculateFingerprint(self, message):
+        return hashlib.md5(bytearray(self.fingerprint_payload(message))).hexdigest()  # Calculate the fingerprint from the cleaned payload data
+
+    def fingerprint_payload(self, message):
         raw = self.getDataBlock(message)
         data = self.unescapeSysex(raw)
         # Blank out all blank out zones, normally this is the name (or layer names)
         if self._blank_out_zones is not None:
             for zone in self._blank_out_zones:
                 data[zone[0]:zone[0] + zone[1]] = [0] * zone[1]
-        return hashlib.md5(bytearray(data)).hexdigest()  # Calculate the fingerprint from the cleaned payload data
+        return data
 
     def renamePatch(self, message, new_name):
         header_len = self.headerLen(message)
@@ -210,6 +216,10 @@ class GenericSequential:
             data[self.__layer_name_index[layerNo][0] + i] = ord(new_name[i]) if i < len(new_name) else ord(' ')
         return messages[:header_len] + self.escapeSysex(data) + [0xf7]
 
+    def parameterArrayFromDump(self, message):
+        # The decoded patch data is the parameter array, indexed by the parameter numbers of the manual's sysex tables
+        return self.unescapeSysex(self.getDataBlock(message))
+
     def getDataBlock(self, message):
         return message[self.headerLen(message):-1]
 
@@ -257,11 +267,13 @@ class GenericSequential:
         # This is required because the original KnobKraft modules are not objects, but rather a module namespace with
         # methods declared. Expose our objects methods in the top level module namespace so the C++ code finds it
         # TODO Make this a loop
+        self.installed_module = module.__name__
         setattr(module, 'name', self.name)
         setattr(module, 'createDeviceDetectMessage', self.createDeviceDetectMessage)
         setattr(module, 'deviceDetectWaitMilliseconds', self.deviceDetectWaitMilliseconds)
         setattr(module, 'needsChannelSpecificDetection', self.needsChannelSpecificDetection)
         setattr(module, 'channelIfValidDeviceResponse', self.channelIfValidDeviceResponse)
+        setattr(module, 'identityReplySignature', self.identityReplySignature)
         setattr(module, 'createEditBufferRequest', self.createEditBufferRequest)
         setattr(module, 'isEditBufferDump', self.isEditBufferDump)
         setattr(module, 'numberOfBanks', self.numberOfBanks)
@@ -274,6 +286,7 @@ class GenericSequential:
         setattr(module, 'convertToEditBuffer', self.convertToEditBuffer)
         setattr(module, 'convertToProgramDump', self.convertToProgramDump)
         setattr(module, 'calculateFingerprint', self.calculateFingerprint)
+        setattr(module, 'parameterArrayFromDump', self.parameterArrayFromDump)
         if self.__name_len is not None and self.__name_position is not None:
             setattr(module, 'renamePatch', self.renamePatch)
         if self.friendly_bank_name is not None:
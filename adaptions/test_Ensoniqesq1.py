@@ -0,0 +1,43 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+import knobkraft
+
+
+def test_nibble_roundtrip(adaptation):
+    if adaptation.name() == "Ensoniq ESQ-1":
+        data = bytes(range(256))
+        nibbled = adaptation.nibble(data)
+        assert len(nibbled) == 512
+        assert all(x < 0x10 for x in nibbled)
+        # Low nibble first
+        assert list(nibbled[2:4]) == [0x01, 0x00]
+        assert list(nibbled[0x5a * 2:0x5a * 2 + 2]) == [0x0a, 0x05]
+        assert adaptation.denibble(nibbled) == data
+        assert adaptation.denibble(adaptation.nibble(b"RADZIC")) == b"RADZIC"
+
+
+def test_multi_bank_archive(adaptation):
+    if adaptation.name() == "Ensoniq ESQ-1":
+        # A single program dump followed by two all-program dumps of 40 programs each
+        messages = knobkraft.load_sysex("testData/ESQ1-archive.syx")
+        assert [adaptation.isPartOfBankDump(m) for m in messages] == [False, True, True]
+        records = list(adaptation.programRecordsInFile(messages))
+        assert len(records) == 81
+        assert all(len(record) == 204 for record in records)
+        assert list(adaptation.programRecords(messages[1])) == records[1:41]
+
+        patches = []
+        for bank in messages[1:]:
+            patches.extend(knobkraft.splitSysexMessage(adaptation.extractPatchesFromBank(bank)))
+        assert len(patches) == 80
+        assert all(adaptation.isSingleProgramDump(p) for p in patches)
+        assert adaptation.nameFromDump(patches[0]) == "B1P01 "
+        assert adaptation.nameFromDump(patches[79]) == "B2P40 "
+        assert [bytes(p[5:-1]) for p in patches] == [bytes(r) for r in records[1:]]
+
+        # The names are not part of the sound data
+        assert adaptation.soundDataFingerprint(messages) == adaptation.soundDataFingerprint(messages[:1] + patches)
+        assert adaptation.soundDataFingerprint(messages) != adaptation.soundDataFingerprint(messages[:1])
@@ -6,6 +6,7 @@
 
 import pytest
 import knobkraft
+from knobkraft.test_helper import TestData
 
 import functools
 
@@ -24,31 +25,6 @@ def skip_targets(param_not_none):
     return decorator
 
 
-#
-# Fixtures prepare the test data for the tests below
-#
-class TestData:
-    def __init__(self, adaptation):
-        self.test_dict = adaptation.test_data()
-        self.all_messages = []
-        if "sysex" in self.test_dict:
-            self.sysex_file = self.test_dict["sysex"]
-            self.all_messages = knobkraft.load_sysex(self.sysex_file)
-        if "program_generator" in self.test_dict:
-            self.programs = list(self.test_dict["program_generator"](self.all_messages))
-            self.program_dump = self.programs[0]["message"]
-        if "detection_reply" in self.test_dict:
-            self.detection_reply = self.test_dict["detection_reply"]
-
-
-@pytest.fixture
-def test_data(adaptation):
-    if hasattr(adaptation, "test_data"):
-        return TestData(adaptation)
-    else:
-        return None
-
-
 #
 # These are generic tests every adaptation must pass
 #
@@ -172,6 +148,41 @@ def test_fingerprinting(adaptation, test_data: TestData):
                 assert adaptation.calculateFingerprint(renamed) == md5
 
 
+@skip_targets("test_data")
+def test_bank_dump_progress(adaptation, test_data: TestData):
+    if hasattr(adaptation, "bankDumpProgress") and hasattr(adaptation, "isBankDumpFinished"):
+        # Feeding the messages one by one must come to the same result as looking at all messages at once
+        state = None
+        for i in range(len(test_data.all_messages)):
+            state, finished = adaptation.bankDumpProgress(state, test_data.all_messages[i])
+            assert finished == adaptation.isBankDumpFinished(test_data.all_messages[:i + 1])
+
+
+@skip_targets("test_data")
+def test_parameter_array(adaptation, test_data: TestData):
+    if hasattr(adaptation, "parameterArrayFromDump"):
+        for program in test_data.programs:
+            parameters = adaptation.parameterArrayFromDump(program["message"])
+            assert len(parameters) > 0
+            assert all(isinstance(p, int) and 0 <= p < 256 for p in parameters)
+
+
+def test_identity_reply_signature(adaptation):
+    if hasattr(adaptation, "identityReplySignature"):
+        # Each declared signature must be accepted by the hand written detection, on a specific channel or omni
+        for signature in adaptation.identityReplySignature():
+            replies = [[0xf0, 0x7e, channel, 0x06, 0x02] + signature for channel in [0x00, 0x7f]]
+            replies = [reply + [0x00] * (14 - len(reply)) + [0xf7] for reply in replies]
+            assert any(0 <= adaptation.channelIfValidDeviceResponse(reply) < 16 for reply in replies)
+
+
+def test_midi_pacing(adaptation):
+    for function in ["generalMessageDelay", "wireBytesPerSecond", "receiveBufferSize"]:
+        if hasattr(adaptation, function):
+            value = getattr(adaptation, function)()
+            assert isinstance(value, int) and value >= 0
+
+
 @skip_targets("test_data")
 def test_device_detection(adaptation, test_data: TestData):
     if "device_detect_call" in test_data.test_dict:
@@ -1,6 +1,8 @@
 from mdutils.mdutils import MdUtils
 import pytest
 
+from knobkraft import capability_groups
+
 color_wheel = [
     # "#260",
     "#800",
@@ -114,11 +116,11 @@ def test_implementation_status(adaptation, md_file):
               check(adaptation, "channelIfValidDeviceResponse"),
               check(adaptation, "needsChannelSpecificDetection"),
               check(adaptation, "deviceDetectWaitMilliseconds"),
-              capability_check(adaptation, ["createEditBufferRequest", "isEditBufferDump", "convertToEditBuffer"]),
+              capability_check(adaptation, capability_groups["Edit Buffer Capability"]),
               check(adaptation, "isPartOfEditBufferDump"),
-              capability_check(adaptation, ["createProgramDumpRequest", "isSingleProgramDump", "convertToProgramDump"]),
+              capability_check(adaptation, capability_groups["Program Dump Capability"]),
               check(adaptation, "isPartOfSingleProgramDump"),
-              capability_check(adaptation, ["createBankDumpRequest", "isPartOfBankDump", "isBankDumpFinished", "extractPatchesFromBank"]),
+              capability_check(adaptation, capability_groups["Bank Dump Capability"]),
               check(adaptation, "numberFromDump"),
               check(adaptation, "nameFromDump"),
               check(adaptation, "generalMessageDelay"),
@@ -127,7 +129,7 @@ def test_implementation_status(adaptation, md_file):
               check(adaptation, "calculateFingerprint"),
               check(adaptation, "friendlyBankName"),
               check(adaptation, "friendlyProgramName"),
-              capability_check(adaptation, ["numberOfLayers", "layerName"]),
+              capability_check(adaptation, capability_groups["Layer Capability"]),
               check(adaptation, "setLayerName"),
               check(adaptation, "setupHelp"),
               ]
@@ -0,0 +1,182 @@
+#
+#   Copyright (c) 2022 Christof Ruch. All rights reserved.
+#
+#   Dual licensed: Distributed under Affero GPL license by default, an MIT license is available for purchase
+#
+
+import gc
+import json
+import os
+import time
+
+import pytest
+
+from knobkraft.test_helper import TestData
+from knobkraft.corpus import scaling_benchmark, scaling_exponent, seed_programs
+from knobkraft.memory_profile import AllocationProfile, profile_calls, profile_corpus_scaling
+
+#
+# Performance regression gate. For every adaptation with test data, the functions of the adaptation are timed over its
+# test corpus and compared to the checked-in baseline in testData/performance_baseline.json. Timings are stored in
+# units of a calibration loop instead of seconds, so a baseline recorded on one machine can be checked on another.
+#
+# After an intended change, record a new baseline with
+#
+#     python -m pytest --all test_performance.py --update-performance-baseline
+#
+# The test corpora are too small to show quadratic behaviour. To check that the adaptations scale linearly on synthetic
+# corpora of up to 100000 patches, run
+#
+#     python -m pytest --all test_performance.py --scaling-corpus-size 100000
+#
+# With --profile-allocations, the peak and net allocations of each call are reported with tracemalloc, and functions
+# whose peak allocation grows superlinearly with their input fail. Combined with --scaling-corpus-size, this includes
+# splitting synthetic corpora into patches.
+#
+
+baseline_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "testData", "performance_baseline.json")
+default_tolerance = 2.5
+# Below this many calibration units a timing is mostly noise, so such functions are never reported
+noise_floor = 0.05
+repeats = 5
+# A log-log slope above this between a corpus and one ten times its size fails the scaling test, 2 would be quadratic
+maximum_scaling_exponent = 1.5
+
+timed_program_functions = ["nameFromDump", "calculateFingerprint", "isSingleProgramDump", "isEditBufferDump", "numberFromDump",
+                           "parameterArrayFromDump"]
+
+
+def calibration_workload():
+    # Typical adaptation work: slicing, masking, checksums and turning bytes into a name
+    data = [(i * 7) & 0x7f for i in range(4096)]
+    checksum = 0
+    name = ""
+    for i in range(0, len(data), 128):
+        block = data[i:i + 128]
+        checksum = (checksum + sum(block)) & 0x7f
+        name = ''.join([chr(x if 32 <= x < 127 else 32) for x in block[:16]])
+    return checksum, name
+
+
+def best_time(work, repeat=repeats) -> float:
+    # Like timeit, switch off the garbage collector so a collection of garbage from other tests is not counted
+    result = None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            work()
+            elapsed = time.perf_counter() - start
+            result = elapsed if result is None else min(result, elapsed)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return result
+
+
+def workloads(adaptation, test_data: TestData):
+    # The test data is shared with the generic tests, so work on copies in case a function modifies its input
+    result = {}
+    if "program_generator" in test_data.test_dict:
+        all_messages = [list(message) for message in test_data.all_messages]
+        result["program_generator"] = lambda: list(test_data.test_dict["program_generator"](all_messages))
+    programs = [list(program["message"]) for program in getattr(test_data, "programs", [])]
+    if programs:
+        for function_name in timed_program_functions:
+            if hasattr(adaptation, function_name):
+                function = getattr(adaptation, function_name)
+                result[function_name] = lambda function=function: [function(program) for program in programs]
+        if hasattr(adaptation, "renamePatch"):
+            result["renamePatch"] = lambda: [adaptation.renamePatch(program, "new name") for program in programs]
+    return result
+
+
+def regressions(budget, timings, tolerance):
+    report = []
+    for function_name, measured in sorted(timings.items()):
+        if function_name in budget:
+            allowed = max(budget[function_name] * tolerance, noise_floor)
+            if measured > allowed:
+                report.append(f"{function_name}: {measured:.3f} units, baseline {budget[function_name]:.3f}, budget {allowed:.3f} "
+                              f"({measured / budget[function_name]:.1f}x slower)")
+    return report
+
+
+def load_baseline():
+    if os.path.isfile(baseline_file):
+        with open(baseline_file, "r") as f:
+            return json.load(f)
+    return {"tolerance": default_tolerance, "adaptations": {}}
+
+
+def save_baseline(measured):
+    # Merge with what is on disk, so recording a subset of the adaptations keeps the others
+    baseline = load_baseline()
+    for adaptation_name, timings in measured.items():
+        baseline["adaptations"][adaptation_name] = {name: float(f"{value:.4g}") for name, value in sorted(timings.items())}
+    baseline["adaptations"] = dict(sorted(baseline["adaptations"].items()))
+    with open(baseline_file, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+@pytest.fixture(scope="session")
+def calibration():
+    return best_time(calibration_workload, repeat=20)
+
+
+@pytest.fixture(scope="session")
+def performance_baseline(request):
+    measured = {}
+    yield load_baseline(), measured
+    if request.config.getoption("update_performance_baseline") and measured:
+        save_baseline(measured)
+
+
+def test_performance_budget(adaptation, test_data: TestData, calibration, performance_baseline, request):
+    if test_data is None:
+        pytest.skip("test_data is None, skipping")
+    baseline, measured = performance_baseline
+    timings = {function_name: best_time(work) / calibration for function_name, work in workloads(adaptation, test_data).items()}
+    measured[adaptation.__name__] = timings
+    if request.config.getoption("update_performance_baseline"):
+        return
+    budget = baseline["adaptations"].get(adaptation.__name__)
+    if budget is None:
+        pytest.skip(f"No performance baseline for {adaptation.__name__}, record one with --update-performance-baseline")
+    tolerance = request.config.getoption("performance_tolerance") or baseline.get("tolerance", default_tolerance)
+    report = regressions(budget, timings, tolerance)
+    assert not report, f"{adaptation.__name__} is slower than its performance budget (tolerance {tolerance}x):\n" + "\n".join(report)
+
+
+def test_scaling(adaptation, test_data: TestData, request):
+    size = request.config.getoption("scaling_corpus_size")
+    if size <= 0:
+        pytest.skip("Scaling check not requested, use --scaling-corpus-size")
+    if test_data is None or not seed_programs(adaptation):
+        pytest.skip("No test programs to synthesize a corpus from")
+    sizes = [size // 10, size]
+    timings = scaling_benchmark(adaptation, sizes)
+    exponents = {step: scaling_exponent(sizes, seconds) for step, seconds in timings.items()}
+    # Steps that are too fast to measure at the smaller size give no meaningful exponent
+    report = [f"{step}: exponent {exponent:.2f}, {timings[step][0] * 1000:.0f} ms for {sizes[0]} and {timings[step][1] * 1000:.0f} ms for {sizes[1]} patches"
+              for step, exponent in sorted(exponents.items()) if timings[step][0] > 0.01 and exponent > maximum_scaling_exponent]
+    assert not report, f"{adaptation.__name__} does not scale linearly:\n" + "\n".join(report)
+
+
+def test_allocations(adaptation, test_data: TestData, request, capsys):
+    if not request.config.getoption("profile_allocations"):
+        pytest.skip("Allocation profile not requested, use --profile-allocations")
+    if test_data is None:
+        pytest.skip("test_data is None, skipping")
+    profile = AllocationProfile()
+    programs = [list(program["message"]) for program in getattr(test_data, "programs", [])]
+    profile_calls(profile, adaptation, adaptation.__name__, programs, [list(message) for message in test_data.all_messages])
+    size = request.config.getoption("scaling_corpus_size")
+    if size > 0:
+        profile_corpus_scaling(profile, adaptation, adaptation.__name__, [size // 10, size])
+    with capsys.disabled():
+        print("\n" + "\n".join(profile.report()))
+    superlinear = profile.superlinear()
+    assert not superlinear, "\n".join(superlinear)